@@ -1,9 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import MAX_CONTENT_LENGTH
-from .models_loader import load_models
+from .models_loader import model_registry
+from .utils.prediction_cache import prediction_cache
 from .routes.predict import init_routes as init_predict_routes
 from .routes.retrain import init_retrain_route
+from .routes.models import init_models_routes
+from .routes.health import init_health_routes
+from .routes.metrics import init_metrics_routes
 
 def create_app():
     app = FastAPI(title="ClassifierApp API", version="1.0.0")
@@ -17,9 +21,17 @@ def create_app():
         allow_headers=["*"],
     )
 
-    especies, formas, plantas = load_models()
+    # Las predicciones cacheadas dejan de valer cuando cambia un modelo, también si el
+    # cambio lo detecta este worker al ver el archivo reemplazado por otro
+    model_registry.add_listener(lambda entry: prediction_cache.invalidate())
 
-    app.include_router(init_predict_routes(especies, formas, plantas))
+    # Los modelos se cargan en segundo plano; /ready indica cuándo se puede servir
+    model_registry.start()
+
+    app.include_router(init_predict_routes(model_registry))
     app.include_router(init_retrain_route())
+    app.include_router(init_models_routes())
+    app.include_router(init_health_routes(model_registry))
+    app.include_router(init_metrics_routes())
 
     return app
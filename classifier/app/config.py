@@ -1,7 +1,12 @@
 import os
-import tensorflow as tf
+import time
 from pathlib import Path
 
+# Medir el costo de importar TensorFlow para el desglose de tiempos de arranque
+STARTUP_STARTED = time.perf_counter()
+import tensorflow as tf
+TF_IMPORT_SECONDS = time.perf_counter() - STARTUP_STARTED
+
 # Cargar variables de entorno desde .env si existe
 try:
     from dotenv import load_dotenv
@@ -36,13 +41,58 @@ MODEL_DIR = os.path.join(BASE_DIR, '..', 'models')
 DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
 LOG_DIR = os.path.join(BASE_DIR, '..', 'logs')
 BACKUP_DIR = os.path.join(BASE_DIR, '..', 'backups')
-MAX_BACKUPS = 3
+LABELS_DIR = os.path.join(BASE_DIR, '..', 'labels')  # Etiquetas por versión de modelo (<modelo>/<versión>.json)
+CHECKPOINT_DIR = os.path.join(BASE_DIR, '..', 'checkpoints')  # Checkpoints por época para reanudar reentrenamientos
+MAX_BACKUPS = 3  # Versiones por modelo en el almacén de artefactos (BACKUP_DIR)
+# Versiones anteriores de cada modelo que se mantienen cargadas para un rollback instantáneo
+MODEL_ROLLBACK_KEEP = int(os.getenv('MODEL_ROLLBACK_KEEP', '1'))
 
 MAX_CONTENT_LENGTH = 20 * 1024 * 1024
 HOST = '0.0.0.0'
 PORT = 8000
 DEBUG = True
 
+# Micro-batching de predicciones: las solicitudes concurrentes a /predict se agrupan
+# en un lote de hasta PREDICT_MAX_BATCH_SIZE imágenes, esperando como máximo PREDICT_MAX_WAIT_MS
+PREDICT_MAX_BATCH_SIZE = int(os.getenv('PREDICT_MAX_BATCH_SIZE', '16'))
+PREDICT_MAX_WAIT_MS = float(os.getenv('PREDICT_MAX_WAIT_MS', '10'))
+# Lotes que pueden estar en ejecución a la vez (permite solapar modelos entre lotes)
+PREDICT_MAX_INFLIGHT_BATCHES = int(os.getenv('PREDICT_MAX_INFLIGHT_BATCHES', '3'))
+
+# Tamaño de bloque de inferencia para /predict/batch
+PREDICT_BULK_CHUNK_SIZE = int(os.getenv('PREDICT_BULK_CHUNK_SIZE', '32'))
+
+# Cache de predicciones por hash de imagen + versión de modelos
+# PREDICTION_CACHE_SIZE=0 lo deshabilita; PREDICTION_CACHE_DIR habilita el nivel en disco
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '2048'))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+PREDICTION_CACHE_DIR = os.getenv('PREDICTION_CACHE_DIR') or None
+
+# Backend de inferencia: 'keras' (modelos .h5) o 'tflite' (modelos cuantizados exportados
+# con `python -m app.utils.tflite_export`); TFLITE_QUANTIZATION elige 'float16' o 'int8'
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+TFLITE_QUANTIZATION = os.getenv('TFLITE_QUANTIZATION', 'float16')
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', '2'))
+# Tamaños de lote de los intérpretes TFLite: cada lote se rellena hasta el siguiente tamaño y
+# cada tamaño tiene sus propios intérpretes, reservados una sola vez (sin allocate_tensors por lote)
+TFLITE_BATCH_BUCKETS = tuple(int(size) for size in os.getenv('TFLITE_BATCH_BUCKETS', '1,4,8,16,32').split(','))
+TFLITE_CALIBRATION_SAMPLES = int(os.getenv('TFLITE_CALIBRATION_SAMPLES', '200'))
+
+# Carga de modelos al arranque: 'eager' carga y precalienta en paralelo en segundo plano
+# (/ready responde 503 hasta terminar); 'lazy' carga cada modelo en su primer uso
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'eager')
+MODEL_LOAD_WORKERS = int(os.getenv('MODEL_LOAD_WORKERS', '3'))
+# Cada cuántos segundos cada worker revisa si el archivo de un modelo cambió en disco (lo
+# reentrenó o revirtió otro worker) para recargarlo; 0 lo deshabilita
+MODEL_SYNC_INTERVAL = float(os.getenv('MODEL_SYNC_INTERVAL', '5'))
+
+# Pool de inferencia: hilos para preprocesamiento y forward passes fuera del event loop
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '4'))
+# Ejecuciones simultáneas permitidas por modelo (réplicas)
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', '1'))
+
+# Etiquetas iniciales: solo se usan para versiones de modelo que no tienen archivo en
+# LABELS_DIR; las de cada modelo entrenado se guardan en el registro de etiquetas
 PLANTS = [
     False, True
     ]
@@ -64,6 +114,63 @@ SPECIES = [
     'zea-mays_healthy'
 ]
 
+# Trabajos de reentrenamiento: 'global' limita los trabajos simultáneos en total a
+# TRAINING_MAX_JOBS; 'per_model' permite uno por modelo a la vez
+TRAINING_CONCURRENCY = os.getenv('TRAINING_CONCURRENCY', 'global')
+TRAINING_MAX_JOBS = int(os.getenv('TRAINING_MAX_JOBS', '1'))
+# Locks (flock) que aplican ese límite entre procesos, p. ej. los workers de gunicorn
+TRAINING_LOCK_DIR = os.getenv('TRAINING_LOCK_DIR', os.path.join(BASE_DIR, '..', 'cache', 'training_locks'))
+# Registro de trabajos (SQLite) compartido por los workers: consultar, agrupar y cancelar
+# trabajos funciona desde cualquier proceso
+TRAINING_JOBS_DB = os.getenv('TRAINING_JOBS_DB', os.path.join(BASE_DIR, '..', 'cache', 'training_jobs.sqlite3'))
+
+# Aislamiento del reentrenamiento: 'process' lo ejecuta en un proceso aparte (python -m
+# app.training_worker) con su propio presupuesto de hilos, prioridad y límite de memoria, de
+# modo que un fallo u OOM no afecte a /predict; 'thread' lo ejecuta dentro del proceso de la API
+TRAINING_ISOLATION = os.getenv('TRAINING_ISOLATION', 'process')
+TRAINING_CPU_THREADS = int(os.getenv('TRAINING_CPU_THREADS', str(max(1, (os.cpu_count() or 2) // 2))))
+TRAINING_MEMORY_LIMIT_MB = int(os.getenv('TRAINING_MEMORY_LIMIT_MB', '0'))  # Límite de espacio de direcciones, 0 = sin límite
+TRAINING_NICE = int(os.getenv('TRAINING_NICE', '10'))  # Menor prioridad de CPU que el proceso que sirve predicciones
+
+# Pipeline de entrada para reentrenamiento: 'mmap' (cache persistente de imágenes ya
+# decodificadas, solo se decodifica lo nuevo), 'tfdata' (decodificación paralela con tf.data)
+# o 'generator' (ImageDataGenerator anterior, para comparar)
+TRAIN_INPUT_PIPELINE = os.getenv('TRAIN_INPUT_PIPELINE', 'mmap')
+DATASET_CACHE_DIR = os.getenv('DATASET_CACHE_DIR', os.path.join(BASE_DIR, '..', 'cache', 'datasets'))
+DATASET_CACHE_WORKERS = int(os.getenv('DATASET_CACHE_WORKERS', '8'))
+# Catálogo SQLite de las imágenes de DATA_DIR: clases, conteos y división entrenamiento/validación
+# se consultan en el índice en lugar de recorrer los directorios
+DATASET_CATALOG_PATH = os.getenv('DATASET_CATALOG_PATH', os.path.join(BASE_DIR, '..', 'cache', 'catalog.sqlite3'))
+# Casi duplicados (pHash de 64 bits a distancia de Hamming <= DEDUP_MAX_DISTANCE dentro de una clase),
+# detectados al ingresar imágenes descargadas: 'report' solo los lista en el log, 'exclude' además
+# los marca en el catálogo y no se usan para entrenar, 'quarantine' además los mueve a
+# DATA_DIR/<modelo>/quarantine/<clase>, 'off' desactiva la detección
+DEDUP_MODE = os.getenv('DEDUP_MODE', 'report')
+DEDUP_MAX_DISTANCE = int(os.getenv('DEDUP_MAX_DISTANCE', '4'))
+
+# Épocas máximas del reentrenamiento completo; el early stopping lo detiene antes cuando la
+# pérdida de validación no mejora al menos EARLY_STOPPING_MIN_DELTA en EARLY_STOPPING_PATIENCE épocas
+TRAINING_MAX_EPOCHS = int(os.getenv('TRAINING_MAX_EPOCHS', '20'))
+EARLY_STOPPING_PATIENCE = int(os.getenv('EARLY_STOPPING_PATIENCE', '2'))
+EARLY_STOPPING_MIN_DELTA = float(os.getenv('EARLY_STOPPING_MIN_DELTA', '0.001'))
+
+# Batch size de entrenamiento: 'auto' lo mide con pasos de prueba crecientes (hasta OOM o hasta
+# que el throughput deja de mejorar) y cachea el resultado por modelo, dispositivo y tamaño de
+# entrada; un número fija el tamaño
+TRAIN_BATCH_SIZE = os.getenv('TRAIN_BATCH_SIZE', 'auto')
+BATCH_AUTOTUNE_CACHE = os.getenv('BATCH_AUTOTUNE_CACHE', os.path.join(BASE_DIR, '..', 'cache', 'batch_sizes.json'))
+BATCH_AUTOTUNE_MAX_GPU = int(os.getenv('BATCH_AUTOTUNE_MAX_GPU', '512'))
+BATCH_AUTOTUNE_MAX_CPU = int(os.getenv('BATCH_AUTOTUNE_MAX_CPU', '256'))
+
+# Reentrenamiento rápido (mode=fast): solo la capa de salida sobre embeddings cacheados
+FAST_RETRAIN_EPOCHS = int(os.getenv('FAST_RETRAIN_EPOCHS', '30'))
+FAST_RETRAIN_LEARNING_RATE = float(os.getenv('FAST_RETRAIN_LEARNING_RATE', '1e-3'))
+FAST_RETRAIN_BATCH_SIZE = int(os.getenv('FAST_RETRAIN_BATCH_SIZE', '256'))
+# Cache de tf.data: '' sin cache, 'memory' o una ruta de archivo para cachear en disco
+TRAIN_DATA_CACHE = os.getenv('TRAIN_DATA_CACHE', '')
+TRAIN_SHUFFLE_BUFFER = int(os.getenv('TRAIN_SHUFFLE_BUFFER', '2048'))
+TRAIN_SPLIT_SEED = int(os.getenv('TRAIN_SPLIT_SEED', '123'))
+
 # Configuración de Cloudflare R2 para descarga de imágenes
 # Estas credenciales se pueden obtener desde el dashboard de Cloudflare R2
 # Soporta tanto R2_* como CLOUDFLARE_R2_* para compatibilidad
@@ -73,3 +180,27 @@ CLOUDFLARE_R2_ACCESS_KEY_ID = os.getenv('R2_ACCESS_KEY_ID') or os.getenv('CLOUDF
 CLOUDFLARE_R2_SECRET_ACCESS_KEY = os.getenv('R2_SECRET_ACCESS_KEY') or os.getenv('CLOUDFLARE_R2_SECRET_ACCESS_KEY')
 CLOUDFLARE_R2_PREFIX = os.getenv('R2_PREFIX') or os.getenv('CLOUDFLARE_R2_PREFIX', '')  # Prefijo opcional para filtrar archivos
 R2_PUBLIC_BASE_URL = os.getenv('R2_PUBLIC_BASE_URL', None)  # URL pública del bucket (opcional)
+
+# Descargas concurrentes desde R2: hilos de descarga (comparten un único cliente con un
+# pool de conexiones del mismo tamaño) y reintentos por objeto con backoff exponencial
+R2_DOWNLOAD_WORKERS = int(os.getenv('R2_DOWNLOAD_WORKERS', '16'))
+R2_DOWNLOAD_RETRIES = int(os.getenv('R2_DOWNLOAD_RETRIES', '4'))
+R2_RETRY_BACKOFF = float(os.getenv('R2_RETRY_BACKOFF', '0.5'))  # segundos, se duplica en cada intento
+
+# Sincronización incremental con R2 mediante un manifest local (clave, ETag, tamaño, LastModified):
+# 'diff' lista el bucket y descarga solo lo nuevo o modificado respecto al manifest,
+# 'incremental' lista solo las claves posteriores a la última vista (requiere claves crecientes),
+# 'full' ignora el manifest y lo reconstruye
+R2_SYNC_MODE = os.getenv('R2_SYNC_MODE', 'diff')
+R2_SYNC_DELETE = os.getenv('R2_SYNC_DELETE', 'false').lower() == 'true'  # Borrar archivos locales de objetos eliminados
+R2_MANIFEST_PATH = os.getenv('R2_MANIFEST_PATH', None)  # Por defecto DATA_DIR/especies/r2_manifest.json
+
+# Transcodificación al ingresar (opcional): con INGEST_SHORT_SIDE > 0 cada imagen descargada de R2
+# se guarda reducida a ese lado corto en px (JPEG/WebP con calidad INGEST_QUALITY) en lugar del
+# original a resolución completa; 0 (por defecto) guarda los originales sin cambios. Los originales
+# se mueven a INGEST_ORIGINALS_DIR (por ejemplo un disco frío) o, sin él, a DATA_DIR/<modelo>/originals;
+# solo se borran con INGEST_DISCARD_ORIGINALS=true
+INGEST_SHORT_SIDE = int(os.getenv('INGEST_SHORT_SIDE', '0'))
+INGEST_QUALITY = int(os.getenv('INGEST_QUALITY', '90'))
+INGEST_ORIGINALS_DIR = os.getenv('INGEST_ORIGINALS_DIR') or None
+INGEST_DISCARD_ORIGINALS = os.getenv('INGEST_DISCARD_ORIGINALS', 'false').lower() == 'true'
@@ -1,13 +1,500 @@
 import tensorflow as tf
+import hashlib
 import os
-from .config import MODEL_DIR
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .config import (
+    MODEL_DIR, INFERENCE_BACKEND, TFLITE_QUANTIZATION, TFLITE_NUM_THREADS, TFLITE_BATCH_BUCKETS, MODEL_CONCURRENCY,
+    MODEL_LOAD_MODE, MODEL_LOAD_WORKERS, MODEL_ROLLBACK_KEEP, MODEL_SYNC_INTERVAL, STARTUP_STARTED, TF_IMPORT_SECONDS
+)
+from .utils.locks import safe_predict
+from .utils.artifact_store import artifact_store
+from .utils.label_registry import label_registry
 
-def load_models():
-    print("Cargando modelos...")
-    # Cargar modelos de inferencia en CPU para evitar ocupar GPU
+# Archivo de pesos de cada modelo
+MODEL_FILES = {
+    'especies': 'modelo_especies.h5',
+    'hojas': 'modelo_hojas.h5',
+    'plantas': 'modelo_plantas.h5',
+}
+
+
+def get_model_version(path):
+    """
+    Calcula la versión de un modelo como el hash de contenido de su archivo.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def file_stat(path):
+    """(tamaño, mtime) del archivo: identifica barato si cambió desde que se cargó"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def tflite_path(name, quantization=TFLITE_QUANTIZATION, model_dir=MODEL_DIR):
+    """Ruta del modelo TFLite exportado, por ejemplo modelo_hojas.float16.tflite"""
+    stem = os.path.splitext(MODEL_FILES[name])[0]
+    return os.path.join(model_dir, f"{stem}.{quantization}.tflite")
+
+
+class TFLiteModel:
+    """
+    Modelo TFLite para inferencia en CPU.
+
+    Los intérpretes de TFLite no son thread-safe, por lo que se mantiene un pool de
+    MODEL_CONCURRENCY intérpretes y cada predicción toma uno en exclusiva. Para no
+    redimensionar y reservar tensores con cada tamaño de lote del micro-batcher, cada lote
+    se rellena hasta el siguiente tamaño de buckets y cada tamaño tiene su propio pool, con
+    la entrada redimensionada una sola vez al crearlo (los pools se crean en su primer uso).
+    """
+
+    def __init__(self, path, num_threads=TFLITE_NUM_THREADS, replicas=MODEL_CONCURRENCY, buckets=TFLITE_BATCH_BUCKETS):
+        self.path = path
+        self.num_threads = num_threads
+        self.replicas = max(1, replicas)
+        self.buckets = sorted({max(1, size) for size in buckets})
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        # El pool más pequeño se crea al cargar para validar el modelo
+        self._pool(self.buckets[0])
+
+    def _pool(self, batch_size):
+        with self._pools_lock:
+            pool = self._pools.get(batch_size)
+            if pool is None:
+                pool = queue.Queue()
+                for _ in range(self.replicas):
+                    interpreter = tf.lite.Interpreter(model_path=self.path, num_threads=self.num_threads)
+                    input_detail = interpreter.get_input_details()[0]
+                    if input_detail['shape'][0] != batch_size:
+                        interpreter.resize_tensor_input(
+                            input_detail['index'], [batch_size, *input_detail['shape'][1:]]
+                        )
+                    interpreter.allocate_tensors()
+                    pool.put(interpreter)
+                self._pools[batch_size] = pool
+        return pool
+
+    def predict(self, input_data):
+        """Retorna las probabilidades (batch, clases) como array de numpy"""
+        count = input_data.shape[0]
+        largest = self.buckets[-1]
+        if count > largest:
+            return np.concatenate([
+                self.predict(input_data[start:start + largest]) for start in range(0, count, largest)
+            ])
+        batch_size = next(size for size in self.buckets if size >= count)
+        if batch_size != count:
+            padded = np.zeros((batch_size, *input_data.shape[1:]), dtype=input_data.dtype)
+            padded[:count] = input_data
+            input_data = padded
+
+        pool = self._pool(batch_size)
+        interpreter = pool.get()
+        try:
+            input_detail = interpreter.get_input_details()[0]
+            # Modelos con entrada entera: cuantizar con los parámetros del tensor
+            if input_detail['dtype'] != np.float32:
+                scale, zero_point = input_detail['quantization']
+                input_data = np.round(input_data / scale + zero_point).astype(input_detail['dtype'])
+            interpreter.set_tensor(input_detail['index'], input_data)
+            interpreter.invoke()
+
+            output_detail = interpreter.get_output_details()[0]
+            output = interpreter.get_tensor(output_detail['index'])[:count]
+            if output_detail['dtype'] != np.float32:
+                scale, zero_point = output_detail['quantization']
+                output = (output.astype(np.float32) - zero_point) * scale
+            return np.array(output, copy=True)
+        finally:
+            pool.put(interpreter)
+
+
+def run_inference(model, input_data):
+    """
+    Ejecuta un modelo (Keras o TFLite) sobre un lote y retorna un array 2D (batch, clases).
+    """
+    if isinstance(model, TFLiteModel):
+        pred = model.predict(input_data)
+    else:
+        pred = safe_predict(model, input_data)
+        if isinstance(pred, list):
+            pred = pred[0]
+        pred = pred.numpy()
+    return pred.reshape(pred.shape[0], -1)
+
+
+def warm_up(model, input_shape=(1, 128, 128, 3)):
+    """Ejecuta una predicción sobre datos vacíos para trazar safe_predict antes de servir"""
     with tf.device('/CPU:0'):
-        especies = tf.keras.models.load_model(os.path.join(MODEL_DIR, "modelo_especies.h5"))
-        formas = tf.keras.models.load_model(os.path.join(MODEL_DIR, "modelo_hojas.h5"))
-        plantas = tf.keras.models.load_model(os.path.join(MODEL_DIR, "modelo_plantas.h5"))
-    print("Modelos cargados correctamente.")
-    return especies, formas, plantas
+        run_inference(model, np.zeros(input_shape, dtype=np.float32))
+
+
+class ModelEntry:
+    """Modelo cargado junto con su versión, sus etiquetas y metadatos"""
+
+    def __init__(self, name, model, version, path, load_seconds=None, warmup_seconds=None, artifact_version=None,
+                 labels=None, file_stat=None):
+        self.name = name
+        self.model = model
+        self.version = version
+        self.path = path
+        # Versión del .h5 en el ArtifactStore (con el backend TFLite difiere de version)
+        self.artifact_version = artifact_version or version
+        # Etiquetas de esta versión: viajan con los pesos en cada intercambio
+        self.labels = labels
+        # (tamaño, mtime) de path al cargarlo, para detectar cambios hechos por otro worker
+        self.file_stat = file_stat
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'artifact_version': self.artifact_version,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'classes': list(self.labels.names) if self.labels is not None else None,
+        }
+
+
+class ModelRegistry:
+    """
+    Registro versionado de los modelos en servicio.
+
+    Cada recarga carga y precalienta el nuevo modelo en segundo plano y luego lo
+    intercambia de forma atómica. Las predicciones toman un snapshot() al iniciar
+    cada lote, así que un lote en curso termina con los pesos con los que empezó
+    y ninguna solicitud se pierde durante el intercambio.
+
+    Las rollback_keep versiones anteriores de cada modelo se mantienen cargadas para que
+    rollback() sea un intercambio en memoria.
+
+    Con varios workers (gunicorn) solo el que ejecuta un reentrenamiento o un rollback
+    intercambia el modelo; los demás lo detectan en snapshot(), revisando cada
+    sync_interval segundos si el archivo en disco cambió, y lo recargan.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, model_files=MODEL_FILES, backend=INFERENCE_BACKEND,
+                 load_mode=MODEL_LOAD_MODE, load_workers=MODEL_LOAD_WORKERS,
+                 rollback_keep=MODEL_ROLLBACK_KEEP, store=artifact_store, labels=label_registry,
+                 sync_interval=MODEL_SYNC_INTERVAL):
+        self.model_dir = model_dir
+        self.model_files = dict(model_files)
+        self.backend = backend
+        self.load_mode = load_mode
+        self.load_workers = max(1, load_workers)
+        self.startup = {'mode': load_mode, 'tf_import_seconds': TF_IMPORT_SECONDS}
+        self._ready = threading.Event()
+        self._entries = {}
+        self.rollback_keep = max(0, rollback_keep)
+        self.store = store
+        self.labels = labels
+        self._previous = {name: [] for name in self.model_files}
+        self._lock = threading.Lock()
+        self._reload_locks = {name: threading.Lock() for name in self.model_files}
+        self._reloading = set()
+        self._last_errors = {}
+        self.sync_interval = sync_interval
+        self._last_sync = time.monotonic()
+        self._listeners = []
+
+    def model_path(self, name):
+        return os.path.join(self.model_dir, self.model_files[name])
+
+    def serving_path(self, name):
+        """Archivo que se sirve según el backend; si falta el TFLite se usa el .h5"""
+        if self.backend == 'tflite':
+            path = tflite_path(name, model_dir=self.model_dir)
+            if os.path.exists(path):
+                return path
+            print(f"⚠️  No existe {path}; sirviendo {name} con Keras. Ejecuta `python -m app.utils.tflite_export`")
+        return self.model_path(name)
+
+    def load_all(self, names=None):
+        """Carga y precalienta los modelos en paralelo"""
+        names = list(names or self.model_files)
+        print(f"Cargando modelos: {', '.join(names)}...")
+        with ThreadPoolExecutor(max_workers=self.load_workers, thread_name_prefix='model-load') as pool:
+            futures = [pool.submit(self.reload, name) for name in names]
+            for future in futures:
+                future.result()
+        print("Modelos cargados correctamente.")
+
+    def start(self):
+        """
+        Inicia la carga de modelos según MODEL_LOAD_MODE sin bloquear el arranque de la API.
+        En modo 'lazy' el servicio queda listo de inmediato y cada modelo se carga en su primer uso.
+        """
+        if self.load_mode == 'lazy':
+            print("Modo de carga lazy: los modelos se cargarán en su primer uso.")
+            self._ready.set()
+            return None
+        thread = threading.Thread(target=self._startup, name='model-startup', daemon=True)
+        thread.start()
+        return thread
+
+    def _startup(self):
+        started = time.perf_counter()
+        try:
+            self.load_all()
+        except Exception as e:
+            self.startup['error'] = str(e)
+            print(f"❌ Error cargando modelos al arranque: {e}")
+            return
+        self.startup['models_seconds'] = time.perf_counter() - started
+        self.startup['total_seconds'] = time.perf_counter() - STARTUP_STARTED
+        self._ready.set()
+
+        # Desglose de tiempos de arranque para seguir regresiones de cold start
+        parts = [f"import TF {TF_IMPORT_SECONDS:.2f}s"]
+        for name, entry in self.snapshot().items():
+            parts.append(f"{name} carga {entry.load_seconds:.2f}s + warm-up {entry.warmup_seconds:.2f}s")
+        parts.append(f"modelos (paralelo) {self.startup['models_seconds']:.2f}s")
+        parts.append(f"total {self.startup['total_seconds']:.2f}s")
+        print(f"⏱️  Arranque: {' | '.join(parts)}")
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def _load_entry(self, name, path, version):
+        """Carga y precalienta el modelo de path, con sus etiquetas, sin ponerlo en servicio"""
+        started = time.perf_counter()
+        stat = file_stat(path)
+        if path.endswith('.tflite'):
+            model = TFLiteModel(path)
+            h5_path = self.model_path(name)
+            artifact_version = get_model_version(h5_path) if os.path.exists(h5_path) else None
+        else:
+            # Cargar modelos de inferencia en CPU para evitar ocupar GPU
+            with tf.device('/CPU:0'):
+                model = tf.keras.models.load_model(path)
+            artifact_version = version
+        loaded = time.perf_counter()
+        warm_up(model)
+        warmed = time.perf_counter()
+        labels = self.labels.load(name, artifact_version)
+        return ModelEntry(name, model, version, path, loaded - started, warmed - loaded, artifact_version, labels, stat)
+
+    def add_listener(self, callback):
+        """Registra callback(entry), que se invoca cada vez que cambia la versión en servicio de un modelo"""
+        self._listeners.append(callback)
+
+    def _activate(self, entry):
+        """Pone entry en servicio y conserva la anterior para rollback; retorna la anterior"""
+        with self._lock:
+            previous = self._entries.get(entry.name)
+            self._entries[entry.name] = entry
+            history = [old for old in self._previous[entry.name] if old.version != entry.version]
+            if previous is not None and previous.version != entry.version:
+                history.insert(0, previous)
+            self._previous[entry.name] = history[:self.rollback_keep]
+        self._last_errors.pop(entry.name, None)
+        if previous is not None and previous.version != entry.version:
+            for callback in self._listeners:
+                callback(entry)
+        return previous
+
+    def reload(self, name):
+        """
+        Carga el modelo desde disco, lo precalienta y lo pone en servicio.
+        Lanza la excepción original si la carga falla; el modelo anterior sigue activo.
+
+        Returns:
+            ModelEntry: La nueva entrada activa
+        """
+        with self._reload_locks[name]:
+            path = self.serving_path(name)
+            try:
+                version = get_model_version(path)
+                current = self.get(name)
+                if current is not None and current.version == version:
+                    # Mismo contenido (p. ej. reescrito por un rollback): no volver a revisarlo
+                    current.file_stat = file_stat(path)
+                    print(f"Modelo {name} ya está en la versión {version}")
+                    return current
+                entry = self._load_entry(name, path, version)
+            except Exception as e:
+                self._last_errors[name] = str(e)
+                raise
+
+            previous = self._activate(entry)
+            if previous is not None:
+                print(f"✅ Modelo {name} actualizado en caliente: {previous.version} -> {version}")
+            return entry
+
+    def rollback(self, name, version=None):
+        """
+        Vuelve a una versión anterior de name. Si esa versión sigue cargada en memoria el
+        cambio es un intercambio atómico y el .h5 en disco se restaura después en segundo
+        plano; si no, se restaura desde el ArtifactStore y se carga.
+
+        Args:
+            version: Versión del .h5 (artifact_version) o None para la anterior a la activa
+
+        Returns:
+            dict: {'model', 'from_version', 'to_version', 'source': 'memory' | 'store', 'seconds'}
+        """
+        started = time.perf_counter()
+        with self._reload_locks[name]:
+            current = self.get(name)
+            current_artifact = current.artifact_version if current else None
+            with self._lock:
+                candidates = list(self._previous[name])
+            if version is None:
+                if candidates:
+                    version = candidates[0].artifact_version
+                else:
+                    stored = [entry['version'] for entry in self.store.versions(name)
+                              if entry['version'] != current_artifact]
+                    if not stored:
+                        raise KeyError(f"No hay una versión anterior de {name}")
+                    version = stored[-1]
+
+            target = next((entry for entry in candidates if entry.artifact_version.startswith(version)), None)
+            if target is not None:
+                self._activate(target)
+                source = 'memory'
+                threading.Thread(
+                    target=self._persist_rollback, args=(name, target.artifact_version),
+                    name=f"rollback-{name}", daemon=True
+                ).start()
+            else:
+                self.store.restore(name, version, self.model_path(name))
+                if self.backend == 'tflite':
+                    self._export_tflite(name)
+                path = self.serving_path(name)
+                try:
+                    target = self._load_entry(name, path, get_model_version(path))
+                except Exception as e:
+                    self._last_errors[name] = str(e)
+                    raise
+                self._activate(target)
+                source = 'store'
+
+        seconds = time.perf_counter() - started
+        print(f"⏪ Modelo {name} revertido: {current.version if current else None} -> {target.version} "
+              f"({source}, {seconds * 1000:.1f} ms)")
+        return {
+            'model': name,
+            'from_version': current_artifact,
+            'to_version': target.artifact_version,
+            'source': source,
+            'seconds': seconds,
+        }
+
+    def _persist_rollback(self, name, version):
+        """Restaura en disco la versión revertida para que un reinicio la siga sirviendo"""
+        try:
+            with self._reload_locks[name]:
+                self.store.restore(name, version, self.model_path(name))
+                if self.backend == 'tflite':
+                    self._export_tflite(name)
+        except Exception as e:
+            self._last_errors[name] = f"Rollback no persistido en disco: {e}"
+            print(f"❌ Error guardando en disco el rollback de {name}: {e}")
+
+    def _export_tflite(self, name):
+        # La versión restaurada ya se evaluó cuando se entrenó; no hace falta DATA_DIR
+        from .utils.tflite_export import export_model
+        export_model(name, (TFLITE_QUANTIZATION,), evaluate_accuracy=False)
+
+    def reload_async(self, name):
+        """Recarga el modelo en un hilo en segundo plano"""
+        def run():
+            try:
+                self.reload(name)
+            except Exception as e:
+                print(f"❌ Error recargando modelo {name}: {e}")
+            finally:
+                with self._lock:
+                    self._reloading.discard(name)
+
+        with self._lock:
+            self._reloading.add(name)
+        thread = threading.Thread(target=run, name=f"reload-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _sync_from_disk(self):
+        """
+        Recarga en segundo plano los modelos cuyo archivo cambió en disco desde que se
+        cargaron. Se revisa como mucho cada sync_interval segundos.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.sync_interval <= 0 or now - self._last_sync < self.sync_interval:
+                return
+            self._last_sync = now
+            entries = dict(self._entries)
+            reloading = set(self._reloading)
+        for name, entry in entries.items():
+            if name in reloading or entry.file_stat is None:
+                continue
+            try:
+                changed = file_stat(entry.path) != entry.file_stat
+            except OSError:
+                continue
+            if changed:
+                print(f"🔄 El archivo de {name} cambió en disco; recargando")
+                self.reload_async(name)
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def snapshot(self):
+        """
+        Retorna una copia consistente de {nombre: ModelEntry}.
+        En modo 'lazy' carga primero los modelos que aún no se han usado.
+        """
+        self._sync_from_disk()
+        with self._lock:
+            entries = dict(self._entries)
+        missing = [name for name in self.model_files if name not in entries]
+        if missing and self.load_mode == 'lazy':
+            self.load_all(missing)
+            with self._lock:
+                entries = dict(self._entries)
+        return entries
+
+    def versions(self):
+        with self._lock:
+            return {name: entry.version for name, entry in self._entries.items()}
+
+    def rollback_versions(self, name):
+        """Versiones anteriores de name: las cargadas en memoria y las del ArtifactStore"""
+        with self._lock:
+            loaded = {entry.artifact_version for entry in self._previous[name]}
+        return [
+            dict(entry, loaded=entry['version'] in loaded)
+            for entry in reversed(self.store.versions(name))
+        ]
+
+    def status(self):
+        with self._lock:
+            return {
+                name: {
+                    'backend': self.backend,
+                    **(self._entries[name].describe() if name in self._entries else {}),
+                    'reloading': name in self._reloading,
+                    'rollback_versions': [entry.artifact_version for entry in self._previous[name]],
+                    'last_error': self._last_errors.get(name),
+                }
+                for name in self.model_files
+            }
+
+
+model_registry = ModelRegistry()
@@ -2,9 +2,47 @@ import numpy as np
 from PIL import Image
 import io
 
-def preprocess_image(image_bytes, target_size=(128, 128)):
-    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+TARGET_SIZE = (128, 128)
+
+# Factor de normalización en float32 para evitar el paso intermedio por float64
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def decode_image(image_bytes, target_size=TARGET_SIZE):
+    """
+    Decodifica una imagen y la redimensiona a target_size manteniéndola en uint8.
+
+    Para JPEG usa draft(): el decodificador escala por DCT (1/2, 1/4 o 1/8) directamente
+    a un tamaño cercano (y nunca menor) al objetivo, evitando decodificar todos los
+    megapíxeles de las fotos de celular.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('RGB', target_size)
+    image = image.convert('RGB')
     image = image.resize(target_size)
-    image_array = np.array(image) / 255.0
-    image_array = np.expand_dims(image_array, axis=0)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def preprocess_into(image_bytes, out, target_size=TARGET_SIZE):
+    """
+    Preprocesa una imagen escribiendo el resultado normalizado en un buffer preasignado.
+
+    Args:
+        image_bytes: Bytes de la imagen
+        out: Array float32 de forma (alto, ancho, 3), por ejemplo una fila de un lote
+        target_size: Tamaño (ancho, alto) de entrada del modelo
+    """
+    pixels = decode_image(image_bytes, target_size)
+    np.multiply(pixels, _SCALE, out=out)
+    return out
+
+
+def allocate_batch(batch_size, target_size=TARGET_SIZE):
+    """Reserva un buffer float32 para un lote de batch_size imágenes"""
+    return np.empty((batch_size, target_size[1], target_size[0], 3), dtype=np.float32)
+
+
+def preprocess_image(image_bytes, target_size=TARGET_SIZE):
+    image_array = allocate_batch(1, target_size)
+    preprocess_into(image_bytes, image_array[0], target_size)
     return image_array
@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+
+def init_health_routes(registry):
+    bp = APIRouter(tags=["health"])
+
+    @bp.get("/health")
+    def health():
+        """Liveness: el proceso está arriba y responde"""
+        return {"status": "ok"}
+
+    @bp.get("/ready")
+    def ready():
+        """Readiness: 200 solo cuando los modelos están cargados y precalentados"""
+        body = {
+            "ready": registry.is_ready(),
+            "startup": registry.startup,
+            "models": registry.status()
+        }
+        return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+    return bp
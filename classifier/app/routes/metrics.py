@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..utils.metrics import metrics_registry
+
+
+def init_metrics_routes():
+    bp = APIRouter(tags=["metrics"])
+
+    @bp.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        """Métricas en formato de texto de Prometheus"""
+        return PlainTextResponse(
+            metrics_registry.render(),
+            media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    return bp
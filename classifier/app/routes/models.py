@@ -0,0 +1,55 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from ..models_loader import model_registry
+from ..utils.prediction_cache import prediction_cache
+
+
+def init_models_routes():
+    bp = APIRouter(prefix="/models", tags=["models"])
+
+    @bp.get("")
+    def list_models():
+        """Endpoint con la versión activa de cada modelo en servicio"""
+        return {"models": model_registry.status()}
+
+    @bp.post("/{name}/reload")
+    def reload_model(name: str):
+        """Recarga el modelo desde disco en segundo plano y lo intercambia al terminar"""
+        if name not in model_registry.model_files:
+            raise HTTPException(status_code=404, detail=f"Modelo desconocido: {name}")
+        model_registry.reload_async(name)
+        return {
+            "status": "Recarga iniciada",
+            "model": name,
+            "active_version": model_registry.versions().get(name)
+        }
+
+    @bp.get("/{name}/versions")
+    def list_versions(name: str):
+        """Endpoint con las versiones guardadas de un modelo (las más recientes primero)"""
+        if name not in model_registry.model_files:
+            raise HTTPException(status_code=404, detail=f"Modelo desconocido: {name}")
+        return {
+            "model": name,
+            "active_version": model_registry.versions().get(name),
+            "versions": model_registry.rollback_versions(name)
+        }
+
+    @bp.post("/{name}/rollback")
+    def rollback_model(
+        name: str,
+        version: Optional[str] = Query(None, description="Versión a restaurar; por defecto la anterior a la activa")
+    ):
+        """Vuelve a una versión anterior; si sigue cargada en memoria el cambio es inmediato"""
+        if name not in model_registry.model_files:
+            raise HTTPException(status_code=404, detail=f"Modelo desconocido: {name}")
+        try:
+            result = model_registry.rollback(name, version)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error revirtiendo {name}: {e}")
+        prediction_cache.invalidate()
+        return {"status": "Modelo revertido", **result}
+
+    return bp
@@ -1,86 +1,352 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+import asyncio
+import itertools
+import json
+import tarfile
+import time
+import zipfile
+from collections import namedtuple
 import numpy as np
 import tensorflow as tf
 import os
-from ..preprocess import preprocess_image
-from ..utils.locks import predict_lock, safe_predict
-from ..config import SPECIES, SHAPES, PLANTS
+from ..preprocess import preprocess_image, preprocess_into, allocate_batch
+from ..utils.locks import model_lock, inference_executor, run_in_inference_executor
+from ..models_loader import run_inference
+from ..utils.batcher import MicroBatcher
+from ..utils.prediction_cache import prediction_cache
+from ..utils.metrics import (
+    predict_requests, predict_errors, class_index_out_of_range, predict_stage_seconds, predict_batch_size
+)
+from ..config import (
+    PREDICT_MAX_BATCH_SIZE, PREDICT_MAX_WAIT_MS, PREDICT_MAX_INFLIGHT_BATCHES,
+    PREDICT_BULK_CHUNK_SIZE
+)
 
-def init_routes(especies, formas, plantas):
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+
+
+# Etiquetas y versiones del snapshot de modelos con el que se generó una fila de predicciones
+BatchSnapshot = namedtuple('BatchSnapshot', ['labels', 'versions'])
+
+
+def _model_result(model_name, pred, labels):
+    """Clase predicha, su etiqueta y las probabilidades por etiqueta de un modelo"""
+    idx = int(np.argmax(pred))
+    # Validar que el índice esté dentro del rango
+    if idx >= len(labels):
+        class_index_out_of_range.inc(model_name)
+        raise HTTPException(status_code=500, detail=f'Índice de clase fuera de rango: {idx} >= {len(labels)}')
+    return {
+        'class': idx,
+        'class_name': labels.names[idx],
+        'probability': float(pred[idx]),
+        'all_probabilities': labels.probabilities(pred)
+    }
+
+
+def build_result(pred1, pred2, pred3, labels):
+    """
+    Construye la respuesta de predicción a partir de las probabilidades 1D de cada modelo.
+
+    Args:
+        labels: (LabelSet de especies, de hojas, de plantas) del mismo snapshot que generó las predicciones
+    """
+    return {
+        'model1': _model_result('especies', pred1, labels[0]),
+        'model2': _model_result('hojas', pred2, labels[1]),
+        'model3': _model_result('plantas', pred3, labels[2])
+    }
+
+
+def _iter_uploads(images):
+    """Itera (nombre, bytes, error) sobre las imágenes enviadas como multipart"""
+    for upload in images:
+        if not upload.content_type or not upload.content_type.startswith('image/'):
+            yield upload.filename, None, 'El archivo debe ser una imagen'
+            continue
+        yield upload.filename, upload.file.read(), None
+
+
+def _iter_archive(fileobj):
+    """Itera (nombre, bytes, error) sobre las imágenes contenidas en un zip o tar"""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                yield info.filename, archive.read(info), None
+    else:
+        fileobj.seek(0)
+        with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                yield member.name, archive.extractfile(member).read(), None
+
+
+def _is_archive(fileobj):
+    """Indica si el archivo es un zip o tar legible"""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        return True
+    fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r:*'):
+            return True
+    except tarfile.TarError:
+        return False
+
+
+def _take(iterator, count):
+    return list(itertools.islice(iterator, count))
+
+
+def _cache_lookup(image_bytes, model_versions):
+    """
+    Calcula la clave de cache de la imagen y retorna (clave, predicción cacheada o None).
+    Sin las versiones de todos los modelos (model_versions None) el cache no se usa y la clave es None.
+    """
+    if model_versions is None:
+        return None, None
+    cache_key = prediction_cache.make_key(image_bytes, model_versions)
+    return cache_key, prediction_cache.get(cache_key)
+
+
+def _store_key(image_bytes, cache_key, lookup_versions, snapshot_versions):
+    """
+    Clave con la que se guarda una predicción: la de las versiones del snapshot que la
+    generó. Si un intercambio en caliente ocurrió entre la búsqueda y la inferencia, la
+    clave de la búsqueda corresponde a otras versiones y se recalcula.
+    """
+    if cache_key is not None and lookup_versions == snapshot_versions:
+        return cache_key
+    return prediction_cache.make_key(image_bytes, snapshot_versions)
+
+
+def _prepare_item(image_bytes, out, model_versions):
+    """
+    Busca la imagen en el cache y, si no está, la preprocesa en la fila out del lote.
+
+    Returns:
+        tuple: (clave de cache, predicción cacheada o None, mensaje de error o None)
+    """
+    cache_key, cached = _cache_lookup(image_bytes, model_versions)
+    if cached is not None:
+        return cache_key, cached, None
+    try:
+        with predict_stage_seconds.time('decode', ''):
+            preprocess_into(image_bytes, out)
+        return cache_key, None, None
+    except Exception as e:
+        return cache_key, None, f'No se pudo procesar la imagen: {e}'
+
+
+def _timed_preprocess(image_bytes):
+    with predict_stage_seconds.time('decode', ''):
+        return preprocess_image(image_bytes)
+
+
+def _record_batch(batch_size, waits_ms):
+    predict_batch_size.observe(batch_size)
+    for wait in waits_ms:
+        predict_stage_seconds.observe(wait / 1000.0, 'queue_wait', '')
+
+
+def init_routes(registry):
     bp = APIRouter(prefix="/predict", tags=["predict"])
 
+    def run_model(name, model, input_data):
+        # Cada modelo tiene su propio control de concurrencia, de modo que un lote
+        # puede usar 'plantas' mientras el siguiente ya está en 'especies'
+        wait_started = time.perf_counter()
+        with model_lock(name):
+            predict_stage_seconds.observe(time.perf_counter() - wait_started, 'lock_wait', name)
+            # Forzar ejecución en CPU para predicciones
+            # Esto evita que las predicciones interfieran con el entrenamiento en GPU
+            with predict_stage_seconds.time('forward', name), tf.device('/CPU:0'):
+                return run_inference(model, input_data)
+
+    def run_models(input_data):
+        """
+        Ejecuta los tres modelos una sola vez sobre un lote completo. Retorna las tres
+        predicciones y, por fila, un BatchSnapshot con las etiquetas y las versiones de los
+        modelos que las generaron.
+        """
+        # Un único snapshot por lote: un intercambio de modelo en caliente
+        # solo afecta a los lotes siguientes
+        models = registry.snapshot()
+        pred1 = run_model('especies', models['especies'].model, input_data)
+        pred2 = run_model('hojas', models['hojas'].model, input_data)
+        pred3 = run_model('plantas', models['plantas'].model, input_data)
+        # Las etiquetas y versiones salen del mismo snapshot que los pesos; una columna por
+        # fila para que el micro-batcher las reparta junto con las predicciones
+        snapshot = BatchSnapshot(
+            (models['especies'].labels, models['hojas'].labels, models['plantas'].labels),
+            {name: entry.version for name, entry in models.items()}
+        )
+        snapshots = np.empty(len(input_data), dtype=object)
+        snapshots.fill(snapshot)
+        return pred1, pred2, pred3, snapshots
+
+    batcher = MicroBatcher(
+        run_models,
+        max_batch_size=PREDICT_MAX_BATCH_SIZE,
+        max_wait_ms=PREDICT_MAX_WAIT_MS,
+        executor=inference_executor,
+        max_inflight=PREDICT_MAX_INFLIGHT_BATCHES,
+        on_batch=_record_batch
+    )
+
+    def cache_versions():
+        """
+        Versiones de todos los modelos para buscar en el cache, o None si alguno aún no está
+        cargado (modo lazy): una clave sin esas versiones sobreviviría a un reentrenamiento.
+        Las predicciones se guardan con las versiones del snapshot que las generó.
+        """
+        versions = registry.versions()
+        if any(name not in versions for name in registry.model_files):
+            return None
+        return versions
+
+    def ensure_ready():
+        if not registry.is_ready():
+            raise HTTPException(status_code=503, detail='Los modelos se están cargando, intenta de nuevo en unos segundos')
+
     @bp.post("")
     async def predict(image: UploadFile = File(...)):
+        predict_requests.inc('predict')
+        try:
+            return await run_predict(image)
+        except HTTPException as e:
+            predict_errors.inc('predict', str(e.status_code))
+            raise
+        except Exception:
+            predict_errors.inc('predict', '500')
+            raise
+
+    async def run_predict(image):
+        ensure_ready()
         if not image.content_type or not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail='El archivo debe ser una imagen')
-        
-        image_bytes = await image.read()
-        input_data = preprocess_image(image_bytes)
 
-        # Usar lock para evitar conflictos, pero permitir ejecución concurrente
-        # Las predicciones se ejecutan en CPU sin interferir con GPU
-        with predict_lock:
-            # Forzar ejecución en CPU para predicciones
-            # Esto evita que las predicciones interfieran con el entrenamiento en GPU
-            with tf.device('/CPU:0'):
-                pred1 = safe_predict(especies, input_data)
-                if isinstance(pred1, list):
-                    pred1 = pred1[0]
-                pred1 = pred1.numpy()
-                # Asegurar que pred1 sea un array 1D
-                if pred1.ndim > 1:
-                    pred1 = pred1.flatten()
-                
-                pred2 = safe_predict(formas, input_data)
-                if isinstance(pred2, list):
-                    pred2 = pred2[0]
-                pred2 = pred2.numpy()
-                # Asegurar que pred2 sea un array 1D
-                if pred2.ndim > 1:
-                    pred2 = pred2.flatten()
-                
-                pred3 = safe_predict(plantas, input_data)
-                if isinstance(pred3, list):
-                    pred3 = pred3[0]
-                pred3 = pred3.numpy()
-                # Asegurar que pred3 sea un array 1D
-                if pred3.ndim > 1:
-                    pred3 = pred3.flatten()
-
-        # Obtener índices de las clases predichas
-        idx1 = int(np.argmax(pred1))
-        idx2 = int(np.argmax(pred2))
-        idx3 = int(np.argmax(pred3))
-        
-        # Validar que los índices estén dentro del rango
-        if idx1 >= len(SPECIES):
-            raise HTTPException(status_code=500, detail=f'Índice de clase fuera de rango: {idx1} >= {len(SPECIES)}')
-        if idx2 >= len(SHAPES):
-            raise HTTPException(status_code=500, detail=f'Índice de clase fuera de rango: {idx2} >= {len(SHAPES)}')
-        if idx3 >= len(PLANTS):
-            raise HTTPException(status_code=500, detail=f'Índice de clase fuera de rango: {idx3} >= {len(PLANTS)}')
-
-        result = {
-            'model1': {
-                'class': idx1,
-                'class_name': SPECIES[idx1],
-                'probability': float(np.max(pred1)),
-                'all_probabilities': {SPECIES[i]: float(pred1[i]) for i in range(len(SPECIES))} if len(pred1) == len(SPECIES) else {}
-            },
-            'model2': {
-                'class': idx2,
-                'class_name': SHAPES[idx2],
-                'probability': float(np.max(pred2)),
-                'all_probabilities': {SHAPES[i]: float(pred2[i]) for i in range(len(SHAPES))} if len(pred2) == len(SHAPES) else {}
-            },
-            'model3': {
-                'class': idx3,
-                'class_name': str(PLANTS[idx3]),
-                'probability': float(np.max(pred3)),
-                'all_probabilities': {str(PLANTS[i]): float(pred3[i]) for i in range(len(PLANTS))} if len(pred3) == len(PLANTS) else {}
-            }
+        with predict_stage_seconds.time('upload', ''):
+            image_bytes = await image.read()
+
+        # Las imágenes repetidas se responden desde el cache sin pasar por los modelos
+        model_versions = cache_versions()
+        cache_key, cached = await run_in_inference_executor(_cache_lookup, image_bytes, model_versions)
+        if cached is not None:
+            with predict_stage_seconds.time('serialize', ''):
+                return JSONResponse(content=cached)
+
+        # Decodificar y preprocesar fuera del event loop
+        input_data = await run_in_inference_executor(_timed_preprocess, image_bytes)
+
+        # Las solicitudes concurrentes se agrupan en un mismo lote
+        pred1, pred2, pred3, snapshots = await batcher.submit(input_data)
+        snapshot = snapshots[0]
+        with predict_stage_seconds.time('serialize', ''):
+            result = build_result(pred1[0], pred2[0], pred3[0], snapshot.labels)
+            response = JSONResponse(content=result)
+        prediction_cache.put(_store_key(image_bytes, cache_key, model_versions, snapshot.versions), result)
+        return response
+
+    async def prepare_chunk(items):
+        """Lee el siguiente bloque de imágenes y las preprocesa en paralelo"""
+        chunk = await run_in_inference_executor(_take, items, PREDICT_BULK_CHUNK_SIZE)
+        model_versions = cache_versions()
+        # Cada imagen se escribe directamente en su fila del buffer del lote
+        buffer = allocate_batch(len(chunk))
+        prepared = await asyncio.gather(*[
+            run_in_inference_executor(_prepare_item, data, buffer[i], model_versions)
+            if error is None else asyncio.sleep(0, result=(None, None, error))
+            for i, (_, data, error) in enumerate(chunk)
+        ])
+        return chunk, buffer, prepared, model_versions
+
+    async def stream_predictions(items):
+        index = 0
+        pending = asyncio.ensure_future(prepare_chunk(items))
+        try:
+            while True:
+                chunk, buffer, prepared, model_versions = await pending
+                if not chunk:
+                    break
+                # Preparar el siguiente bloque mientras se ejecuta la inferencia del actual
+                pending = asyncio.ensure_future(prepare_chunk(items))
+
+                # Solo pasan por los modelos las imágenes válidas que no estaban en cache
+                pending_rows = [
+                    i for i, (_, cached, error) in enumerate(prepared)
+                    if cached is None and error is None
+                ]
+                preds = None
+                if pending_rows:
+                    batch_input = buffer if len(pending_rows) == len(chunk) else buffer[pending_rows]
+                    preds = await run_in_inference_executor(run_models, batch_input)
+
+                row = 0
+                for (filename, data, _), (cache_key, cached, error) in zip(chunk, prepared):
+                    line = {'index': index, 'filename': filename}
+                    if error is not None:
+                        predict_errors.inc('batch', 'item')
+                        line['error'] = error
+                    elif cached is not None:
+                        line.update(cached)
+                    else:
+                        try:
+                            snapshot = preds[3][row]
+                            result = build_result(preds[0][row], preds[1][row], preds[2][row], snapshot.labels)
+                            prediction_cache.put(
+                                _store_key(data, cache_key, model_versions, snapshot.versions), result
+                            )
+                            line.update(result)
+                        except HTTPException as e:
+                            predict_errors.inc('batch', str(e.status_code))
+                            line['error'] = e.detail
+                        row += 1
+                    index += 1
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Si el cliente se desconecta, no seguir preparando bloques
+            pending.cancel()
+
+    @bp.post("/batch")
+    async def predict_batch(
+        images: Optional[List[UploadFile]] = File(None),
+        archive: Optional[UploadFile] = File(None)
+    ):
+        """
+        Predicción masiva: acepta varias imágenes (multipart 'images') o un zip/tar ('archive')
+        y devuelve los resultados como NDJSON, una línea por imagen, a medida que se procesan.
+        """
+        predict_requests.inc('batch')
+        ensure_ready()
+        if not images and archive is None:
+            raise HTTPException(status_code=400, detail="Debes enviar 'images' o un archivo 'archive' (zip/tar)")
+
+        if archive is not None:
+            if not await run_in_inference_executor(_is_archive, archive.file):
+                raise HTTPException(status_code=400, detail='El archivo debe ser un zip o tar')
+            items = _iter_archive(archive.file)
+        else:
+            items = _iter_uploads(images)
+
+        return StreamingResponse(stream_predictions(items), media_type="application/x-ndjson")
+
+    @bp.get("/stats")
+    def predict_stats():
+        """Endpoint con estadísticas del micro-batching y del cache de predicciones"""
+        return {
+            "max_batch_size": batcher.max_batch_size,
+            "max_wait_ms": batcher.max_wait * 1000.0,
+            "batching": batcher.stats.snapshot(),
+            "cache": prediction_cache.stats(),
+            "model_versions": registry.versions()
         }
-        return result
     
     return bp
@@ -0,0 +1,798 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import tensorflow as tf
+from .config import (
+    BASE_DIR, TRAINING_CONCURRENCY, TRAINING_MAX_JOBS, TRAINING_LOCK_DIR, TRAINING_JOBS_DB,
+    TRAINING_ISOLATION, TRAINING_CPU_THREADS, TRAINING_MEMORY_LIMIT_MB, TRAINING_NICE,
+    TRAINING_MAX_EPOCHS, EARLY_STOPPING_PATIENCE, EARLY_STOPPING_MIN_DELTA,
+    TRAIN_BATCH_SIZE, BATCH_AUTOTUNE_CACHE, BATCH_AUTOTUNE_MAX_GPU, BATCH_AUTOTUNE_MAX_CPU,
+    DATASET_CACHE_DIR, FAST_RETRAIN_EPOCHS, FAST_RETRAIN_LEARNING_RATE, FAST_RETRAIN_BATCH_SIZE,
+    MODEL_DIR, DATA_DIR, INFERENCE_BACKEND, TFLITE_QUANTIZATION,
+    CLOUDFLARE_R2_BUCKET_NAME, CLOUDFLARE_R2_ACCOUNT_ID,
+    CLOUDFLARE_R2_ACCESS_KEY_ID, CLOUDFLARE_R2_SECRET_ACCESS_KEY,
+    CLOUDFLARE_R2_PREFIX
+)
+from .utils.label_detector import detect_new_classes, adjust_model_for_new_classes
+from .utils.label_registry import label_registry
+from .utils.cloudflare_downloader import sync_verified_images_from_r2
+from .utils.prediction_cache import prediction_cache
+from .utils.training_data import (
+    build_training_data, list_class_names, open_dataset_cache, split_cached, EpochThroughputLogger
+)
+from .utils.embedding_cache import EmbeddingCache, build_backbone, backbone_version
+from .utils.batch_autotuner import BatchSizeAutotuner
+from .utils.checkpoints import TrainingCheckpoint, CheckpointCallback, ResumableEarlyStopping
+from .utils.artifact_store import artifact_store, check_h5_structure
+from .utils.jobs import JobManager, JobStore, JobCancelled, ALL_MODELS
+from .models_loader import model_registry, get_model_version, MODEL_FILES
+
+VALIDATION_SPLIT = 0.2
+TRAINING_MODES = ('full', 'fast')
+
+batch_autotuner = BatchSizeAutotuner(BATCH_AUTOTUNE_CACHE)
+
+
+class JobProgressCallback(tf.keras.callbacks.Callback):
+    """
+    Publica en el trabajo la época, el throughput y el ETA del entrenamiento, y lo
+    detiene al terminar la época en curso si se pidió cancelarlo.
+    """
+
+    def __init__(self, job, train_count, epochs):
+        super().__init__()
+        self.job = job
+        self.train_count = train_count
+        self.epochs = epochs
+        self._epoch_seconds = []
+        self._started = None
+
+    def on_train_begin(self, logs=None):
+        self.job.update(epoch=0, epochs=self.epochs, train_count=self.train_count)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self.job.update(epoch=epoch + 1)
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._started
+        self._epoch_seconds.append(seconds)
+        average = sum(self._epoch_seconds) / len(self._epoch_seconds)
+        self.job.update(
+            epoch=epoch + 1,
+            images_per_s=self.train_count / seconds if seconds > 0 else 0.0,
+            eta_seconds=average * (self.epochs - epoch - 1),
+            metrics={key: float(value) for key, value in (logs or {}).items()},
+        )
+        if self.job.cancel_requested():
+            print(f"🛑 Cancelación solicitada: deteniendo {self.job.model} tras la época {epoch + 1}")
+            self.model.stop_training = True
+
+
+def fit_full(model, model_name, data_path, use_gpu, device, job, base_version):
+    """
+    Fine-tuning completo: entrena toda la red sobre las imágenes de DATA_DIR/<modelo>/train.
+
+    Guarda un checkpoint por época y, si el último checkpoint corresponde al mismo modelo de
+    partida (base_version) y a las mismas clases, reanuda desde él. Se detiene antes de
+    TRAINING_MAX_EPOCHS cuando la pérdida de validación deja de mejorar.
+
+    Returns:
+        tuple: (modelo entrenado, training_data de build_training_data, métricas por época)
+    """
+    # Batch size medido con pasos de prueba (o cacheado de un reentrenamiento anterior)
+    if TRAIN_BATCH_SIZE == 'auto':
+        batch_size, autotune_key = batch_autotuner.choose(
+            model, model_name, use_gpu,
+            max_batch_size=BATCH_AUTOTUNE_MAX_GPU if use_gpu else BATCH_AUTOTUNE_MAX_CPU,
+            default=64 if use_gpu else 32
+        )
+    else:
+        batch_size, autotune_key = int(TRAIN_BATCH_SIZE), None
+
+    print(f"   📦 Configurando batch size: {batch_size} {'(GPU optimizado)' if use_gpu else '(CPU)'}")
+
+    job.check_cancelled()
+    training_data = build_training_data(os.path.join(data_path, "train"), batch_size)
+    train_gen = training_data['train']
+    val_gen = training_data['val']
+    throughput_logger = EpochThroughputLogger(training_data['train_count'])
+    progress_callback = JobProgressCallback(job, training_data['train_count'], TRAINING_MAX_EPOCHS)
+
+    # Verificar que el número de clases del generador coincide con el modelo
+    train_num_classes = training_data['num_classes']
+    # Manejar casos donde output puede ser una lista o un tensor
+    if isinstance(model.output, list):
+        model_output_classes = model.output[0].shape[-1]
+    else:
+        model_output_classes = model.output.shape[-1]
+    print(f"Verificación final: Generador tiene {train_num_classes} clases, Modelo tiene {model_output_classes} clases")
+
+    if train_num_classes != model_output_classes:
+        raise ValueError(
+            f"Incompatibilidad: El generador tiene {train_num_classes} clases pero el modelo tiene {model_output_classes} clases. "
+            f"Ajuste el modelo antes de continuar."
+        )
+
+    # Verificar en qué dispositivo está el modelo antes de compilar
+    print(f"\n📍 Verificando dispositivo del modelo...")
+    if hasattr(model, 'layers') and len(model.layers) > 0:
+        # Verificar la primera capa para ver dónde está el modelo
+        first_layer = model.layers[0]
+        if hasattr(first_layer, 'weights') and len(first_layer.weights) > 0:
+            device_location = first_layer.weights[0].device
+            print(f"   Dispositivo del modelo: {device_location}")
+            if '/GPU' in str(device_location):
+                print("   ✅ Modelo está en GPU")
+            else:
+                print("   ⚠️  Modelo está en CPU")
+
+    # Forzar uso de GPU explícitamente si está disponible
+    if use_gpu:
+        print(f"\n🔧 Configurando para forzar uso de GPU...")
+        # Verificar que TensorFlow vea la GPU
+        available_gpus = tf.config.list_physical_devices('GPU')
+        print(f"   GPUs físicas: {len(available_gpus)}")
+        print(f"   GPUs lógicas: {len(tf.config.list_logical_devices('GPU'))}")
+
+        if available_gpus:
+            # Asegurar que todas las operaciones se ejecuten en GPU
+            # Configurar para que TensorFlow use GPU por defecto
+            try:
+                tf.config.experimental.set_memory_growth(available_gpus[0], True)
+                print("   ✅ GPU configurada con memory growth")
+            except Exception as e:
+                print(f"   ⚠️  Error configurando memory growth: {e}")
+
+    job.set_phase('training')
+
+    # Reanudar desde el último checkpoint si la ejecución anterior se interrumpió
+    checkpoint = TrainingCheckpoint(model_name)
+    run_state = {'mode': 'full', 'base_version': base_version, 'class_names': training_data['class_names']}
+    resume_state = checkpoint.resumable(run_state)
+    initial_epoch = 0
+    if resume_state:
+        initial_epoch = resume_state['epoch']
+        print(f"\n⏯️  Reanudando {model_name} desde el checkpoint de la época {initial_epoch}")
+        # El checkpoint incluye los pesos y el estado del optimizador, ya compilado
+        model = checkpoint.load_model()
+    else:
+        # Compilar modelo - esto debe hacerse dentro del contexto de GPU
+        print(f"\n⚙️  Compilando modelo...")
+        model.compile(optimizer=tf.keras.optimizers.Adam(1e-5),
+                      loss='categorical_crossentropy',
+                      metrics=['accuracy'])
+
+    early_stopping_state = (resume_state or {}).get('early_stopping') or {}
+    early_stopping = ResumableEarlyStopping(
+        resume_state=early_stopping_state,
+        best_weights=checkpoint.load_best_weights(early_stopping_state.get('best_epoch')) if resume_state else None,
+        monitor='val_loss',
+        patience=EARLY_STOPPING_PATIENCE,
+        min_delta=EARLY_STOPPING_MIN_DELTA,
+        restore_best_weights=True,
+        verbose=1
+    )
+    checkpoint_callback = CheckpointCallback(checkpoint, run_state, early_stopping)
+    callbacks = [throughput_logger, early_stopping, checkpoint_callback, progress_callback]
+
+    # Verificar dispositivo después de compilar
+    print(f"   Verificando dispositivo después de compilar...")
+    if hasattr(model, 'layers') and len(model.layers) > 0:
+        first_layer = model.layers[0]
+        if hasattr(first_layer, 'weights') and len(first_layer.weights) > 0:
+            device_location = first_layer.weights[0].device
+            print(f"   Dispositivo: {device_location}")
+            if '/GPU' in str(device_location):
+                print("   ✅ Modelo compilado en GPU")
+            else:
+                print("   ⚠️  Modelo compilado en CPU - esto puede afectar el rendimiento")
+
+    # Ejecutar entrenamiento dentro del contexto de GPU
+    print(f"\n🚀 Iniciando entrenamiento en {device}...")
+    print(f"   Batch size: {batch_size}")
+    print(f"   Epochs: {initial_epoch + 1}-{TRAINING_MAX_EPOCHS} (early stopping con paciencia {EARLY_STOPPING_PATIENCE})")
+    print(f"   ⚠️  IMPORTANTE: Verifica nvidia-smi - deberías ver 80-100% de utilización\n")
+
+    # Configurar para maximizar uso de GPU
+    if use_gpu:
+        print(f"   🔧 Optimizaciones para GPU:")
+
+        # IMPORTANTE: Deshabilitar mixed precision si causa problemas de memoria
+        # Mixed precision puede causar OOM en GPUs con poca memoria
+        use_mixed_precision = False  # Deshabilitado por defecto para evitar OOM
+
+        if use_mixed_precision:
+            try:
+                policy = tf.keras.mixed_precision.Policy('mixed_float16')
+                tf.keras.mixed_precision.set_global_policy(policy)
+                print("      ✅ Mixed precision habilitado (puede aumentar memoria)")
+            except Exception as e:
+                print(f"      ℹ️  Mixed precision no disponible")
+        else:
+            print("      ℹ️  Mixed precision deshabilitado (para evitar OOM en 4GB VRAM)")
+
+        # Configurar para usar GPU agresivamente
+        try:
+            tf.config.optimizer.set_jit(True)  # Habilitar XLA JIT
+            print("      ✅ XLA JIT habilitado")
+        except Exception as e:
+            print(f"      ℹ️  XLA JIT no disponible")
+
+        # Nota: Los threads ya están configurados en app/config.py al inicio
+        print("      ✅ Threads ya configurados al inicio")
+
+    # Ejecutar entrenamiento - ya estamos dentro del contexto with tf.device(device)
+    # por lo que todas las operaciones se ejecutarán en el dispositivo correcto
+    print(f"\n   ⚡ Ejecutando entrenamiento...")
+    print(f"   📊 Monitorea nvidia-smi - deberías ver 80-100% de utilización")
+    print(f"   💡 Si ves baja utilización, el modelo puede ser pequeño - considera aumentar batch_size\n")
+
+    # Intentar entrenar con manejo de errores de memoria
+    try:
+        # NO limpiar sesión aquí - el modelo ya está cargado y compilado
+        # Solo hacer garbage collection para liberar memoria del sistema
+        if use_gpu:
+            import gc
+            gc.collect()
+            print(f"   🧹 Memoria del sistema limpiada")
+
+        model.fit(
+            train_gen, 
+            epochs=TRAINING_MAX_EPOCHS, 
+            initial_epoch=initial_epoch,
+            validation_data=val_gen, 
+            callbacks=callbacks,
+            verbose=1
+        )
+    except (tf.errors.ResourceExhaustedError, RuntimeError, Exception) as e:
+        error_msg = str(e)
+        # Detectar errores de memoria de GPU
+        is_oom = ('OOM' in error_msg or 
+                 'out of memory' in error_msg.lower() or 
+                 'ResourceExhaustedError' in error_msg or 
+                 'ran out of memory' in error_msg.lower() or
+                 'Allocator' in error_msg and 'memory' in error_msg.lower())
+
+        if is_oom:
+            # Si hay error de memoria, reducir batch size y reintentar
+            print(f"\n   ⚠️  ERROR: Memoria de GPU insuficiente con batch_size={batch_size}")
+            print(f"   🔄 Reduciendo batch_size a {batch_size // 2} y reintentando...\n")
+
+            # Limpiar memoria de GPU pero NO usar clear_session (destruye el modelo)
+            import gc
+            gc.collect()
+
+            # Reducir batch size
+            batch_size = batch_size // 2
+            if batch_size < 8:
+                print(f"   ❌ Batch size muy pequeño ({batch_size}). El entrenamiento puede ser muy lento.")
+                print(f"   💡 Considera reducir el tamaño del modelo o usar CPU.")
+                raise RuntimeError(f"Batch size demasiado pequeño después de reducir por OOM: {batch_size}")
+
+            # Recordar el tamaño reducido para no volver a empezar por uno que no cabe
+            if autotune_key:
+                batch_autotuner.record(autotune_key, batch_size, reduced_after_oom=True)
+
+            # Recrear el pipeline de entrada con el nuevo batch size
+            training_data = build_training_data(os.path.join(data_path, "train"), batch_size)
+            train_gen = training_data['train']
+            val_gen = training_data['val']
+
+            # Sin recompilar: un optimizador nuevo perdería el estado de Adam (el restaurado del
+            # checkpoint o el acumulado en esta ejecución). Si hay checkpoint se recarga para
+            # descartar la época que quedó a medias y seguir desde su límite con su optimizador
+            resume_epoch = max(initial_epoch, checkpoint_callback.completed_epochs)
+            if checkpoint_callback.completed_epochs or resume_state:
+                print(f"   🔄 Recargando el checkpoint de la época {resume_epoch}...")
+                model = checkpoint.load_model()
+
+            print(f"   ✅ Batch size reducido a {batch_size}, reintentando entrenamiento en GPU...\n")
+            # Asegurar que estamos en GPU al reintentar
+            with tf.device('/GPU:0'):
+                # Continuar desde la última época completada en lugar de empezar de cero
+                model.fit(
+                    train_gen, 
+                    epochs=TRAINING_MAX_EPOCHS, 
+                    initial_epoch=resume_epoch,
+                    validation_data=val_gen, 
+                    callbacks=callbacks,
+                    verbose=1
+                )
+        else:
+            # Re-lanzar el error si no es de memoria
+            raise
+
+    return model, training_data, throughput_logger.epochs
+
+
+def fit_head_on_embeddings(model, model_name, data_path, job):
+    """
+    Reentrenamiento rápido: congela todo menos la capa de salida y la entrena sobre los
+    embeddings de la penúltima capa, que se calculan una sola vez por imagen y versión del
+    backbone (ver EmbeddingCache). Los pesos entrenados se copian a la capa de salida de model.
+
+    Returns:
+        tuple: (resumen del dataset, métricas por época)
+    """
+    cache = open_dataset_cache(os.path.join(data_path, "train"), model_name=model_name)
+    class_names, (train_rows, train_labels), (val_rows, val_labels) = split_cached(cache, VALIDATION_SPLIT)
+    num_classes = len(class_names)
+    output_layer = model.layers[-1]
+    if output_layer.units != num_classes:
+        raise ValueError(
+            f"Incompatibilidad: El dataset tiene {num_classes} clases pero la capa de salida tiene {output_layer.units}."
+        )
+
+    # Embeddings de las imágenes nuevas o que aún no se calcularon con este backbone
+    backbone = build_backbone(model)
+    embeddings = EmbeddingCache(os.path.join(DATASET_CACHE_DIR, model_name), backbone_version(backbone))
+    keys_by_row = {entry['row']: entry['sha1'] for entry in cache.entries.values()}
+    all_rows = list(train_rows) + list(val_rows)
+    computed = embeddings.update(backbone, cache.images(), all_rows, [keys_by_row[row] for row in all_rows])
+    print(f"🧠 Embeddings: {len(all_rows) - computed} reutilizados del cache, {computed} calculados")
+    job.check_cancelled()
+
+    def to_dataset(rows, labels, shuffle):
+        vectors = embeddings.lookup([keys_by_row[row] for row in rows])
+        dataset = tf.data.Dataset.from_tensor_slices((vectors, tf.one_hot(labels, num_classes)))
+        if shuffle:
+            dataset = dataset.shuffle(len(rows), reshuffle_each_iteration=True)
+        return dataset.batch(FAST_RETRAIN_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+    # Capa de salida independiente con la misma configuración y pesos de partida
+    head = tf.keras.layers.Dense.from_config(output_layer.get_config())
+    head_model = tf.keras.Sequential([tf.keras.Input(shape=(embeddings.vectors.shape[1],)), head])
+    head.set_weights(output_layer.get_weights())
+    head_model.compile(optimizer=tf.keras.optimizers.Adam(FAST_RETRAIN_LEARNING_RATE),
+                       loss='categorical_crossentropy',
+                       metrics=['accuracy'])
+
+    job.set_phase('training')
+    throughput_logger = EpochThroughputLogger(len(train_rows), pipeline='embeddings')
+    progress_callback = JobProgressCallback(job, len(train_rows), FAST_RETRAIN_EPOCHS)
+    print(f"\n🚀 Reentrenamiento rápido de la capa de salida: {FAST_RETRAIN_EPOCHS} épocas sobre {len(train_rows)} embeddings")
+    head_model.fit(
+        to_dataset(train_rows, train_labels, True),
+        epochs=FAST_RETRAIN_EPOCHS,
+        validation_data=to_dataset(val_rows, val_labels, False) if val_rows else None,
+        callbacks=[throughput_logger, progress_callback],
+        verbose=2
+    )
+    output_layer.set_weights(head.get_weights())
+
+    training_data = {
+        'class_names': class_names,
+        'num_classes': num_classes,
+        'train_count': len(train_rows),
+        'val_count': len(val_rows),
+    }
+    return training_data, throughput_logger.epochs
+
+
+def activate_trained_model(model_name):
+    """
+    Pone en servicio el modelo recién guardado y descarta lo que dependía del anterior.
+
+    Returns:
+        str: Versión del artefacto en servicio (el .tflite con el backend TFLite, si no el .h5)
+    """
+    # Validar que el modelo guardado se puede cargar y ponerlo en servicio:
+    # el registro lo carga, lo precalienta y lo intercambia sin reiniciar
+    model_registry.reload(model_name)
+    print(f"Modelo {model_name} actualizado, validado y en servicio.")
+    # Las predicciones cacheadas corresponden a los pesos anteriores
+    prediction_cache.invalidate()
+    return model_registry.versions().get(model_name)
+
+
+def sync_r2_images(job):
+    """Sincroniza DATA_DIR/especies/train con las imágenes verificadas de Cloudflare R2"""
+    job.set_phase('downloading')
+    print(f"\n{'='*60}")
+    print(f"Descargando imágenes verificadas de Cloudflare R2...")
+    print(f"{'='*60}")
+
+    # Verificar que las credenciales estén configuradas
+    if all([
+        CLOUDFLARE_R2_BUCKET_NAME,
+        CLOUDFLARE_R2_ACCOUNT_ID,
+        CLOUDFLARE_R2_ACCESS_KEY_ID,
+        CLOUDFLARE_R2_SECRET_ACCESS_KEY
+    ]):
+        try:
+            print(f"📥 Sincronizando con bucket: {CLOUDFLARE_R2_BUCKET_NAME}")
+            stats = sync_verified_images_from_r2(
+                bucket_name=CLOUDFLARE_R2_BUCKET_NAME,
+                account_id=CLOUDFLARE_R2_ACCOUNT_ID,
+                access_key_id=CLOUDFLARE_R2_ACCESS_KEY_ID,
+                secret_access_key=CLOUDFLARE_R2_SECRET_ACCESS_KEY,
+                prefix=CLOUDFLARE_R2_PREFIX,
+                base_dir=None  # Usa DATA_DIR/especies/train por defecto
+            )
+            print(f"✅ Descarga completada: {stats['downloaded']} nuevas, {stats['skipped']} omitidas, {stats['errors']} errores")
+            if 'near_duplicates' in stats:
+                print(f"📉 Casi duplicados: {stats['near_duplicates']} excluidos ({stats['new_near_duplicates']} nuevos), "
+                      f"dataset {stats['dataset_shrink_pct']:.1f}% más pequeño")
+            print(f"{'='*60}\n")
+        except Exception as e:
+            print(f"⚠️  Error al descargar imágenes de Cloudflare R2: {e}")
+            print(f"   Continuando con el entrenamiento con los datos existentes...")
+            print(f"{'='*60}\n")
+    else:
+        print(f"⚠️  Credenciales de Cloudflare R2 no configuradas.")
+        print(f"   Para habilitar la descarga automática, configura las variables de entorno:")
+        print(f"   - CLOUDFLARE_R2_BUCKET_NAME")
+        print(f"   - CLOUDFLARE_R2_ACCOUNT_ID")
+        print(f"   - CLOUDFLARE_R2_ACCESS_KEY_ID")
+        print(f"   - CLOUDFLARE_R2_SECRET_ACCESS_KEY")
+        print(f"   Continuando con el entrenamiento con los datos existentes...")
+        print(f"{'='*60}\n")
+
+
+def train_model(model_name, job, activate=True, mode='full', sync=True):
+    """
+    Reentrena model_name con los datos de DATA_DIR/<modelo>/train, guarda el modelo con
+    respaldo y, si activate, lo pone en servicio. job recibe la fase y el progreso y puede
+    cancelarse entre fases o épocas (en ese caso no se guarda nada).
+
+    mode='full' ajusta toda la red; mode='fast' entrena solo la capa de salida sobre
+    embeddings cacheados (útil cuando solo se agregaron imágenes o una clase nueva).
+    Con sync=False no se sincroniza R2 (train_all_models ya lo hizo).
+
+    El resultado incluye version (la del .h5 en el ArtifactStore y el LabelRegistry) y
+    serving_version (la del artefacto en servicio; None si no se activó).
+    """
+    # Descargar imágenes verificadas de Cloudflare R2 ANTES del entrenamiento
+    # Solo para el modelo de especies
+    if sync and model_name == 'especies':
+        sync_r2_images(job)
+
+    # Habilitar memory growth para todas las GPUs disponibles
+    gpus = tf.config.list_physical_devices('GPU')
+    print(f"\n{'='*60}")
+    print(f"Información de GPU para entrenamiento de {model_name}")
+    print(f"{'='*60}")
+
+    if gpus:
+        print(f"GPUs detectadas: {len(gpus)}")
+        for i, gpu in enumerate(gpus):
+            try:
+                tf.config.experimental.set_memory_growth(gpu, True)
+                details = tf.config.experimental.get_device_details(gpu)
+                print(f"  GPU {i}: {gpu.name}")
+                if details:
+                    for key, value in details.items():
+                        print(f"    {key}: {value}")
+            except Exception as e:
+                print(f"  GPU {i}: {gpu.name} - Error: {e}")
+        print(f"{'='*60}\n")
+        print("💡 TIP: Abre otra terminal y ejecuta 'watch -n 1 nvidia-smi' para monitorear el uso de GPU en tiempo real")
+        print(f"{'='*60}\n")
+
+        # CRÍTICO: Asegurar que TensorFlow use GPU por defecto
+        # Configurar variables de entorno para forzar uso de GPU
+        os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+        # Establecer que TensorFlow debe usar GPU
+        tf.config.set_visible_devices(gpus[0], 'GPU')
+        print("✅ GPU configurada como dispositivo visible para TensorFlow")
+    else:
+        print("⚠️  No se detectaron GPUs. Se usará CPU para entrenamiento.")
+        print(f"{'='*60}\n")
+
+    print(f"Reentrenando modelo {model_name}...")
+    model_path = os.path.join(MODEL_DIR, f"modelo_{model_name}.h5")
+    data_path = os.path.join(DATA_DIR, model_name)
+
+    job.check_cancelled()
+    job.set_phase('preparing')
+
+    # Detectar clases en los datos DESPUÉS de descargar (si se descargaron)
+    print(f"Detectando clases en los datos para {model_name}...")
+    class_info = detect_new_classes(model_name)
+    detected_classes = class_info['detected_classes']
+    num_detected_classes = len(detected_classes)
+
+    print(f"Clases detectadas en los datos: {num_detected_classes} ({detected_classes})")
+    # Las etiquetas del nuevo modelo (en el orden de índices del pipeline) se registran
+    # con su versión al guardarlo; el modelo en servicio conserva las suyas hasta entonces
+
+    if class_info['has_changes']:
+        print(f"Nuevas clases detectadas: {class_info['new_classes']}")
+        if class_info['removed_classes']:
+            print(f"Clases removidas: {class_info['removed_classes']}")
+    else:
+        print(f"No se detectaron cambios en las clases para {model_name}")
+
+    # Detectar dispositivo automáticamente (GPU o CPU)
+    gpus = tf.config.list_physical_devices('GPU')
+    use_gpu = bool(gpus)
+
+    if use_gpu:
+        device = '/GPU:0'
+        print(f"\n🖥️  Dispositivo detectado: GPU")
+        print("✅ GPU disponible - El entrenamiento se ejecutará en GPU")
+        # Asegurar que GPU es visible y configurada
+        try:
+            tf.config.experimental.set_memory_growth(gpus[0], True)
+            print("   ✅ Memory growth habilitado para GPU")
+        except Exception as e:
+            print(f"   ⚠️  Advertencia al configurar memory growth: {e}")
+    else:
+        device = '/CPU:0'
+        print(f"\n🖥️  Dispositivo detectado: CPU")
+        print("⚠️  No se detectó GPU - El entrenamiento se ejecutará en CPU")
+        print("   💡 El entrenamiento será más lento pero funcionará correctamente")
+
+    # Cargar y entrenar en GPU si hay, de lo contrario en CPU
+    with tf.device(device):
+        model = tf.keras.models.load_model(model_path)
+
+        # Verificar el número de clases en el modelo actual
+        # Manejar casos donde output puede ser una lista o un tensor
+        if isinstance(model.output, list):
+            current_model_classes = model.output[0].shape[-1]
+        else:
+            current_model_classes = model.output.shape[-1]
+        print(f"Clases en el modelo actual: {current_model_classes}")
+        print(f"Clases detectadas en los datos: {num_detected_classes}")
+
+        # Ajustar modelo si el número de clases no coincide
+        if current_model_classes != num_detected_classes:
+            print(f"Ajustando modelo: de {current_model_classes} a {num_detected_classes} clases...")
+
+            # Calcular cuántas clases faltan
+            classes_to_add = num_detected_classes - current_model_classes
+
+            if classes_to_add > 0:
+                # Obtener las clases nuevas detectadas
+                new_classes_from_config = class_info.get('new_classes', [])
+
+                # Obtener todas las clases en el orden de índices del pipeline (alfabético),
+                # sin recorrer ni decodificar las imágenes
+                all_classes_sorted = list_class_names(os.path.join(data_path, "train"))
+
+                # Las clases que el modelo tiene actualmente son las primeras current_model_classes
+                model_current_classes = all_classes_sorted[:current_model_classes]
+
+                # Las clases que faltan son las que están en all_classes_sorted pero no en model_current_classes
+                new_classes_needed = [cls for cls in all_classes_sorted if cls not in model_current_classes]
+
+                # Asegurarse de que tenemos exactamente classes_to_add clases
+                if len(new_classes_needed) != classes_to_add:
+                    # Si hay discrepancia, tomar las últimas classes_to_add clases
+                    new_classes_needed = all_classes_sorted[-classes_to_add:]
+
+                print(f"Agregando {len(new_classes_needed)} clases al modelo: {new_classes_needed}")
+                model = adjust_model_for_new_classes(model, model_name, new_classes_needed)
+                print("Modelo ajustado exitosamente.")
+            else:
+                # El modelo tiene más clases que las detectadas - esto es problemático
+                # Por ahora, creamos un nuevo modelo con el número correcto de clases
+                print(f"ADVERTENCIA: El modelo tiene más clases ({current_model_classes}) que las detectadas ({num_detected_classes})")
+                print("Reconstruyendo la capa de salida...")
+
+                # Obtener la penúltima capa
+                penultimate_layer = model.layers[-2]
+
+                # Crear nueva capa de salida con el número correcto de clases
+                if model_name == 'plantas':
+                    new_output = tf.keras.layers.Dense(
+                        num_detected_classes,
+                        activation='sigmoid',
+                        name='new_output'
+                    )(penultimate_layer.output)
+                else:
+                    new_output = tf.keras.layers.Dense(
+                        num_detected_classes,
+                        activation='softmax',
+                        name='new_output'
+                    )(penultimate_layer.output)
+
+                # Crear nuevo modelo
+                model = tf.keras.Model(inputs=model.input, outputs=new_output)
+                print("Modelo reconstruido con el número correcto de clases.")
+        else:
+            print("El modelo ya tiene el número correcto de clases.")
+
+        if mode == 'fast':
+            training_data, epoch_log = fit_head_on_embeddings(model, model_name, data_path, job)
+        else:
+            model, training_data, epoch_log = fit_full(
+                model, model_name, data_path, use_gpu, device, job, get_model_version(model_path)
+            )
+
+    # Un trabajo cancelado durante el entrenamiento no reemplaza el modelo en servicio
+    job.check_cancelled()
+    job.set_phase('saving')
+
+    # El modelo actual queda como versión en el almacén antes de reemplazarlo;
+    # si ya estaba guardado (mismo hash) no se escribe nada
+    previous = None
+    if os.path.exists(model_path):
+        try:
+            previous = artifact_store.put(model_name, model_path)
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar la versión actual de {model_name} en el almacén: {e}")
+
+    tmp_path = os.path.join(MODEL_DIR, f"modelo_{model_name}.tmp.h5")
+    try:
+        # Guardar a un temporal (con extensión .h5 para que Keras elija el formato),
+        # verificar su estructura y reemplazar el modelo de forma atómica
+        model.save(tmp_path)
+        check_h5_structure(tmp_path)
+        os.replace(tmp_path, model_path)
+        stored = artifact_store.put(model_name, model_path, mode=mode, classes=training_data['class_names'])
+        # Las etiquetas quedan registradas con la versión antes de que se pueda cargar
+        label_registry.save(model_name, stored['version'], training_data['class_names'], mode=mode)
+
+        # Con el backend TFLite, regenerar el modelo cuantizado a partir del nuevo .h5
+        if INFERENCE_BACKEND == 'tflite':
+            from .utils.tflite_export import export_model
+            export_model(model_name, (TFLITE_QUANTIZATION,))
+
+        serving_version = None
+        if activate:
+            serving_version = activate_trained_model(model_name)
+        else:
+            # En el proceso aislado basta con el checksum y la estructura verificados por el
+            # almacén; el proceso de la API lo carga y lo pone en servicio al recibir el resultado
+            print(f"Modelo {model_name} guardado y verificado (versión {stored['version']}).")
+        # El entrenamiento terminó y quedó guardado: no hay nada que reanudar
+        TrainingCheckpoint(model_name).clear()
+
+    except Exception as e:
+        print(f"Error al actualizar modelo {model_name}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # Restaurar la versión anterior desde el almacén
+        if previous is not None:
+            try:
+                artifact_store.restore(model_name, previous['version'], model_path)
+                print(f"Restaurado modelo {model_name} a la versión {previous['version']}.")
+            except Exception as re:
+                print(f"Error al restaurar la versión anterior de {model_name}: {re}")
+        raise
+
+    return {
+        'model': model_name,
+        'version': stored['version'],
+        'serving_version': serving_version,
+        'classes': training_data['class_names'],
+        'mode': mode,
+        'epochs': epoch_log,
+    }
+
+
+def train_all_models(job, activate=True, mode='full'):
+    """
+    Reentrena especies, hojas y plantas como un solo trabajo. R2 se sincroniza una vez y
+    los caches de imágenes decodificadas se actualizan en orden compartiendo la decodificación:
+    una imagen que ya está en el cache de otro modelo (mismo hash) se copia en lugar de
+    decodificarse de nuevo. Cada modelo se entrena, guarda y respalda por separado, así que
+    el fallo de uno no impide actualizar los demás.
+
+    Returns:
+        dict: {'model': 'all', 'mode', 'models': {modelo: resultado de train_model o {'error'}}}
+    """
+    sync_r2_images(job)
+    job.check_cancelled()
+
+    job.set_phase('decoding')
+    caches = []
+    for model_name in MODEL_FILES:
+        train_dir = os.path.join(DATA_DIR, model_name, "train")
+        if not os.path.isdir(train_dir):
+            print(f"⚠️  No existe {train_dir}; el cache de {model_name} se omite")
+            continue
+        caches.append(open_dataset_cache(train_dir, model_name=model_name, shared=caches))
+        job.check_cancelled()
+
+    results = {}
+    for model_name in MODEL_FILES:
+        job.update(current_model=model_name)
+        try:
+            results[model_name] = train_model(model_name, job, activate=activate, mode=mode, sync=False)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"❌ Error reentrenando {model_name}: {e}")
+            results[model_name] = {'model': model_name, 'error': f"{type(e).__name__}: {e}"}
+        job.update(models={name: 'error' not in result for name, result in results.items()})
+
+    if all('error' in result for result in results.values()):
+        raise RuntimeError(f"Falló el reentrenamiento de todos los modelos: "
+                           f"{'; '.join(result['error'] for result in results.values())}")
+    return {'model': ALL_MODELS, 'mode': mode, 'models': results}
+
+
+def run_in_worker_process(job):
+    """
+    Ejecuta train_model en un proceso aparte (app.training_worker) y refleja en job la
+    fase y el progreso que este reporta. Un fallo, OOM o kill del proceso solo marca el
+    trabajo como fallido; el proceso de la API y los modelos en servicio no se ven afectados.
+    """
+    read_fd, write_fd = os.pipe()
+    env = dict(
+        os.environ,
+        # Presupuesto de hilos antes de que el proceso importe TensorFlow
+        OMP_NUM_THREADS=str(TRAINING_CPU_THREADS),
+        TF_NUM_INTRAOP_THREADS=str(TRAINING_CPU_THREADS),
+        TF_NUM_INTEROP_THREADS=str(min(TRAINING_CPU_THREADS, 2)),
+    )
+    command = [
+        sys.executable, '-m', 'app.training_worker', job.model,
+        '--job-id', job.id,
+        '--mode', job.params.get('mode', 'full'),
+        '--progress-fd', str(write_fd),
+        '--cpu-threads', str(TRAINING_CPU_THREADS),
+        '--memory-limit-mb', str(TRAINING_MEMORY_LIMIT_MB),
+        '--nice', str(TRAINING_NICE),
+    ]
+    try:
+        process = subprocess.Popen(command, cwd=os.path.dirname(BASE_DIR), env=env, pass_fds=(write_fd,))
+    except OSError:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    job.update(pid=process.pid)
+
+    outcome = {}
+
+    def read_messages():
+        with os.fdopen(read_fd, 'r') as channel:
+            for line in channel:
+                message = json.loads(line)
+                if message['type'] == 'phase':
+                    job.set_phase(message['phase'])
+                elif message['type'] == 'update':
+                    job.update(**message['fields'])
+                else:
+                    outcome.update(message)
+
+    reader = threading.Thread(target=read_messages, name=f"train-progress-{job.id}", daemon=True)
+    reader.start()
+
+    cancel_sent = False
+    while process.poll() is None:
+        if job.cancel_requested() and not cancel_sent:
+            # El proceso se detiene al terminar la época en curso
+            process.send_signal(signal.SIGUSR1)
+            cancel_sent = True
+        time.sleep(0.5)
+    reader.join(timeout=5)
+
+    if outcome.get('type') == 'result':
+        return outcome['result']
+    if outcome.get('type') == 'cancelled':
+        raise JobCancelled(f"Trabajo {job.id} cancelado")
+    if outcome.get('type') == 'error':
+        raise RuntimeError(f"El proceso de entrenamiento falló: {outcome['error']}")
+    raise RuntimeError(f"El proceso de entrenamiento terminó inesperadamente con código {process.returncode}")
+
+
+def run_training_job(job):
+    mode = job.params.get('mode', 'full')
+    if TRAINING_ISOLATION == 'thread':
+        if job.model == ALL_MODELS:
+            return train_all_models(job, mode=mode)
+        return train_model(job.model, job, mode=mode)
+    result = run_in_worker_process(job)
+    if job.model == ALL_MODELS:
+        for model_name, model_result in result['models'].items():
+            if 'error' not in model_result:
+                model_result['serving_version'] = activate_trained_model(model_name)
+        return result
+    result['serving_version'] = activate_trained_model(job.model)
+    return result
+
+
+training_jobs = JobManager(
+    run_training_job, concurrency=TRAINING_CONCURRENCY, max_running=TRAINING_MAX_JOBS, lock_dir=TRAINING_LOCK_DIR,
+    store=JobStore(TRAINING_JOBS_DB)
+)
@@ -0,0 +1,104 @@
+"""
+Proceso aislado de reentrenamiento.
+
+El proceso de la API lo lanza con `python -m app.training_worker <modelo> --progress-fd N`
+(ver training.run_in_worker_process). Reporta fase, progreso y resultado como líneas JSON
+por el descriptor N y se cancela con SIGUSR1 al terminar la época en curso.
+"""
+import argparse
+import json
+import os
+import resource
+import signal
+import sys
+import threading
+import traceback
+import tensorflow as tf
+from .training import train_model, train_all_models, TRAINING_MODES
+from .utils.jobs import JobCancelled, ALL_MODELS
+
+
+class WorkerJob:
+    """
+    Equivalente de TrainingJob dentro del proceso de entrenamiento: en lugar de guardar
+    el estado, lo envía al proceso de la API.
+    """
+
+    def __init__(self, job_id, model, channel):
+        self.id = job_id
+        self.model = model
+        self._channel = channel
+        self._cancel = threading.Event()
+
+    def send(self, message_type, **payload):
+        self._channel.write(json.dumps({'type': message_type, **payload}) + "\n")
+        self._channel.flush()
+
+    def set_phase(self, phase):
+        print(f"🏷️  Trabajo {self.id} ({self.model}): {phase}")
+        self.send('phase', phase=phase)
+
+    def update(self, **fields):
+        self.send('update', fields=fields)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Trabajo {self.id} cancelado")
+
+
+def apply_limits(cpu_threads, memory_limit_mb, nice):
+    """Aplica el presupuesto de hilos, el límite de memoria y la prioridad del proceso"""
+    tf.config.threading.set_intra_op_parallelism_threads(cpu_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(cpu_threads, 2))
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if nice > 0:
+        os.nice(nice)
+    print(f"🔒 Proceso de entrenamiento {os.getpid()}: {cpu_threads} hilos, "
+          f"memoria {f'{memory_limit_mb} MB' if memory_limit_mb > 0 else 'sin límite'}, nice +{nice}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reentrena un modelo en un proceso aislado")
+    parser.add_argument('model', choices=['especies', 'hojas', 'plantas', ALL_MODELS])
+    parser.add_argument('--job-id', required=True)
+    parser.add_argument('--mode', choices=TRAINING_MODES, default='full')
+    parser.add_argument('--progress-fd', type=int, required=True)
+    parser.add_argument('--cpu-threads', type=int, default=1)
+    parser.add_argument('--memory-limit-mb', type=int, default=0)
+    parser.add_argument('--nice', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    channel = os.fdopen(args.progress_fd, 'w', buffering=1)
+    job = WorkerJob(args.job_id, args.model, channel)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: job.cancel())
+
+    try:
+        apply_limits(args.cpu_threads, args.memory_limit_mb, args.nice)
+        # El proceso de la API pone el modelo en servicio al recibir el resultado
+        if args.model == ALL_MODELS:
+            result = train_all_models(job, activate=False, mode=args.mode)
+        else:
+            result = train_model(args.model, job, activate=False, mode=args.mode)
+        job.send('result', result=result)
+        return 0
+    except JobCancelled:
+        job.send('cancelled')
+        return 0
+    except BaseException as e:
+        traceback.print_exc()
+        job.send('error', error=f"{type(e).__name__}: {e}")
+        return 1
+    finally:
+        channel.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import h5py
+from ..config import BACKUP_DIR, MAX_BACKUPS
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def check_h5_structure(path):
+    """
+    Verificación barata de un modelo .h5 de Keras: abre el archivo HDF5 y comprueba que
+    tiene la configuración del modelo y el grupo de pesos, sin construir el modelo.
+    Lanza ValueError si falta algo.
+    """
+    try:
+        with h5py.File(path, 'r') as f:
+            if 'model_config' not in f.attrs:
+                raise ValueError(f"{path} no tiene model_config")
+            if 'model_weights' not in f or 'layer_names' not in f['model_weights'].attrs:
+                raise ValueError(f"{path} no tiene model_weights")
+    except OSError as e:
+        raise ValueError(f"{path} no es un archivo HDF5 válido: {e}") from e
+
+
+class ArtifactStore:
+    """
+    Almacén de versiones de los modelos direccionado por contenido.
+
+    Cada versión se guarda comprimida con gzip en objects/<hash>.h5.gz, donde hash es el
+    sha256 del .h5; guardar dos veces el mismo modelo no ocupa espacio extra. Por modelo,
+    <modelo>/index.json lista las versiones de la más antigua a la más reciente. Todas las
+    escrituras van a un temporal que luego se renombra.
+
+    Args:
+        root: Directorio del almacén (BACKUP_DIR)
+        keep: Versiones que se conservan por modelo (MAX_BACKUPS)
+    """
+
+    def __init__(self, root=BACKUP_DIR, keep=MAX_BACKUPS):
+        self.root = root
+        self.keep = max(1, keep)
+        self.objects_dir = os.path.join(root, 'objects')
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, f"{sha256}.h5.gz")
+
+    def index_path(self, model_name):
+        return os.path.join(self.root, model_name, 'index.json')
+
+    def _load_index(self, model_name):
+        path = self.index_path(model_name)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['versions']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _save_index(self, model_name, versions):
+        path = self.index_path(model_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'versions': versions}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def versions(self, model_name):
+        """Versiones guardadas de model_name, de la más antigua a la más reciente"""
+        with self._lock:
+            return self._load_index(model_name)
+
+    def get(self, model_name, version):
+        """Retorna la entrada del índice para version (los 12 primeros caracteres del hash o el hash completo)"""
+        for entry in self.versions(model_name):
+            if entry['sha256'].startswith(version):
+                return entry
+        return None
+
+    def put(self, model_name, path, **metadata):
+        """
+        Guarda el .h5 de path como versión de model_name (si ya existe ese contenido solo se
+        actualiza el índice) y elimina las versiones que exceden keep.
+
+        Returns:
+            dict: Entrada del índice con version, sha256, size, stored_size y created_at
+        """
+        check_h5_structure(path)
+        sha256 = file_sha256(path)
+        object_path = self.object_path(sha256)
+        with self._lock:
+            if not os.path.exists(object_path):
+                os.makedirs(self.objects_dir, exist_ok=True)
+                tmp_path = f"{object_path}.tmp"
+                with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(tmp_path, object_path)
+                print(f"🗄️  Versión {sha256[:12]} de {model_name} guardada "
+                      f"({os.path.getsize(path) / 1e6:.1f} MB -> {os.path.getsize(object_path) / 1e6:.1f} MB)")
+
+            versions = self._load_index(model_name)
+            # Una versión que se vuelve a guardar conserva sus metadatos y pasa a ser la más reciente
+            existing = next((entry for entry in versions if entry['sha256'] == sha256), {})
+            versions = [entry for entry in versions if entry['sha256'] != sha256]
+            entry = {
+                'version': sha256[:12],
+                'sha256': sha256,
+                'size': os.path.getsize(path),
+                'stored_size': os.path.getsize(object_path),
+                'created_at': time.time(),
+                **existing,
+                **metadata,
+            }
+            versions.append(entry)
+            versions, dropped = versions[-self.keep:], versions[:-self.keep]
+            self._save_index(model_name, versions)
+            self._remove_unreferenced(dropped)
+        return entry
+
+    def _remove_unreferenced(self, dropped):
+        """Elimina los objetos de las versiones descartadas que ningún índice sigue usando"""
+        if not dropped:
+            return
+        referenced = set()
+        for name in os.listdir(self.root):
+            if name != 'objects' and os.path.exists(self.index_path(name)):
+                referenced.update(entry['sha256'] for entry in self._load_index(name))
+        for entry in dropped:
+            if entry['sha256'] not in referenced and os.path.exists(self.object_path(entry['sha256'])):
+                os.remove(self.object_path(entry['sha256']))
+
+    def verify(self, path, sha256):
+        """Comprueba que path tiene el contenido sha256 y la estructura de un modelo Keras"""
+        actual = file_sha256(path)
+        if actual != sha256:
+            raise ValueError(f"{path}: checksum {actual[:12]} no coincide con {sha256[:12]}")
+        check_h5_structure(path)
+
+    def restore(self, model_name, version, dest):
+        """
+        Escribe la versión en dest de forma atómica (descomprime a un temporal, lo verifica
+        y lo renombra).
+
+        Returns:
+            dict: Entrada del índice restaurada
+        """
+        entry = self.get(model_name, version)
+        if entry is None:
+            raise KeyError(f"No existe la versión {version} de {model_name}")
+        tmp_path = f"{dest}.restore.tmp"
+        try:
+            with gzip.open(self.object_path(entry['sha256']), 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            self.verify(tmp_path, entry['sha256'])
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return entry
+
+
+artifact_store = ArtifactStore()
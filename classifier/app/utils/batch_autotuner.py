@@ -0,0 +1,157 @@
+import gc
+import json
+import os
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+
+
+def is_oom_error(error):
+    """Detecta errores de memoria insuficiente de TensorFlow"""
+    message = str(error)
+    return (
+        isinstance(error, tf.errors.ResourceExhaustedError)
+        or 'OOM' in message
+        or 'out of memory' in message.lower()
+        or 'ResourceExhaustedError' in message
+    )
+
+
+def describe_device(use_gpu):
+    """Identificador del dispositivo para la clave del cache, por ejemplo 'GPU:NVIDIA GeForce GTX 1650 Ti'"""
+    if use_gpu:
+        gpus = tf.config.list_physical_devices('GPU')
+        try:
+            details = tf.config.experimental.get_device_details(gpus[0])
+            return f"GPU:{details.get('device_name', gpus[0].name)}"
+        except Exception:
+            return f"GPU:{gpus[0].name}" if gpus else 'GPU'
+    threads = tf.config.threading.get_intra_op_parallelism_threads() or os.cpu_count()
+    return f"CPU:{threads}"
+
+
+class BatchSizeAutotuner:
+    """
+    Elige el batch size de entrenamiento midiendo en lugar de estimar: ejecuta unos pocos
+    pasos de entrenamiento cronometrados sobre un clon del modelo con tamaños crecientes y
+    se detiene ante un OOM o cuando el throughput deja de mejorar. El resultado se guarda por
+    modelo, dispositivo y tamaño de entrada para que los siguientes reentrenamientos no repitan
+    la prueba.
+
+    Args:
+        cache_path: Archivo JSON con los resultados
+        candidates: Tamaños a probar, en orden creciente
+        probe_steps: Pasos cronometrados por tamaño (después de uno de calentamiento)
+        min_gain: Mejora relativa mínima de throughput para seguir probando tamaños mayores
+    """
+
+    def __init__(self, cache_path, candidates=(8, 16, 32, 64, 128, 256, 512), probe_steps=5, min_gain=0.05):
+        self.cache_path = cache_path
+        self.candidates = tuple(sorted(candidates))
+        self.probe_steps = probe_steps
+        self.min_gain = min_gain
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(model_name, device, input_shape):
+        return f"{model_name}|{device}|{'x'.join(str(d) for d in input_shape)}"
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def record(self, key, batch_size, **details):
+        """Guarda (de forma atómica) el batch size elegido para key"""
+        with self._lock:
+            results = self._load()
+            results[key] = {'batch_size': batch_size, 'measured_at': time.time(), **details}
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+    def _probe(self, model, batch_size):
+        """Retorna las imágenes/s de entrenamiento con batch_size (lanza la excepción en OOM)"""
+        input_shape = model.input_shape[1:]
+        num_classes = model.output_shape[-1]
+        rng = np.random.default_rng(0)
+        images = rng.random((batch_size,) + tuple(input_shape), dtype=np.float32)
+        labels = np.eye(num_classes, dtype=np.float32)[rng.integers(0, num_classes, batch_size)]
+        # El primer paso incluye el trazado de la función para este tamaño
+        model.train_on_batch(images, labels)
+        step_seconds = []
+        for _ in range(self.probe_steps):
+            started = time.perf_counter()
+            model.train_on_batch(images, labels)
+            step_seconds.append(time.perf_counter() - started)
+        # La mediana es menos sensible a pasos aislados lentos que el promedio
+        return batch_size / float(np.median(step_seconds))
+
+    def probe(self, model, max_batch_size, loss='categorical_crossentropy'):
+        """
+        Prueba los tamaños candidatos hasta max_batch_size sobre un clon de model.
+
+        Returns:
+            tuple: (mejor batch size, {tamaño: imágenes/s o 'oom'})
+        """
+        probe_model = tf.keras.models.clone_model(model)
+        probe_model.compile(optimizer=tf.keras.optimizers.Adam(1e-5), loss=loss)
+        results, best_size, best_throughput = {}, None, 0.0
+        try:
+            for batch_size in self.candidates:
+                if batch_size > max_batch_size:
+                    break
+                try:
+                    throughput = self._probe(probe_model, batch_size)
+                except Exception as e:
+                    if not is_oom_error(e):
+                        raise
+                    results[batch_size] = 'oom'
+                    print(f"   🔬 batch {batch_size}: OOM")
+                    break
+                results[batch_size] = throughput
+                print(f"   🔬 batch {batch_size}: {throughput:.1f} img/s")
+                if best_size is not None and throughput < best_throughput * (1 + self.min_gain):
+                    # El throughput se estancó: se queda el tamaño menor, que usa menos memoria
+                    break
+                best_size, best_throughput = batch_size, throughput
+        finally:
+            del probe_model
+            gc.collect()
+        return best_size, results
+
+    def choose(self, model, model_name, use_gpu, max_batch_size, default):
+        """
+        Retorna el batch size cacheado para el modelo y dispositivo o lo mide; si la medición
+        falla o ningún tamaño funciona, retorna default.
+        """
+        key = self.cache_key(model_name, describe_device(use_gpu), model.input_shape[1:])
+        cached = self.get(key)
+        if cached:
+            print(f"   📦 Batch size cacheado para {key}: {cached['batch_size']}")
+            return cached['batch_size'], key
+
+        print(f"   🔬 Midiendo batch size óptimo para {key}...")
+        try:
+            batch_size, results = self.probe(model, max_batch_size)
+        except Exception as e:
+            print(f"   ⚠️  No se pudo medir el batch size ({e}); usando {default}")
+            return default, key
+        if batch_size is None:
+            print(f"   ⚠️  Ningún batch size cupo en memoria; usando {default}")
+            return default, key
+        self.record(key, batch_size, images_per_s=results[batch_size],
+                    probes={str(size): value for size, value in results.items()})
+        print(f"   📦 Batch size elegido: {batch_size} ({results[batch_size]:.1f} img/s)")
+        return batch_size, key
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BatchStats:
+    """
+    Estadísticas del micro-batching: tamaño de los lotes y tiempo de espera en cola.
+    Se actualiza desde el event loop, pero snapshot() puede llamarse desde el threadpool
+    (endpoints síncronos), así que ambos toman un lock.
+    """
+
+    def __init__(self, window=1024):
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes = {}
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self._recent_waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, batch_size, waits_ms):
+        with self._lock:
+            self._record(batch_size, waits_ms)
+
+    def _record(self, batch_size, waits_ms):
+        self.batches += 1
+        self.requests += batch_size
+        self.batch_sizes[batch_size] = self.batch_sizes.get(batch_size, 0) + 1
+        for wait in waits_ms:
+            self.total_wait_ms += wait
+            if wait > self.max_wait_ms:
+                self.max_wait_ms = wait
+            self._recent_waits.append(wait)
+
+    def snapshot(self):
+        # Copiar bajo el lock; los percentiles se calculan fuera
+        with self._lock:
+            recent = np.array(self._recent_waits) if self._recent_waits else None
+            batches, requests = self.batches, self.requests
+            batch_sizes = dict(self.batch_sizes)
+            total_wait_ms, max_wait_ms = self.total_wait_ms, self.max_wait_ms
+        return {
+            'batches': batches,
+            'requests': requests,
+            'avg_batch_size': requests / batches if batches else 0.0,
+            'batch_size_histogram': dict(sorted(batch_sizes.items())),
+            'queue_wait_ms': {
+                'avg': total_wait_ms / requests if requests else 0.0,
+                'max': max_wait_ms,
+                'p50': float(np.percentile(recent, 50)) if recent is not None else 0.0,
+                'p95': float(np.percentile(recent, 95)) if recent is not None else 0.0,
+            },
+        }
+
+
+class MicroBatcher:
+    """
+    Agrupa solicitudes concurrentes en un único lote para ejecutar cada modelo una sola vez.
+
+    El lote se despacha cuando alcanza max_batch_size o cuando la primera solicitud en cola
+    lleva max_wait_ms esperando. Cada llamador recibe únicamente su porción del resultado.
+
+    Args:
+        run_batch: Función síncrona que recibe un array (N, H, W, C) y retorna una tupla de
+            arrays de predicciones con N filas cada uno
+        max_batch_size: Máximo de imágenes por lote
+        max_wait_ms: Tiempo máximo de espera para completar un lote (milisegundos)
+        executor: Executor donde se ejecuta run_batch (None usa el executor por defecto del loop)
+        max_inflight: Máximo de lotes ejecutándose a la vez
+        on_batch: Callback opcional (tamaño_lote, esperas_ms) invocado al despachar cada lote
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=10.0, executor=None, max_inflight=1,
+                 on_batch=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self.max_inflight = max(1, int(max_inflight))
+        self.on_batch = on_batch
+        self.stats = BatchStats()
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._inflight = None
+        self._tasks = set()
+
+    async def submit(self, input_data):
+        """
+        Encola un array de entrada (1, H, W, C) y espera las predicciones correspondientes.
+
+        Returns:
+            tuple: Un array de predicciones por modelo, con las filas de esta solicitud
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((input_data, future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        # La cola y el semáforo quedan ligados al loop donde se usan por primera vez:
+        # si el batcher se usa desde otro loop (otro asyncio.run, otro TestClient) se recrean
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._worker = None
+            self._tasks = set()
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Mientras todos los lotes en ejecución siguen ocupados, las nuevas
+            # solicitudes se acumulan en la cola y forman un lote más grande
+            await self._inflight.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            rows = batch[0][0].shape[0]
+
+            # Completar el lote hasta llenar su capacidad o agotar el tiempo de espera
+            while rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        item = self._queue.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                batch.append(item)
+                rows += item[0].shape[0]
+
+            task = loop.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_batch_done)
+
+    def _on_batch_done(self, task):
+        self._tasks.discard(task)
+        self._inflight.release()
+
+    async def _process(self, batch):
+        # Descartar solicitudes cuyo cliente ya se desconectó
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        waits_ms = [(started - queued) * 1000.0 for _, _, queued in batch]
+        self.stats.record(len(batch), waits_ms)
+        if self.on_batch is not None:
+            self.on_batch(len(batch), waits_ms)
+
+        inputs = np.concatenate([input_data for input_data, _, _ in batch], axis=0)
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(self.executor, self.run_batch, inputs)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Repartir las filas de cada salida entre los llamadores
+        offset = 0
+        for input_data, future, _ in batch:
+            count = input_data.shape[0]
+            if not future.done():
+                future.set_result(tuple(output[offset:offset + count] for output in outputs))
+            offset += count
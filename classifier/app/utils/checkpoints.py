@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from ..config import CHECKPOINT_DIR
+
+
+class TrainingCheckpoint:
+    """
+    Último checkpoint de un reentrenamiento en curso: el modelo completo (pesos y estado
+    del optimizador) en formato .keras más un JSON con la época y el estado necesario para
+    reanudar, y los pesos de la mejor época para que el early stopping pueda restaurarlos
+    tras reanudar. Todos se escriben a un archivo temporal y se renombran, así que un proceso
+    interrumpido a mitad de escritura nunca deja un checkpoint corrupto.
+
+    Args:
+        model_name: Modelo (especies, hojas o plantas)
+        checkpoint_dir: Directorio base (CHECKPOINT_DIR, junto a BACKUP_DIR)
+    """
+
+    def __init__(self, model_name, checkpoint_dir=CHECKPOINT_DIR):
+        self.model_name = model_name
+        self.dir = os.path.join(checkpoint_dir, model_name)
+        self.model_path = os.path.join(self.dir, 'last.keras')
+        self.state_path = os.path.join(self.dir, 'last.json')
+        self.best_weights_path = os.path.join(self.dir, 'best.weights.npz')
+
+    def load_state(self):
+        if not (os.path.exists(self.state_path) and os.path.exists(self.model_path)):
+            return None
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def resumable(self, run_state):
+        """
+        Retorna el estado del checkpoint si corresponde a la misma ejecución (mismo modelo
+        de partida y mismas clases), o None si no hay nada que reanudar.
+        """
+        state = self.load_state()
+        if state is None:
+            return None
+        if any(state.get(key) != value for key, value in run_state.items()):
+            print(f"ℹ️  Checkpoint de {self.model_name} descartado: corresponde a otro modelo base o a otras clases")
+            self.clear()
+            return None
+        return state
+
+    def load_model(self):
+        return tf.keras.models.load_model(self.model_path)
+
+    def save(self, model, state):
+        os.makedirs(self.dir, exist_ok=True)
+        # Keras deduce el formato por la extensión, por eso el temporal también termina en .keras
+        tmp_model_path = os.path.join(self.dir, 'last.tmp.keras')
+        model.save(tmp_model_path)
+        os.replace(tmp_model_path, self.model_path)
+        tmp_state_path = f"{self.state_path}.tmp"
+        with open(tmp_state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_state_path, self.state_path)
+
+    def save_best_weights(self, weights, epoch):
+        """Guarda los pesos (lista de arrays de model.get_weights()) de la mejor época"""
+        os.makedirs(self.dir, exist_ok=True)
+        # np.savez agrega .npz si falta, por eso el temporal también termina en .npz
+        tmp_path = os.path.join(self.dir, 'best.weights.tmp.npz')
+        np.savez(tmp_path, *weights, epoch=np.int64(epoch))
+        os.replace(tmp_path, self.best_weights_path)
+
+    def load_best_weights(self, epoch):
+        """Pesos de la mejor época guardados, o None si faltan o no son los de epoch"""
+        if epoch is None or not os.path.exists(self.best_weights_path):
+            return None
+        try:
+            with np.load(self.best_weights_path) as data:
+                if int(data['epoch']) != epoch:
+                    return None
+                return [data[f'arr_{i}'] for i in range(len(data.files) - 1)]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def clear(self):
+        for path in (self.state_path, self.model_path, self.best_weights_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ResumableEarlyStopping(tf.keras.callbacks.EarlyStopping):
+    """
+    EarlyStopping que al reanudar recupera la mejor pérdida, la paciencia consumida y,
+    con restore_best_weights, los pesos de la mejor época (best_weights) guardados en el
+    checkpoint, de modo que al detenerse se restaure la mejor época real.
+    """
+
+    def __init__(self, resume_state=None, best_weights=None, **kwargs):
+        super().__init__(**kwargs)
+        self.resume_state = resume_state or {}
+        self.resume_best_weights = best_weights
+        self.best_epoch_completed = self.resume_state.get('best_epoch')
+
+    def on_train_begin(self, logs=None):
+        super().on_train_begin(logs)
+        if self.resume_state.get('best') is not None:
+            self.best = self.resume_state['best']
+            self.wait = self.resume_state.get('wait', 0)
+            if self.restore_best_weights and self.resume_best_weights is not None:
+                self.best_weights = self.resume_best_weights
+
+    def on_epoch_end(self, epoch, logs=None):
+        previous_best = self.best
+        super().on_epoch_end(epoch, logs)
+        # best solo cambia cuando la época mejora la métrica monitorizada
+        if self.best != previous_best:
+            self.best_epoch_completed = epoch + 1
+
+    def improved(self, epoch):
+        """Indica si epoch (0-indexada) fue la mejor hasta ahora"""
+        return self.best_epoch_completed == epoch + 1
+
+    def describe(self):
+        best = float(self.best) if self.best is not None else None
+        return {
+            'best': best if best is not None and math.isfinite(best) else None,
+            'wait': self.wait,
+            'best_epoch': self.best_epoch_completed,
+        }
+
+
+class CheckpointCallback(tf.keras.callbacks.Callback):
+    """
+    Guarda un TrainingCheckpoint al final de cada época con el estado de la ejecución
+    (run_state) y el del early stopping.
+    """
+
+    def __init__(self, checkpoint, run_state, early_stopping=None):
+        super().__init__()
+        self.checkpoint = checkpoint
+        self.run_state = run_state
+        self.early_stopping = early_stopping
+        self.completed_epochs = 0
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.completed_epochs = epoch + 1
+        state = dict(
+            self.run_state,
+            epoch=epoch + 1,
+            logs={key: float(value) for key, value in (logs or {}).items()},
+            early_stopping=self.early_stopping.describe() if self.early_stopping else None,
+            saved_at=time.time(),
+        )
+        started = time.perf_counter()
+        # Los pesos de la mejor época se escriben antes que el estado que los referencia
+        if self.early_stopping is not None and self.early_stopping.restore_best_weights \
+                and self.early_stopping.improved(epoch):
+            self.checkpoint.save_best_weights(self.model.get_weights(), epoch + 1)
+        self.checkpoint.save(self.model, state)
+        print(f"   💾 Checkpoint de la época {epoch + 1} guardado en {time.perf_counter() - started:.1f}s")
@@ -1,9 +1,30 @@
+import json
 import os
+import random
 import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
-from typing import List, Dict, Optional
-from ..config import DATA_DIR
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+from PIL import Image
+from typing import List, Dict, Optional, Callable
+from ..config import (
+    DATA_DIR, R2_DOWNLOAD_WORKERS, R2_DOWNLOAD_RETRIES, R2_RETRY_BACKOFF,
+    R2_SYNC_MODE, R2_SYNC_DELETE, R2_MANIFEST_PATH,
+    INGEST_SHORT_SIDE, INGEST_QUALITY, INGEST_ORIGINALS_DIR, INGEST_DISCARD_ORIGINALS
+)
+from .dataset_catalog import dataset_catalog
+
+# Cada descarga corre en un hilo del ThreadPoolExecutor: sin hilos propios de s3transfer,
+# la concurrencia real es R2_DOWNLOAD_WORKERS conexiones del pool del cliente
+SINGLE_THREAD_TRANSFER = TransferConfig(use_threads=False)
+
+# Errores de S3 que no tiene sentido reintentar
+NON_RETRYABLE_ERRORS = {'404', 'NoSuchKey', '403', 'AccessDenied', 'InvalidAccessKeyId', 'SignatureDoesNotMatch'}
 
 
 def parse_image_filename(filename: str) -> Optional[Dict[str, str]]:
@@ -54,16 +75,21 @@ def setup_r2_client(
     account_id: str,
     access_key_id: str,
     secret_access_key: str,
-    endpoint_url: Optional[str] = None
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = R2_DOWNLOAD_WORKERS
 ) -> boto3.client:
     """
     Configura y retorna un cliente de boto3 para Cloudflare R2.
     
+    El cliente es seguro entre hilos: las descargas concurrentes lo comparten y
+    reutilizan las conexiones de su pool en lugar de abrir una por archivo.
+    
     Args:
         account_id: ID de cuenta de Cloudflare
         access_key_id: Clave de acceso de R2
         secret_access_key: Clave secreta de R2
         endpoint_url: URL del endpoint de R2 (opcional, se genera automáticamente si no se proporciona)
+        max_pool_connections: Tamaño del pool de conexiones (al menos el número de hilos de descarga)
         
     Returns:
         Cliente de boto3 configurado para R2
@@ -75,7 +101,12 @@ def setup_r2_client(
         's3',
         endpoint_url=endpoint_url,
         aws_access_key_id=access_key_id,
-        aws_secret_access_key=secret_access_key
+        aws_secret_access_key=secret_access_key,
+        config=Config(
+            max_pool_connections=max(max_pool_connections, 10),
+            # Los reintentos por objeto se manejan en download_object
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
     )
     
     return s3_client
@@ -119,6 +150,154 @@ def list_verified_images(
         return []
 
 
+def download_object(
+    s3_client: boto3.client,
+    bucket_name: str,
+    key: str,
+    dest_path: str,
+    retries: int = R2_DOWNLOAD_RETRIES,
+    backoff: float = R2_RETRY_BACKOFF,
+    sleep: Callable[[float], None] = time.sleep
+) -> int:
+    """
+    Descarga un objeto a dest_path con reintentos y backoff exponencial con jitter.
+    
+    Se escribe primero a un archivo temporal y se renombra al terminar, de modo que
+    una descarga interrumpida nunca deja una imagen truncada en el dataset.
+    
+    Returns:
+        Número de bytes descargados
+    """
+    tmp_path = f"{dest_path}.part"
+    attempt = 0
+    while True:
+        try:
+            s3_client.download_file(bucket_name, key, tmp_path, Config=SINGLE_THREAD_TRANSFER)
+            os.replace(tmp_path, dest_path)
+            return os.path.getsize(dest_path)
+        except (ClientError, BotoCoreError, OSError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            code = e.response.get('Error', {}).get('Code') if isinstance(e, ClientError) else None
+            if isinstance(e, NoCredentialsError) or code in NON_RETRYABLE_ERRORS or attempt >= retries:
+                raise
+            attempt += 1
+            sleep(backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+
+class IngestTranscoder:
+    """
+    Convierte cada imagen descargada en una versión lista para entrenar: el lado corto se
+    reduce a short_side px (las más pequeñas se guardan tal cual) y se guarda en el formato
+    de su extensión, con calidad fija para JPEG y WebP. Todos los consumidores redimensionan
+    a 128x128, así que el original a resolución completa solo ocupa disco y tiempo de
+    decodificación en cada época.
+
+    Args:
+        base_dir: Directorio de las imágenes (DATA_DIR/<modelo>/train)
+        short_side: Lado corto máximo en píxeles
+        quality: Calidad JPEG/WebP
+        originals_dir: Directorio al que se mueven los originales con la misma ruta relativa;
+            por defecto DATA_DIR/<modelo>/originals, junto a base_dir
+        discard_originals: Borrar los originales en lugar de conservarlos (solo si no hay originals_dir)
+    """
+
+    SAVE_OPTIONS = {'JPEG': 'quality', 'WEBP': 'quality'}
+
+    def __init__(self, base_dir: str, short_side: int = INGEST_SHORT_SIDE, quality: int = INGEST_QUALITY,
+                 originals_dir: Optional[str] = INGEST_ORIGINALS_DIR,
+                 discard_originals: bool = INGEST_DISCARD_ORIGINALS):
+        self.base_dir = base_dir
+        self.short_side = short_side
+        self.quality = quality
+        # Un original solo se borra si se pidió de forma explícita
+        if originals_dir is None and not discard_originals:
+            originals_dir = os.path.join(os.path.dirname(os.path.normpath(base_dir)), 'originals')
+        self.originals_dir = originals_dir
+
+    def process(self, original_path: str, dest_path: str):
+        """
+        Escribe en dest_path (vía .part y os.replace) la versión reducida de original_path
+        y luego conserva o elimina el original.
+
+        Returns:
+            tuple: (bytes guardados, segundos de transcodificación)
+        """
+        started = time.perf_counter()
+        tmp_path = f"{dest_path}.part"
+        try:
+            with Image.open(original_path) as image:
+                width, height = image.size
+                scale = self.short_side / min(width, height)
+                if scale < 1:
+                    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                    # En JPEG, draft decodifica directamente a una escala reducida >= size
+                    image.draft('RGB', size)
+                    extension = os.path.splitext(dest_path)[1].lower()
+                    image_format = Image.registered_extensions().get(extension, image.format)
+                    resized = image.convert('RGB').resize(size, Image.LANCZOS, reducing_gap=2.0)
+                    options = {self.SAVE_OPTIONS[image_format]: self.quality} if image_format in self.SAVE_OPTIONS else {}
+                    resized.save(tmp_path, format=image_format, **options)
+            if scale >= 1:
+                # Ya es suficientemente pequeña: se guarda el original sin recomprimir
+                shutil.copyfile(original_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if self.originals_dir:
+            original_dest = os.path.join(self.originals_dir, os.path.relpath(dest_path, self.base_dir))
+            os.makedirs(os.path.dirname(original_dest), exist_ok=True)
+            os.replace(original_path, original_dest)
+        else:
+            os.remove(original_path)
+        return os.path.getsize(dest_path), time.perf_counter() - started
+
+
+class DownloadProgress:
+    """
+    Contador de progreso compartido entre hilos de descarga. Imprime un resumen
+    periódico (cada interval segundos) en lugar de una línea por archivo.
+    """
+
+    def __init__(self, total: int, interval: float = 5.0):
+        self.total = total
+        self.interval = interval
+        self.stats = {'downloaded': 0, 'skipped': 0, 'errors': 0, 'bytes': 0,
+                      'transcoded': 0, 'stored_bytes': 0, 'transcode_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_report = self._started
+
+    def record(self, outcome: str, nbytes: int = 0, transcode: Optional[tuple] = None):
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats['bytes'] += nbytes
+            if transcode:
+                stored_bytes, seconds = transcode
+                self.stats['transcoded'] += 1
+                self.stats['stored_bytes'] += stored_bytes
+                self.stats['transcode_seconds'] += seconds
+            elif outcome == 'downloaded':
+                self.stats['stored_bytes'] += nbytes
+            now = time.perf_counter()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self._report(now)
+
+    def _report(self, now):
+        done = self.stats['downloaded'] + self.stats['errors']
+        elapsed = now - self._started
+        print(f"📊 Progreso: {done}/{self.total} ({self.stats['errors']} errores), "
+              f"{self.stats['bytes'] / 1e6:.1f} MB, {done / elapsed:.1f} img/s, "
+              f"{self.stats['bytes'] / 1e6 / elapsed:.2f} MB/s")
+
+    def summary(self) -> Dict[str, float]:
+        seconds = time.perf_counter() - self._started
+        return dict(self.stats, seconds=seconds)
+
+
 def download_and_organize_images(
     s3_client: boto3.client,
     bucket_name: str,
@@ -126,12 +305,18 @@ def download_and_organize_images(
     access_key_id: str = None,
     secret_access_key: str = None,
     prefix: str = "",
-    base_dir: str = None
+    base_dir: str = None,
+    workers: int = R2_DOWNLOAD_WORKERS,
+    short_side: int = INGEST_SHORT_SIDE
 ) -> Dict[str, int]:
     """
     Descarga imágenes verificadas del bucket de Cloudflare R2 y las organiza
     en directorios según especie y estado.
     
+    Las descargas se ejecutan en paralelo con workers hilos sobre el mismo cliente,
+    cada objeto con sus propios reintentos. Con short_side > 0 cada imagen se guarda
+    reducida (ver IngestTranscoder).
+    
     Args:
         s3_client: Cliente de boto3 configurado (o None si se proporcionan credenciales)
         bucket_name: Nombre del bucket de R2
@@ -140,15 +325,18 @@ def download_and_organize_images(
         secret_access_key: Clave secreta de R2 (necesario si s3_client es None)
         prefix: Prefijo para filtrar archivos (opcional)
         base_dir: Directorio base donde guardar las imágenes (por defecto usa DATA_DIR/especies/train)
+        workers: Número de descargas simultáneas
+        short_side: Lado corto de las imágenes guardadas (0 guarda los originales)
         
     Returns:
-        Dict con estadísticas de descarga: {'downloaded': int, 'skipped': int, 'errors': int}
+        Dict con estadísticas de descarga: {'downloaded': int, 'skipped': int, 'errors': int,
+        'bytes': int, 'seconds': float, 'transcoded': int, 'stored_bytes': int, 'transcode_seconds': float}
     """
     # Si no se proporciona s3_client, crear uno
     if s3_client is None:
         if not all([account_id, access_key_id, secret_access_key]):
             raise ValueError("Debe proporcionar s3_client o todas las credenciales (account_id, access_key_id, secret_access_key)")
-        s3_client = setup_r2_client(account_id, access_key_id, secret_access_key)
+        s3_client = setup_r2_client(account_id, access_key_id, secret_access_key, max_pool_connections=workers)
     
     # Configurar directorio base
     if base_dir is None:
@@ -160,61 +348,119 @@ def download_and_organize_images(
     
     if not verified_images:
         print("⚠️  No se encontraron imágenes verificadas para descargar")
-        return {'downloaded': 0, 'skipped': 0, 'errors': 0}
+        return {'downloaded': 0, 'skipped': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0}
     
-    stats = {'downloaded': 0, 'skipped': 0, 'errors': 0}
+    # Resolver destino de cada imagen y descartar las que ya están en disco
+    pending = []
+    skipped = 0
+    unparsed = 0
+    for image_key in verified_images:
+        parsed = parse_image_filename(image_key)
+        if not parsed:
+            unparsed += 1
+            skipped += 1
+            continue
+        
+        # Directorio destino: data/especies/train/especie_estado/
+        dest_dir = os.path.join(base_dir, f"{parsed['especie']}_{parsed['estado']}")
+        dest_path = os.path.join(dest_dir, parsed['original_filename'])
+        if os.path.exists(dest_path):
+            skipped += 1
+            continue
+        pending.append((image_key, dest_dir, dest_path))
     
-    print(f"\n📥 Iniciando descarga de {len(verified_images)} imágenes...")
+    if unparsed:
+        print(f"⚠️  {unparsed} claves no siguen el patrón especie_estado_..._verified y se omitieron")
     
-    for image_key in verified_images:
+    print(f"\n📥 Iniciando descarga de {len(pending)} imágenes con {workers} hilos ({skipped} ya existentes u omitidas)...")
+    transcoder = IngestTranscoder(base_dir, short_side) if short_side > 0 else None
+    stats, completed = download_objects(s3_client, bucket_name, pending, workers, transcoder)
+    stats['skipped'] += skipped
+    _print_download_summary(stats)
+    _ingest_into_catalog(base_dir, {
+        os.path.relpath(dest_path, base_dir): f"r2:{key}" for key, _, dest_path in pending if key in completed
+    }, stats)
+    return stats
+
+
+def download_objects(
+    s3_client: boto3.client,
+    bucket_name: str,
+    items: List[tuple],
+    workers: int = R2_DOWNLOAD_WORKERS,
+    transcoder: Optional[IngestTranscoder] = None
+):
+    """
+    Descarga en paralelo una lista de (clave, directorio destino, ruta destino).
+    Con transcoder, cada imagen se transcodifica en el mismo hilo apenas termina de descargarse.
+    
+    Returns:
+        tuple: (estadísticas, conjunto de claves descargadas correctamente)
+    """
+    progress = DownloadProgress(len(items))
+    completed = set()
+    
+    def download(item):
+        image_key, dest_dir, dest_path = item
+        os.makedirs(dest_dir, exist_ok=True)
+        if transcoder is None:
+            return download_object(s3_client, bucket_name, image_key, dest_path), None
+        # El original se descarga junto al destino con una extensión que el catálogo ignora
+        original_path = f"{dest_path}.orig"
+        nbytes = download_object(s3_client, bucket_name, image_key, original_path)
         try:
-            # Parsear nombre del archivo
-            parsed = parse_image_filename(image_key)
-            
-            if not parsed:
-                print(f"⚠️  No se pudo parsear: {image_key}")
-                stats['skipped'] += 1
-                continue
-            
-            especie = parsed['especie']
-            estado = parsed['estado']
-            original_filename = parsed['original_filename']
-            
-            # Crear directorio destino: data/especies/train/especie_estado/
-            dest_dir = os.path.join(base_dir, f"{especie}_{estado}")
-            os.makedirs(dest_dir, exist_ok=True)
-            
-            # Ruta completa del archivo destino
-            dest_path = os.path.join(dest_dir, original_filename)
-            
-            # Verificar si el archivo ya existe
-            if os.path.exists(dest_path):
-                stats['skipped'] += 1
-                continue
-            
-            # Descargar imagen
-            print(f"⬇️  Descargando: {original_filename} -> {especie}_{estado}/")
-            s3_client.download_file(bucket_name, image_key, dest_path)
-            
-            stats['downloaded'] += 1
-            
-            # Mostrar progreso cada 50 imágenes
-            if stats['downloaded'] % 50 == 0:
-                print(f"📊 Progreso: {stats['downloaded']} descargadas, {stats['skipped']} omitidas, {stats['errors']} errores")
-        
-        except ClientError as e:
-            print(f"❌ Error descargando {image_key}: {e}")
-            stats['errors'] += 1
-        except Exception as e:
-            print(f"❌ Error inesperado con {image_key}: {e}")
-            stats['errors'] += 1
-    
-    print(f"\n✅ Descarga completada:")
-    print(f"   - Descargadas: {stats['downloaded']}")
+            return nbytes, transcoder.process(original_path, dest_path)
+        except Exception:
+            if os.path.exists(original_path):
+                os.remove(original_path)
+            raise
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='r2-download') as pool:
+        futures = {pool.submit(download, item): item[0] for item in items}
+        for future in as_completed(futures):
+            try:
+                nbytes, transcode = future.result()
+                progress.record('downloaded', nbytes, transcode)
+                completed.add(futures[future])
+            except Exception as e:
+                print(f"❌ Error descargando {futures[future]}: {e}")
+                progress.record('errors')
+    
+    return progress.summary(), completed
+
+
+def _ingest_into_catalog(base_dir: str, sources: Dict[str, str], stats: Dict):
+    """
+    Registra las imágenes descargadas en el catálogo y detecta los casi duplicados (según
+    DEDUP_MODE); agrega a stats cuántos hay y cuánto se redujo el dataset. Solo aplica a directorios DATA_DIR/<modelo>/train.
+    """
+    train_root = os.path.dirname(os.path.normpath(base_dir))
+    if os.path.normpath(os.path.dirname(train_root)) != os.path.normpath(DATA_DIR):
+        return
+    model_name = os.path.basename(train_root)
+    dataset_catalog.record_sources(model_name, sources, base_dir)
+    dedupe_stats = dataset_catalog.dedupe(model_name, base_dir)
+    if dedupe_stats:
+        stats.update(
+            near_duplicates=dedupe_stats['duplicates'],
+            new_near_duplicates=dedupe_stats['new_duplicates'],
+            dataset_shrink_pct=dedupe_stats['shrink_pct'],
+        )
+
+
+def _print_download_summary(stats: Dict[str, float]):
+    seconds = stats['seconds']
+    print(f"\n✅ Descarga completada en {seconds:.1f}s:")
+    print(f"   - Descargadas: {stats['downloaded']} ({stats['bytes'] / 1e6:.1f} MB)")
     print(f"   - Omitidas: {stats['skipped']}")
     print(f"   - Errores: {stats['errors']}")
-    
-    return stats
+    if seconds > 0 and stats['downloaded']:
+        print(f"   - Throughput: {stats['downloaded'] / seconds:.1f} img/s, {stats['bytes'] / 1e6 / seconds:.2f} MB/s")
+    if stats.get('transcoded'):
+        transcode_seconds = stats['transcode_seconds']
+        print(f"   - Transcodificadas: {stats['transcoded']} ({stats['bytes'] / 1e6:.1f} MB -> "
+              f"{stats['stored_bytes'] / 1e6:.1f} MB en disco), {transcode_seconds:.1f}s de transcodificación, "
+              f"{stats['transcoded'] / transcode_seconds if transcode_seconds > 0 else 0.0:.1f} img/s por hilo")
 
 
 def download_verified_images_from_r2(
@@ -223,7 +469,8 @@ def download_verified_images_from_r2(
     access_key_id: str,
     secret_access_key: str,
     prefix: str = "",
-    base_dir: str = None
+    base_dir: str = None,
+    workers: int = R2_DOWNLOAD_WORKERS
 ) -> Dict[str, int]:
     """
     Función principal para descargar imágenes verificadas de Cloudflare R2.
@@ -237,6 +484,7 @@ def download_verified_images_from_r2(
         secret_access_key: Clave secreta de R2
         prefix: Prefijo para filtrar archivos en el bucket (opcional)
         base_dir: Directorio base donde guardar las imágenes (opcional, por defecto usa DATA_DIR/especies/train)
+        workers: Número de descargas simultáneas (opcional, por defecto R2_DOWNLOAD_WORKERS)
         
     Returns:
         Dict con estadísticas de descarga
@@ -250,11 +498,220 @@ def download_verified_images_from_r2(
         ... )
         >>> print(f"Descargadas: {stats['downloaded']}")
     """
-    s3_client = setup_r2_client(account_id, access_key_id, secret_access_key)
+    s3_client = setup_r2_client(account_id, access_key_id, secret_access_key, max_pool_connections=workers)
     return download_and_organize_images(
         s3_client=s3_client,
         bucket_name=bucket_name,
         prefix=prefix,
-        base_dir=base_dir
+        base_dir=base_dir,
+        workers=workers
     )
 
+
+def list_verified_objects(
+    s3_client: boto3.client,
+    bucket_name: str,
+    prefix: str = "",
+    start_after: Optional[str] = None
+) -> List[Dict]:
+    """
+    Lista las imágenes verificadas con sus metadatos, opcionalmente solo las claves
+    posteriores (en orden lexicográfico) a start_after.
+    
+    Returns:
+        Lista de dicts con 'key', 'etag', 'size' y 'last_modified'
+    """
+    params = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    
+    objects = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(**params):
+        for obj in page.get('Contents', []):
+            if 'verified' not in obj['Key'].lower():
+                continue
+            last_modified = obj.get('LastModified')
+            objects.append({
+                'key': obj['Key'],
+                'etag': obj.get('ETag', '').strip('"'),
+                'size': obj.get('Size', 0),
+                'last_modified': last_modified.isoformat() if hasattr(last_modified, 'isoformat') else last_modified,
+            })
+    return objects
+
+
+def load_manifest(manifest_path: str, bucket_name: str, prefix: str) -> Dict:
+    """
+    Carga el manifest local de la última sincronización. Si no existe o corresponde
+    a otro bucket/prefijo se retorna uno vacío.
+    """
+    empty = {'bucket': bucket_name, 'prefix': prefix, 'high_water_mark': None, 'objects': {}}
+    if not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Manifest de R2 ilegible, se reconstruirá: {e}")
+        return empty
+    if manifest.get('bucket') != bucket_name or manifest.get('prefix') != prefix:
+        print("⚠️  El manifest de R2 corresponde a otro bucket o prefijo, se reconstruirá")
+        return empty
+    return manifest
+
+
+def save_manifest(manifest_path: str, manifest: Dict):
+    """Guarda el manifest de forma atómica (archivo temporal + rename)"""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def sync_verified_images(
+    s3_client: boto3.client,
+    bucket_name: str,
+    prefix: str = "",
+    base_dir: str = None,
+    manifest_path: str = None,
+    mode: str = R2_SYNC_MODE,
+    delete: bool = R2_SYNC_DELETE,
+    workers: int = R2_DOWNLOAD_WORKERS,
+    short_side: int = INGEST_SHORT_SIDE
+) -> Dict[str, int]:
+    """
+    Sincroniza base_dir con el bucket usando un manifest local en lugar de comprobar
+    cada archivo en disco, de modo que el costo depende de lo que cambió. Con
+    short_side > 0 cada imagen se guarda reducida (ver IngestTranscoder).
+    
+    Args:
+        s3_client: Cliente de boto3 configurado
+        bucket_name: Nombre del bucket de R2
+        prefix: Prefijo para filtrar archivos (opcional)
+        base_dir: Directorio base de las imágenes (por defecto DATA_DIR/especies/train)
+        manifest_path: Ruta del manifest (por defecto junto a base_dir, r2_manifest.json)
+        mode: 'diff', 'incremental' o 'full' (ver R2_SYNC_MODE)
+        delete: Borrar los archivos locales cuyos objetos ya no están en el bucket
+        workers: Número de descargas simultáneas
+        short_side: Lado corto de las imágenes guardadas (0 guarda los originales)
+        
+    Returns:
+        Dict con estadísticas: {'new', 'changed', 'removed', 'delta_bytes', 'downloaded',
+        'skipped', 'errors', 'deleted', 'bytes', 'seconds', 'transcoded', 'stored_bytes',
+        'transcode_seconds'} y, si se detectan casi duplicados,
+        {'near_duplicates', 'new_near_duplicates', 'dataset_shrink_pct'}
+    """
+    if mode not in ('diff', 'incremental', 'full'):
+        raise ValueError(f"Modo de sincronización inválido: {mode}")
+    if base_dir is None:
+        base_dir = os.path.join(DATA_DIR, 'especies', 'train')
+    if manifest_path is None:
+        manifest_path = R2_MANIFEST_PATH or os.path.join(os.path.dirname(os.path.normpath(base_dir)), 'r2_manifest.json')
+    os.makedirs(base_dir, exist_ok=True)
+    
+    manifest = load_manifest(manifest_path, bucket_name, prefix)
+    if mode == 'full':
+        manifest['objects'] = {}
+    known = manifest['objects']
+    
+    # Con el modo incremental solo se listan las claves posteriores a la última vista
+    start_after = manifest['high_water_mark'] if mode == 'incremental' and known else None
+    listed = list_verified_objects(s3_client, bucket_name, prefix, start_after)
+    
+    pending, adopted = [], 0
+    stats = {'new': 0, 'changed': 0, 'removed': 0, 'delta_bytes': 0, 'skipped': 0, 'deleted': 0}
+    by_key = {}
+    for obj in listed:
+        key = obj['key']
+        parsed = parse_image_filename(key)
+        if not parsed:
+            stats['skipped'] += 1
+            continue
+        dest_dir = os.path.join(base_dir, f"{parsed['especie']}_{parsed['estado']}")
+        dest_path = os.path.join(dest_dir, parsed['original_filename'])
+        obj['path'] = os.path.relpath(dest_path, base_dir)
+        by_key[key] = obj
+        
+        entry = known.get(key)
+        if entry and entry['etag'] == obj['etag'] and entry['size'] == obj['size']:
+            continue
+        if not entry and os.path.exists(dest_path) and (short_side > 0 or os.path.getsize(dest_path) == obj['size']):
+            # Archivo descargado antes de existir el manifest: se adopta sin descargarlo
+            # (uno transcodificado no conserva el tamaño del objeto, basta con que exista)
+            known[key] = obj
+            adopted += 1
+            continue
+        stats['changed' if entry else 'new'] += 1
+        stats['delta_bytes'] += obj['size']
+        pending.append((key, dest_dir, dest_path))
+    
+    # Los objetos eliminados solo se detectan cuando se lista el bucket completo
+    removed = [] if start_after else [key for key in known if key not in by_key]
+    stats['removed'] = len(removed)
+    
+    print(f"🔄 Sincronización R2 ({mode}): {len(listed)} objetos listados, "
+          f"{stats['new']} nuevos, {stats['changed']} modificados, {stats['removed']} eliminados, "
+          f"{stats['delta_bytes'] / 1e6:.1f} MB por descargar"
+          + (f", {adopted} adoptados del disco" if adopted else ""))
+    
+    transcoder = IngestTranscoder(base_dir, short_side) if short_side > 0 else None
+    download_stats, completed = download_objects(s3_client, bucket_name, pending, workers, transcoder)
+    for key in completed:
+        known[key] = by_key[key]
+    
+    for key in removed:
+        entry = known.pop(key)
+        if delete:
+            local_path = os.path.join(base_dir, entry['path'])
+            if os.path.exists(local_path):
+                os.remove(local_path)
+                stats['deleted'] += 1
+    
+    if by_key:
+        manifest['high_water_mark'] = max([manifest['high_water_mark'] or ''] + list(by_key))
+    save_manifest(manifest_path, manifest)
+    
+    stats.update(
+        downloaded=download_stats['downloaded'],
+        errors=download_stats['errors'],
+        bytes=download_stats['bytes'],
+        seconds=download_stats['seconds'],
+        transcoded=download_stats['transcoded'],
+        stored_bytes=download_stats['stored_bytes'],
+        transcode_seconds=download_stats['transcode_seconds'],
+    )
+    stats['skipped'] += len(by_key) - len(pending)
+    _print_download_summary(stats)
+    if stats['deleted']:
+        print(f"   - Eliminadas localmente: {stats['deleted']}")
+    # Registrar en el catálogo las imágenes ingresadas con su clave de origen en R2
+    _ingest_into_catalog(base_dir, {entry['path']: f"r2:{key}" for key, entry in known.items()}, stats)
+    return stats
+
+
+def sync_verified_images_from_r2(
+    bucket_name: str,
+    account_id: str,
+    access_key_id: str,
+    secret_access_key: str,
+    prefix: str = "",
+    base_dir: str = None,
+    mode: str = R2_SYNC_MODE,
+    delete: bool = R2_SYNC_DELETE,
+    workers: int = R2_DOWNLOAD_WORKERS
+) -> Dict[str, int]:
+    """
+    Igual que download_verified_images_from_r2, pero sincronizando contra el manifest local
+    (ver sync_verified_images).
+    """
+    s3_client = setup_r2_client(account_id, access_key_id, secret_access_key, max_pool_connections=workers)
+    return sync_verified_images(
+        s3_client=s3_client,
+        bucket_name=bucket_name,
+        prefix=prefix,
+        base_dir=base_dir,
+        mode=mode,
+        delete=delete,
+        workers=workers
+    )
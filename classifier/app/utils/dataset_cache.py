@@ -0,0 +1,213 @@
+import fcntl
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from ..config import DATASET_CACHE_DIR, DATASET_CACHE_WORKERS
+from ..preprocess import decode_image
+from .dataset_catalog import dataset_catalog
+
+INDEX_VERSION = 1
+
+
+class DatasetCache:
+    """
+    Cache persistente de un dataset ya decodificado: tensores uint8 de tamaño fijo
+    (por defecto 128x128x3) en un archivo binario que se lee con memoria mapeada,
+    más un índice JSON por ruta relativa con mtime, tamaño, hash y clase.
+
+    update() solo decodifica las imágenes nuevas o modificadas y las agrega al final;
+    las eliminadas dejan filas muertas que se compactan cuando superan la mitad del archivo.
+    Los archivos, sus hashes y las clases salen del DatasetCatalog, sin recorrer train_dir.
+
+    Args:
+        train_dir: Directorio con una subcarpeta por clase (DATA_DIR/<modelo>/train)
+        cache_dir: Directorio donde guardar images.u8 e index.json
+        target_size: Tamaño (ancho, alto) de las imágenes cacheadas
+        model_name: Modelo en el catálogo (por defecto, la carpeta que contiene train_dir)
+    """
+
+    def __init__(self, train_dir, cache_dir, target_size=(128, 128), model_name=None):
+        self.train_dir = train_dir
+        self.model_name = model_name or os.path.basename(os.path.dirname(os.path.normpath(train_dir)))
+        self.cache_dir = cache_dir
+        self.target_size = tuple(target_size)
+        self.row_shape = (target_size[1], target_size[0], 3)
+        self.row_bytes = int(np.prod(self.row_shape))
+        self.data_path = os.path.join(cache_dir, 'images.u8')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.entries = {}
+        self.rows = 0
+        self.class_names = []
+
+    @classmethod
+    def for_model(cls, model_name, train_dir, target_size=(128, 128)):
+        return cls(train_dir, os.path.join(DATASET_CACHE_DIR, model_name), target_size, model_name)
+
+    @contextmanager
+    def _locked(self):
+        # Evita que dos reentrenamientos actualicen el mismo cache a la vez
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        self.entries, self.rows = {}, 0
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Índice del cache de dataset ilegible, se reconstruirá: {e}")
+            return
+        if index.get('version') != INDEX_VERSION or tuple(index.get('target_size', ())) != self.target_size:
+            print("⚠️  Cache de dataset con formato distinto, se reconstruirá")
+            return
+        self.entries = index['entries']
+        self.rows = index['rows']
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'target_size': list(self.target_size),
+                'rows': self.rows,
+                'entries': self.entries,
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _scan(self):
+        """Retorna {ruta_relativa: fila del catálogo} de las imágenes en disco"""
+        return {row['path']: row for row in dataset_catalog.files(self.model_name, self.train_dir)}
+
+    def _decode(self, path):
+        with open(path, 'rb') as f:
+            return decode_image(f.read(), self.target_size)
+
+    def update(self, workers=DATASET_CACHE_WORKERS, shared=()):
+        """
+        Sincroniza el cache con train_dir decodificando solo lo nuevo o modificado.
+
+        Las imágenes que ya están en alguno de los caches de shared (mismo hash de contenido,
+        por ejemplo la misma foto en los datasets de especies y hojas) se copian de ahí en
+        lugar de decodificarse otra vez.
+
+        Returns:
+            dict: Estadísticas (total, reused, added, removed, errors, decode_seconds)
+        """
+        with self._locked():
+            self._load_index()
+            # Descartar bytes de una actualización interrumpida antes de guardar el índice
+            if os.path.exists(self.data_path) and os.path.getsize(self.data_path) != self.rows * self.row_bytes:
+                with open(self.data_path, 'r+b') as f:
+                    f.truncate(self.rows * self.row_bytes)
+
+            found = self._scan()
+            self.class_names = dataset_catalog.class_names(self.model_name, self.train_dir, refresh=False)
+            stats = {'reused': 0, 'added': 0, 'shared': 0, 'removed': 0, 'errors': 0, 'decode_seconds': 0.0}
+
+            removed = [rel_path for rel_path in self.entries if rel_path not in found]
+            for rel_path in removed:
+                del self.entries[rel_path]
+            stats['removed'] = len(removed)
+
+            pending = []
+            for rel_path, info in found.items():
+                entry = self.entries.get(rel_path)
+                if entry and entry['mtime_ns'] == info['mtime_ns'] and entry['size'] == info['size']:
+                    stats['reused'] += 1
+                    continue
+                if entry and entry['sha1'] == info['sha1']:
+                    # Solo cambió el mtime (por ejemplo, una copia): el tensor sigue siendo válido
+                    entry.update(mtime_ns=info['mtime_ns'], size=info['size'])
+                    stats['reused'] += 1
+                    continue
+                path = os.path.join(self.train_dir, rel_path)
+                pending.append((rel_path, info['class'], path, info, info['sha1']))
+
+            if pending:
+                print(f"🧩 Cache de dataset: decodificando {len(pending)} imágenes nuevas o modificadas...")
+                started = time.perf_counter()
+                donors = self._donors(shared)
+                with ThreadPoolExecutor(max_workers=workers) as pool, open(self.data_path, 'ab') as data_file:
+                    decoded = pool.map(lambda item: self._pixels_for(item[2], item[4], donors), pending)
+                    for (rel_path, class_name, path, info, sha1), (pixels, from_shared) in zip(pending, decoded):
+                        if pixels is None:
+                            stats['errors'] += 1
+                            continue
+                        stats['shared'] += from_shared
+                        data_file.write(pixels.tobytes())
+                        self.entries[rel_path] = {
+                            'row': self.rows,
+                            'class': class_name,
+                            'mtime_ns': info['mtime_ns'],
+                            'size': info['size'],
+                            'sha1': sha1,
+                        }
+                        self.rows += 1
+                        stats['added'] += 1
+                    data_file.flush()
+                    os.fsync(data_file.fileno())
+                stats['decode_seconds'] = time.perf_counter() - started
+
+            if self.rows > 1000 and len(self.entries) < self.rows // 2:
+                self._compact()
+            self._save_index()
+
+        stats['total'] = len(self.entries)
+        print(f"🧩 Cache de dataset: {stats['total']} imágenes ({stats['reused']} reutilizadas, "
+              f"{stats['added']} nuevas de las cuales {stats['shared']} copiadas de otro dataset, "
+              f"{stats['removed']} eliminadas, {stats['errors']} errores)")
+        return stats
+
+    def _donors(self, shared):
+        """Retorna {sha1: (imágenes, fila)} de los caches compartidos con el mismo tamaño de imagen"""
+        donors = {}
+        for cache in shared:
+            if cache is self or cache.row_shape != self.row_shape or not cache.entries:
+                continue
+            images = cache.images()
+            for entry in cache.entries.values():
+                donors.setdefault(entry['sha1'], (images, entry['row']))
+        return donors
+
+    def _pixels_for(self, path, sha1, donors):
+        """Retorna (píxeles, True si se copiaron de otro cache)"""
+        if sha1 in donors:
+            images, row = donors[sha1]
+            return np.array(images[row]), True
+        return self._safe_decode(path), False
+
+    def _safe_decode(self, path):
+        try:
+            return self._decode(path)
+        except Exception as e:
+            print(f"⚠️  No se pudo decodificar {path}: {e}")
+            return None
+
+    def _compact(self):
+        """Reescribe el archivo de datos sin las filas muertas"""
+        print(f"🧹 Compactando cache de dataset: {self.rows} filas -> {len(self.entries)}")
+        images = self.images()
+        tmp_path = f"{self.data_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for new_row, entry in enumerate(sorted(self.entries.values(), key=lambda e: e['row'])):
+                f.write(images[entry['row']].tobytes())
+                entry['row'] = new_row
+        del images
+        os.replace(tmp_path, self.data_path)
+        self.rows = len(self.entries)
+
+    def images(self):
+        """Retorna el array (filas, alto, ancho, 3) uint8 en memoria mapeada"""
+        if self.rows == 0:
+            return np.zeros((0,) + self.row_shape, dtype=np.uint8)
+        return np.memmap(self.data_path, dtype=np.uint8, mode='r', shape=(self.rows,) + self.row_shape)
@@ -0,0 +1,402 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+from ..config import DATA_DIR, DATASET_CATALOG_PATH, DATASET_CACHE_WORKERS, DEDUP_MODE, DEDUP_MAX_DISTANCE
+from .near_duplicates import load_gray, phash_batch, find_near_duplicates
+
+# Mismos formatos que el pipeline tf.data para que la división entrenamiento/validación coincida
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    model TEXT NOT NULL,
+    path TEXT NOT NULL,
+    class TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    sha1 TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'local',
+    split TEXT NOT NULL,
+    phash TEXT,
+    duplicate_of TEXT,
+    PRIMARY KEY (model, path)
+);
+CREATE INDEX IF NOT EXISTS images_by_class ON images (model, class, split);
+CREATE TABLE IF NOT EXISTS dirs (
+    model TEXT NOT NULL,
+    class TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (model, class)
+);
+CREATE TABLE IF NOT EXISTS splits (
+    model TEXT PRIMARY KEY,
+    validation_split REAL NOT NULL
+);
+"""
+
+# Columnas agregadas después de la primera versión del esquema
+MIGRATIONS = (('phash', 'TEXT'), ('duplicate_of', 'TEXT'))
+PHASH_BATCH_SIZE = 256
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_split(sha1, validation_split):
+    """
+    División determinista por hash de contenido: una imagen queda siempre en el mismo
+    conjunto aunque se agreguen o eliminen otras, y sus copias exactas no se reparten
+    entre entrenamiento y validación.
+    """
+    return 'val' if int(sha1[:8], 16) / 0x100000000 < validation_split else 'train'
+
+
+def _inspect(path):
+    """Retorna (sha1, ancho, alto); las dimensiones salen del encabezado sin decodificar la imagen"""
+    sha1 = file_sha1(path)
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except Exception:
+        width = height = None
+    return sha1, width, height
+
+
+class DatasetCatalog:
+    """
+    Índice persistente (SQLite) de las imágenes de DATA_DIR/<modelo>/train: ruta, clase,
+    tamaño, dimensiones, hash de contenido, origen (local o la clave de R2) y conjunto
+    asignado (train o val), más su pHash y, si es un casi duplicado, la imagen de la que
+    lo es (ver dedupe()). Los casi duplicados marcados no se usan para entrenar.
+
+    refresh() solo lista las carpetas de clase cuyo mtime cambió: agregar, eliminar o
+    renombrar un archivo (incluida la descarga a .part + os.replace) actualiza el mtime de
+    su carpeta. Un archivo sobrescrito en su lugar sin cambiar la carpeta requiere
+    refresh(full=True).
+
+    Args:
+        path: Archivo SQLite (DATASET_CATALOG_PATH)
+        data_dir: Directorio de datos (DATA_DIR)
+    """
+
+    def __init__(self, path=DATASET_CATALOG_PATH, data_dir=DATA_DIR, workers=DATASET_CACHE_WORKERS):
+        self.path = path
+        self.data_dir = data_dir
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def train_dir(self, model_name):
+        return os.path.join(self.data_dir, model_name, 'train')
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._initialized:
+                # WAL permite leer el catálogo mientras el proceso de entrenamiento lo actualiza
+                db.execute('PRAGMA journal_mode=WAL')
+                db.executescript(SCHEMA)
+                columns = {row[1] for row in db.execute('PRAGMA table_info(images)')}
+                for name, declaration in MIGRATIONS:
+                    if name not in columns:
+                        db.execute(f'ALTER TABLE images ADD COLUMN {name} {declaration}')
+                self._initialized = True
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def refresh(self, model_name, train_dir=None, full=False):
+        """
+        Actualiza el catálogo de model_name con los cambios en disco.
+
+        Returns:
+            dict: Estadísticas (dirs_scanned, added, updated, removed, errors, total, seconds)
+        """
+        train_dir = train_dir or self.train_dir(model_name)
+        started = time.perf_counter()
+        stats = {'dirs_scanned': 0, 'added': 0, 'updated': 0, 'removed': 0, 'errors': 0}
+        with self._lock, self._connect() as db:
+            validation_split = self._validation_split(db, model_name)
+            known_dirs = dict(db.execute('SELECT class, mtime_ns FROM dirs WHERE model = ?', (model_name,)))
+            current_dirs = {}
+            if os.path.isdir(train_dir):
+                for entry in os.scandir(train_dir):
+                    if entry.is_dir():
+                        current_dirs[entry.name] = entry.stat().st_mtime_ns
+
+            for class_name in set(known_dirs) - set(current_dirs):
+                stats['removed'] += db.execute(
+                    'DELETE FROM images WHERE model = ? AND class = ?', (model_name, class_name)
+                ).rowcount
+                db.execute('DELETE FROM dirs WHERE model = ? AND class = ?', (model_name, class_name))
+
+            for class_name, mtime_ns in current_dirs.items():
+                if not full and known_dirs.get(class_name) == mtime_ns:
+                    continue
+                stats['dirs_scanned'] += 1
+                # Se guarda el mtime leído antes de listar: lo que llegue durante el listado
+                # vuelve a cambiarlo y se detecta en el siguiente refresh
+                self._scan_class(db, model_name, train_dir, class_name, validation_split, stats)
+                db.execute('INSERT OR REPLACE INTO dirs (model, class, mtime_ns) VALUES (?, ?, ?)',
+                           (model_name, class_name, mtime_ns))
+
+            stats['total'] = db.execute('SELECT COUNT(*) FROM images WHERE model = ?', (model_name,)).fetchone()[0]
+        stats['seconds'] = time.perf_counter() - started
+        if stats['dirs_scanned']:
+            print(f"🗂️  Catálogo {model_name}: {stats['total']} imágenes ({stats['dirs_scanned']} carpetas revisadas, "
+                  f"{stats['added']} nuevas, {stats['updated']} modificadas, {stats['removed']} eliminadas, "
+                  f"{stats['errors']} errores) en {stats['seconds']:.2f}s")
+        return stats
+
+    def _scan_class(self, db, model_name, train_dir, class_name, validation_split, stats):
+        known = {
+            path: (size, mtime_ns) for path, size, mtime_ns in db.execute(
+                'SELECT path, size, mtime_ns FROM images WHERE model = ? AND class = ?', (model_name, class_name)
+            )
+        }
+        seen, pending = set(), []
+        for entry in os.scandir(os.path.join(train_dir, class_name)):
+            if not (entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)):
+                continue
+            rel_path = f"{class_name}/{entry.name}"
+            seen.add(rel_path)
+            stat = entry.stat()
+            if known.get(rel_path) != (stat.st_size, stat.st_mtime_ns):
+                pending.append((rel_path, entry.path, stat))
+
+        removed = [(model_name, rel_path) for rel_path in known if rel_path not in seen]
+        db.executemany('DELETE FROM images WHERE model = ? AND path = ?', removed)
+        stats['removed'] += len(removed)
+
+        def inspect(item):
+            try:
+                return _inspect(item[1])
+            except OSError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for (rel_path, path, stat), info in zip(pending, pool.map(inspect, pending)):
+                if info is None:
+                    stats['errors'] += 1
+                    continue
+                sha1, width, height = info
+                db.execute(
+                    """
+                    INSERT INTO images (model, path, class, size, mtime_ns, width, height, sha1, split)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (model, path) DO UPDATE SET
+                        size = excluded.size, mtime_ns = excluded.mtime_ns, width = excluded.width,
+                        height = excluded.height, sha1 = excluded.sha1, split = excluded.split,
+                        phash = NULL, duplicate_of = NULL
+                    """,
+                    (model_name, rel_path, class_name, stat.st_size, stat.st_mtime_ns, width, height,
+                     sha1, assign_split(sha1, validation_split))
+                )
+                stats['updated' if rel_path in known else 'added'] += 1
+
+    def _validation_split(self, db, model_name, validation_split=None):
+        """
+        Retorna la fracción de validación guardada para model_name; si se pide otra,
+        reasigna el conjunto de todas las imágenes del modelo.
+        """
+        row = db.execute('SELECT validation_split FROM splits WHERE model = ?', (model_name,)).fetchone()
+        if row and (validation_split is None or row[0] == validation_split):
+            return row[0]
+        validation_split = 0.2 if validation_split is None else validation_split
+        db.execute('INSERT OR REPLACE INTO splits (model, validation_split) VALUES (?, ?)',
+                   (model_name, validation_split))
+        if row:
+            print(f"🗂️  Catálogo {model_name}: reasignando la división con validation_split={validation_split}")
+            db.executemany(
+                'UPDATE images SET split = ? WHERE model = ? AND path = ?',
+                [(assign_split(sha1, validation_split), model_name, path) for path, sha1 in
+                 db.execute('SELECT path, sha1 FROM images WHERE model = ?', (model_name,)).fetchall()]
+            )
+        return validation_split
+
+    def class_names(self, model_name, train_dir=None, refresh=True):
+        """Clases (carpetas) de model_name en orden alfabético, incluidas las vacías"""
+        if refresh:
+            self.refresh(model_name, train_dir)
+        with self._connect() as db:
+            return [row[0] for row in db.execute('SELECT class FROM dirs WHERE model = ? ORDER BY class', (model_name,))]
+
+    def class_counts(self, model_name, train_dir=None, refresh=True):
+        """Retorna {clase: {'train': n, 'val': n, 'total': n, 'duplicates': n}}"""
+        counts = {name: {'train': 0, 'val': 0, 'total': 0, 'duplicates': 0}
+                  for name in self.class_names(model_name, train_dir, refresh)}
+        with self._connect() as db:
+            for class_name, split, duplicate, count in db.execute(
+                """
+                SELECT class, split, duplicate_of IS NOT NULL, COUNT(*) FROM images
+                WHERE model = ? GROUP BY class, split, duplicate_of IS NOT NULL
+                """, (model_name,)
+            ):
+                if duplicate:
+                    counts[class_name]['duplicates'] += count
+                else:
+                    counts[class_name][split] = count
+                    counts[class_name]['total'] += count
+        return counts
+
+    def files(self, model_name, train_dir=None, refresh=True, include_duplicates=False):
+        """Filas del catálogo de model_name (dicts) ordenadas por ruta relativa"""
+        if refresh:
+            self.refresh(model_name, train_dir)
+        query = 'SELECT * FROM images WHERE model = ?'
+        if not include_duplicates:
+            query += ' AND duplicate_of IS NULL'
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute(query + ' ORDER BY path', (model_name,))]
+
+    def split(self, model_name, validation_split, train_dir=None, refresh=True):
+        """
+        División entrenamiento/validación guardada en el catálogo.
+
+        Returns:
+            tuple: (clases, [(ruta_relativa, etiqueta)] de train, [(ruta_relativa, etiqueta)] de val)
+        """
+        class_names = self.class_names(model_name, train_dir, refresh)
+        labels = {name: label for label, name in enumerate(class_names)}
+        train, val = [], []
+        with self._connect() as db:
+            self._validation_split(db, model_name, validation_split)
+            for path, class_name, split in db.execute(
+                """
+                SELECT path, class, split FROM images
+                WHERE model = ? AND duplicate_of IS NULL ORDER BY class, path
+                """, (model_name,)
+            ):
+                (val if split == 'val' else train).append((path, labels[class_name]))
+        return class_names, train, val
+
+    def dedupe(self, model_name, train_dir=None, mode=DEDUP_MODE, max_distance=DEDUP_MAX_DISTANCE):
+        """
+        Detecta casi duplicados dentro de cada clase: calcula en lotes el pHash de las imágenes
+        que aún no lo tienen y busca los cercanos con un árbol BK. De cada grupo se conserva
+        la primera imagen por ruta. Con mode='report' solo se listan en el log (y se quitan
+        las marcas de ejecuciones anteriores); con mode='exclude' los duplicados quedan
+        marcados en el catálogo y no se usan para entrenar; con mode='quarantine' además se
+        mueven a DATA_DIR/<modelo>/quarantine/<clase>. Cada archivo excluido se registra en
+        el log junto con la imagen conservada.
+
+        Returns:
+            dict: Estadísticas (hashed, before, duplicates, new_duplicates, quarantined,
+            after, shrink_pct, excluded_bytes, seconds) o None si mode='off'
+        """
+        if mode == 'off':
+            return None
+        train_dir = train_dir or self.train_dir(model_name)
+        started = time.perf_counter()
+        self.refresh(model_name, train_dir)
+        with self._connect() as db:
+            pending = [row[0] for row in db.execute(
+                'SELECT path FROM images WHERE model = ? AND phash IS NULL ORDER BY path', (model_name,)
+            )]
+        hashed = self._compute_phashes(model_name, train_dir, pending)
+
+        with self._lock, self._connect() as db:
+            rows = db.execute(
+                'SELECT path, class, phash, size, duplicate_of FROM images WHERE model = ? ORDER BY path', (model_name,)
+            ).fetchall()
+            by_class = {}
+            for path, class_name, phash, _, _ in rows:
+                if phash:
+                    by_class.setdefault(class_name, []).append((path, int(phash, 16)))
+            duplicates = {}
+            for items in by_class.values():
+                duplicates.update(find_near_duplicates(items, max_distance))
+            previous = {path: duplicate_of for path, _, _, _, duplicate_of in rows}
+            excluded = duplicates if mode != 'report' else {}
+            db.executemany(
+                'UPDATE images SET duplicate_of = ? WHERE model = ? AND path = ?',
+                [(excluded.get(path, (None,))[0], model_name, path)
+                 for path in previous if excluded.get(path, (None,))[0] != previous[path]]
+            )
+
+        sizes = {path: size for path, _, _, size, _ in rows}
+        stats = {
+            'hashed': hashed,
+            'before': len(rows),
+            'duplicates': len(duplicates),
+            'new_duplicates': sum(1 for path, (keeper, _) in duplicates.items() if previous[path] != keeper),
+            'quarantined': 0,
+            'after': len(rows) - len(excluded),
+            'shrink_pct': 100.0 * len(excluded) / len(rows) if rows else 0.0,
+            'excluded_bytes': sum(sizes[path] for path in excluded),
+        }
+        if mode == 'quarantine' and duplicates:
+            quarantine_dir = os.path.join(os.path.dirname(os.path.normpath(train_dir)), 'quarantine')
+            for path in duplicates:
+                dest = os.path.join(quarantine_dir, path)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.move(os.path.join(train_dir, path), dest)
+                stats['quarantined'] += 1
+            self.refresh(model_name, train_dir)
+        stats['seconds'] = time.perf_counter() - started
+
+        action = {'report': 'detectadas (no se excluyen)', 'quarantine': 'en cuarentena'}.get(
+            mode, 'excluidas del entrenamiento'
+        )
+        print(f"📉 Casi duplicados en {model_name}: {stats['duplicates']} de {stats['before']} imágenes {action} "
+              f"({stats['new_duplicates']} nuevos; dataset {stats['shrink_pct']:.1f}% más pequeño, "
+              f"{stats['excluded_bytes'] / 1e6:.1f} MB; {hashed} pHash calculados en {stats['seconds']:.2f}s)")
+        # Los archivos recién excluidos (o todos los detectados, en 'report'), con la imagen conservada
+        for path, (keeper, distance) in sorted(duplicates.items()):
+            if mode == 'report' or previous[path] != keeper:
+                print(f"   - {path}: casi duplicado de {keeper} (distancia {distance})")
+        return stats
+
+    def _compute_phashes(self, model_name, train_dir, paths):
+        """Calcula y guarda el pHash de paths en lotes; las imágenes ilegibles quedan con pHash vacío"""
+        def load(rel_path):
+            try:
+                return load_gray(os.path.join(train_dir, rel_path))
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, len(paths), PHASH_BATCH_SIZE):
+                batch = paths[start:start + PHASH_BATCH_SIZE]
+                grays = list(pool.map(load, batch))
+                loaded = [(path, gray) for path, gray in zip(batch, grays) if gray is not None]
+                hashes = phash_batch(np.stack([gray for _, gray in loaded])) if loaded else []
+                updates = [(f"{int(value):016x}", model_name, path) for (path, _), value in zip(loaded, hashes)]
+                updates += [('', model_name, path) for path, gray in zip(batch, grays) if gray is None]
+                with self._connect() as db:
+                    db.executemany('UPDATE images SET phash = ? WHERE model = ? AND path = ?', updates)
+        return len(paths)
+
+    def record_sources(self, model_name, sources, train_dir=None):
+        """
+        Registra el origen de imágenes recién ingresadas ({ruta_relativa: origen}, por ejemplo
+        la clave de R2) después de actualizar el catálogo con ellas.
+        """
+        self.refresh(model_name, train_dir)
+        with self._connect() as db:
+            db.executemany(
+                'UPDATE images SET source = ? WHERE model = ? AND path = ?',
+                [(source, model_name, rel_path.replace(os.sep, '/')) for rel_path, source in sources.items()]
+            )
+
+
+dataset_catalog = DatasetCatalog()
@@ -0,0 +1,101 @@
+import glob
+import hashlib
+import os
+import numpy as np
+import tensorflow as tf
+
+
+def backbone_version(backbone):
+    """Versión del backbone como hash de sus pesos: cambia solo si cambian las capas congeladas"""
+    digest = hashlib.sha256()
+    for weight in backbone.get_weights():
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def build_backbone(model):
+    """Modelo que retorna la salida de la penúltima capa (la entrada de la capa de salida)"""
+    return tf.keras.Model(inputs=model.input, outputs=model.layers[-2].output)
+
+
+class EmbeddingCache:
+    """
+    Cache en disco de embeddings de la penúltima capa, por hash de imagen y versión del
+    backbone. Con un backbone nuevo (por ejemplo, tras un reentrenamiento completo) el
+    archivo anterior deja de ser válido y se reemplaza.
+
+    Args:
+        cache_dir: Directorio del cache (DATASET_CACHE_DIR/<modelo>)
+        version: Versión del backbone (ver backbone_version)
+    """
+
+    def __init__(self, cache_dir, version):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.path = os.path.join(cache_dir, f"embeddings-{version}.npz")
+        self.index = {}
+        self.vectors = None
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                self.vectors = data['vectors']
+                self.index = {key: row for row, key in enumerate(data['keys'].tolist())}
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, keys, vectors):
+        start = len(self.index)
+        for offset, key in enumerate(keys):
+            self.index[key] = start + offset
+        self.vectors = vectors if self.vectors is None else np.concatenate([self.vectors, vectors])
+
+    def lookup(self, keys):
+        return self.vectors[[self.index[key] for key in keys]]
+
+    def save(self):
+        """Guarda de forma atómica y elimina los embeddings de versiones anteriores del backbone"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        keys = np.array(sorted(self.index, key=self.index.get))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=keys, vectors=self.vectors)
+        os.replace(tmp_path, self.path)
+        for old in glob.glob(os.path.join(self.cache_dir, 'embeddings-*.npz')):
+            if old != self.path:
+                os.remove(old)
+
+    def update(self, backbone, images, rows, keys, batch_size=256):
+        """
+        Calcula los embeddings de las filas de images cuyo hash aún no está en el cache.
+
+        Args:
+            backbone: Modelo de build_backbone
+            images: Array uint8 (filas, alto, ancho, 3), por ejemplo DatasetCache.images()
+            rows: Filas del dataset
+            keys: Hash de la imagen de cada fila
+
+        Returns:
+            int: Número de embeddings calculados
+        """
+        pending = {}
+        for row, key in zip(rows, keys):
+            if key not in self.index and key not in pending:
+                pending[key] = row
+        if not pending:
+            return 0
+
+        print(f"🧠 Calculando {len(pending)} embeddings nuevos (backbone {self.version})...")
+        pending_keys = list(pending)
+        pending_rows = np.array([pending[key] for key in pending_keys])
+        vectors = []
+        for start in range(0, len(pending_rows), batch_size):
+            batch_rows = pending_rows[start:start + batch_size]
+            batch = images[np.sort(batch_rows)].astype(np.float32) / 255.0
+            order = np.argsort(np.argsort(batch_rows))
+            vectors.append(backbone(batch, training=False).numpy().reshape(len(batch_rows), -1)[order])
+        self.add(pending_keys, np.concatenate(vectors).astype(np.float32))
+        self.save()
+        return len(pending_keys)
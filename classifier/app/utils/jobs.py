@@ -0,0 +1,595 @@
+import fcntl
+import glob
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Estados terminales de un trabajo
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Modelo de los trabajos que reentrenan especies, hojas y plantas juntos
+ALL_MODELS = 'all'
+
+# Cada cuántos segundos un trabajo consulta en el JobStore si otro proceso pidió cancelarlo
+CANCEL_POLL_SECONDS = 1.0
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de un trabajo cuando se solicitó su cancelación"""
+
+
+class TrainingJob:
+    """
+    Estado de un trabajo de reentrenamiento. El trabajo lo actualiza con set_phase()
+    y update() mientras corre y consulta cancel_requested() entre fases y épocas.
+    Con store, cada cambio se guarda en el JobStore y la cancelación pedida desde otro
+    proceso se lee de él.
+    """
+
+    def __init__(self, model, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.model = model
+        self.params = dict(params or {})
+        self.status = 'queued'
+        self.phase = 'queued'
+        self.progress = {}
+        self.error = None
+        self.result = None
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.store = None
+        self._cancel = threading.Event()
+        self._cancel_polled = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_record(cls, record):
+        """Vista de solo lectura de un trabajo guardado en el JobStore (de cualquier proceso)"""
+        job = cls(record['model'], record['params'])
+        for field in ('id', 'status', 'phase', 'progress', 'error', 'result', 'requests',
+                      'created_at', 'started_at', 'finished_at'):
+            setattr(job, field, record[field])
+        if record['cancel_requested']:
+            job._cancel.set()
+        return job
+
+    def set_phase(self, phase):
+        with self._lock:
+            self.phase = phase
+        self.save()
+        print(f"🏷️  Trabajo {self.id} ({self.model}): {phase}")
+
+    def update(self, **fields):
+        with self._lock:
+            self.progress.update(fields)
+        self.save()
+
+    def save(self):
+        """Guarda el estado en el JobStore, si hay uno"""
+        if self.store is None:
+            return
+        with self._lock:
+            fields = {
+                'status': self.status,
+                'phase': self.phase,
+                'progress': self.progress,
+                'error': self.error,
+                'result': self.result,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+        try:
+            self.store.save(self.id, fields)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"⚠️  No se pudo guardar el estado del trabajo {self.id}: {e}")
+
+    def cancel_requested(self, poll=False):
+        """Indica si se pidió cancelar; con store consulta el JobStore como mucho cada CANCEL_POLL_SECONDS"""
+        if self._cancel.is_set() or self.store is None:
+            return self._cancel.is_set()
+        now = time.monotonic()
+        if poll or now - self._cancel_polled >= CANCEL_POLL_SECONDS:
+            self._cancel_polled = now
+            try:
+                if self.store.cancel_requested(self.id):
+                    self._cancel.set()
+            except sqlite3.Error as e:
+                print(f"⚠️  No se pudo consultar la cancelación del trabajo {self.id}: {e}")
+        return self._cancel.is_set()
+
+    def check_cancelled(self, poll=False):
+        """Lanza JobCancelled si se pidió cancelar; se llama en los puntos seguros del trabajo"""
+        if self.cancel_requested(poll):
+            raise JobCancelled(f"Trabajo {self.id} cancelado")
+
+    def describe(self):
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                'id': self.id,
+                'model': self.model,
+                'params': self.params,
+                'status': self.status,
+                'phase': self.phase,
+                'cancel_requested': self._cancel.is_set(),
+                'requests': self.requests,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed_seconds': elapsed,
+                **self.progress,
+                'error': self.error,
+                'result': self.result,
+            }
+
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    result TEXT,
+    requests INTEGER NOT NULL DEFAULT 1,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_host TEXT NOT NULL,
+    owner_pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, model);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    Registro de trabajos compartido entre procesos (SQLite), para que cualquier worker de
+    gunicorn pueda consultar, agrupar y cancelar trabajos de otro.
+
+    Cada trabajo lo ejecuta el proceso que lo creó (owner_host, owner_pid), que es el único
+    que escribe su estado; los demás solo incrementan requests al agrupar una solicitud y
+    marcan cancel_requested, que el dueño consulta entre fases y épocas. Los trabajos sin
+    terminar cuyo proceso dueño ya no existe (worker reciclado) se marcan como fallidos.
+
+    Args:
+        path: Archivo SQLite
+        history: Trabajos terminados que se conservan
+    """
+
+    def __init__(self, path, history=50):
+        self.path = path
+        self.history = history
+        self.host = socket.gethostname()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        if not self._initialized:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(JOBS_SCHEMA)
+            self._initialized = True
+        return db
+
+    @staticmethod
+    def _record(row):
+        record = dict(row)
+        record['params'] = json.loads(record['params'])
+        record['progress'] = json.loads(record['progress'])
+        record['result'] = json.loads(record['result']) if record['result'] is not None else None
+        return record
+
+    def _reap(self, db):
+        """Marca como fallidos los trabajos sin terminar cuyo proceso dueño (en este host) ya no existe"""
+        rows = db.execute(
+            "SELECT id, owner_pid FROM jobs WHERE status IN ('queued', 'running') AND owner_host = ?",
+            (self.host,)
+        ).fetchall()
+        for row in rows:
+            if not _pid_alive(row['owner_pid']):
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', phase = 'failed', finished_at = ?, "
+                    "error = 'El proceso que ejecutaba el trabajo terminó' WHERE id = ?",
+                    (time.time(), row['id'])
+                )
+
+    def submit(self, job):
+        """
+        Registra job como propio de este proceso, salvo que ya haya uno en cola para el mismo
+        modelo y parámetros (de cualquier proceso): en ese caso agrupa la solicitud en él.
+
+        Returns:
+            dict | None: Registro del trabajo existente, o None si se registró job
+        """
+        params = json.dumps(job.params, sort_keys=True)
+        db = self._connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            self._reap(db)
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' AND model = ? AND params = ? "
+                "AND cancel_requested = 0 ORDER BY created_at LIMIT 1",
+                (job.model, params)
+            ).fetchone()
+            if row is not None:
+                db.execute('UPDATE jobs SET requests = requests + 1 WHERE id = ?', (row['id'],))
+                record = self._record(db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+            else:
+                db.execute(
+                    "INSERT INTO jobs (id, model, params, status, phase, owner_host, owner_pid, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.model, params, job.status, job.phase, self.host, os.getpid(), job.created_at)
+                )
+                record = None
+            db.execute('COMMIT')
+            return record
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+    def save(self, job_id, fields):
+        db = self._connect()
+        try:
+            db.execute(
+                "UPDATE jobs SET status = ?, phase = ?, progress = ?, error = ?, result = ?, "
+                "started_at = ?, finished_at = ? WHERE id = ?",
+                (fields['status'], fields['phase'], json.dumps(fields['progress']), fields['error'],
+                 json.dumps(fields['result']) if fields['result'] is not None else None,
+                 fields['started_at'], fields['finished_at'], job_id)
+            )
+            if fields['status'] in FINISHED_STATUSES:
+                self._prune(db)
+        finally:
+            db.close()
+
+    def _prune(self, db):
+        db.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND id NOT IN ("
+            "SELECT id FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') "
+            "ORDER BY finished_at DESC LIMIT ?)",
+            (self.history,)
+        )
+
+    def get(self, job_id):
+        db = self._connect()
+        try:
+            self._reap(db)
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return self._record(row) if row is not None else None
+        finally:
+            db.close()
+
+    def list(self):
+        """Registros de los trabajos, del más antiguo al más reciente"""
+        db = self._connect()
+        try:
+            self._reap(db)
+            return [self._record(row) for row in db.execute('SELECT * FROM jobs ORDER BY created_at')]
+        finally:
+            db.close()
+
+    def cancel_requested(self, job_id):
+        db = self._connect()
+        try:
+            row = db.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return bool(row and row['cancel_requested'])
+        finally:
+            db.close()
+
+    def request_cancel(self, job_id):
+        """
+        Pide cancelar un trabajo: uno en cola pasa a cancelado de inmediato; uno corriendo lo
+        detiene su proceso dueño en el siguiente punto seguro.
+
+        Returns:
+            dict | None: Registro del trabajo
+        """
+        db = self._connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+                (job_id,)
+            )
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', phase = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            db.execute('COMMIT')
+            return self._record(row) if row is not None else None
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+
+class JobManager:
+    """
+    Cola de trabajos de reentrenamiento con límite de concurrencia.
+
+    Con concurrency='per_model' corre como máximo un trabajo por modelo a la vez; con
+    'global' corre max_running trabajos en total. Las solicitudes repetidas para un modelo
+    que ya tiene un trabajo en cola se agrupan en ese trabajo en lugar de encolar otro.
+
+    Con store (JobStore) los trabajos se registran en un archivo compartido: get(), list(),
+    cancel() y el agrupamiento de solicitudes ven los trabajos de todos los procesos, y
+    cada trabajo lo ejecuta el proceso que lo creó. Con lock_dir el límite se aplica también entre procesos
+    (varios workers de gunicorn) mediante archivos con flock: en 'global' un archivo por
+    cada uno de los max_running cupos; en 'per_model' uno por modelo más all.lock, que los
+    trabajos de un modelo toman compartido y los de todos los modelos exclusivo. Un trabajo
+    que no consigue su lock espera en la fase 'waiting_lock' y puede cancelarse.
+
+    Args:
+        run_job: Función run_job(job) que ejecuta el trabajo y retorna su resultado
+        concurrency: 'per_model' o 'global'
+        max_running: Trabajos simultáneos en modo 'global'
+        history: Trabajos terminados que se conservan para consulta
+        lock_dir: Directorio de los locks entre procesos (None: solo dentro del proceso)
+        lock_poll: Segundos entre intentos de tomar el lock
+        store: JobStore compartido entre procesos (None: los trabajos solo se ven en este proceso)
+    """
+
+    def __init__(self, run_job, concurrency='global', max_running=1, history=50, lock_dir=None, lock_poll=1.0,
+                 store=None):
+        if concurrency not in ('per_model', 'global'):
+            raise ValueError(f"Modo de concurrencia inválido: {concurrency}")
+        self.run_job = run_job
+        self.concurrency = concurrency
+        self.max_running = max(1, max_running)
+        self.history = history
+        self.lock_dir = lock_dir
+        self.lock_poll = lock_poll
+        self.store = store
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+
+    def submit(self, model, params=None):
+        """
+        Encola un trabajo para model. Si ya hay uno en cola para el mismo modelo y con los
+        mismos parámetros, retorna ese trabajo.
+
+        Returns:
+            tuple: (trabajo, True si la solicitud se agrupó en un trabajo existente)
+        """
+        params = dict(params or {})
+        if self.store is not None:
+            job = TrainingJob(model, params)
+            existing = self.store.submit(job)
+            if existing is not None:
+                return TrainingJob.from_record(existing), True
+            job.store = self.store
+            with self._lock:
+                self._jobs[job.id] = job
+                self._prune()
+            self._dispatch()
+            return job, False
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == 'queued' and job.model == model and job.params == params \
+                        and not job.cancel_requested():
+                    job.requests += 1
+                    return job, True
+            job = TrainingJob(model, params)
+            self._jobs[job.id] = job
+            self._prune()
+        self._dispatch()
+        return job, False
+
+    def cancel(self, job_id):
+        """
+        Cancela un trabajo: si está en cola no llega a ejecutarse; si está corriendo se
+        detiene en el siguiente punto seguro (entre épocas o fases) sin guardar el modelo.
+        Con store sirve para trabajos de cualquier proceso.
+        """
+        if self.store is not None:
+            record = self.store.request_cancel(job_id)
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job.status not in FINISHED_STATUSES:
+                    job._cancel.set()
+                    if job.status == 'queued':
+                        job.status = job.phase = 'cancelled'
+                        job.finished_at = time.time()
+            return TrainingJob.from_record(record) if record is not None else None
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            job._cancel.set()
+            if job.status == 'queued':
+                job.status = job.phase = 'cancelled'
+                job.finished_at = time.time()
+        return job
+
+    def get(self, job_id):
+        if self.store is not None:
+            record = self.store.get(job_id)
+            return TrainingJob.from_record(record) if record is not None else None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        if self.store is not None:
+            return [TrainingJob.from_record(record) for record in self.store.list()]
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self, model=None):
+        """Trabajos en cola o corriendo, opcionalmente solo los de model"""
+        with self._lock:
+            return [
+                job for job in self._jobs.values()
+                if job.status not in FINISHED_STATUSES and (model is None or job.model == model)
+            ]
+
+    def _can_start(self, job, running):
+        if self.concurrency == 'per_model':
+            # Un trabajo de todos los modelos entra en conflicto con cualquier otro
+            return all(
+                other.model != job.model and ALL_MODELS not in (other.model, job.model)
+                for other in running
+            )
+        return len(running) < self.max_running
+
+    def _dispatch(self):
+        """Inicia los trabajos en cola que el límite de concurrencia permite (en orden de llegada)"""
+        # Los trabajos en cola cancelados desde otro proceso no llegan a iniciarse
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job.status == 'queued']
+        cancelled = [job for job in queued if job.cancel_requested(poll=True)]
+        to_start = []
+        with self._lock:
+            for job in cancelled:
+                if job.status == 'queued':
+                    job.status = job.phase = 'cancelled'
+                    job.finished_at = job.finished_at or time.time()
+            running = [job for job in self._jobs.values() if job.status == 'running']
+            for job in self._jobs.values():
+                if job.status == 'queued' and self._can_start(job, running):
+                    job.status = 'running'
+                    job.started_at = time.time()
+                    running.append(job)
+                    to_start.append(job)
+        for job in to_start:
+            job.save()
+            threading.Thread(
+                target=self._run, args=(job,), name=f"train-{job.model}-{next(self._counter)}", daemon=True
+            ).start()
+
+    def _lock_specs(self, job):
+        """[(archivo de lock, modo de flock)] que job necesita; en 'global' cualquier cupo sirve"""
+        if self.concurrency == 'global':
+            return [[(f"slot-{i}.lock", fcntl.LOCK_EX)] for i in range(self.max_running)]
+        if job.model == ALL_MODELS:
+            return [[(f"{ALL_MODELS}.lock", fcntl.LOCK_EX)]]
+        return [[(f"{ALL_MODELS}.lock", fcntl.LOCK_SH), (f"{job.model}.lock", fcntl.LOCK_EX)]]
+
+    def _try_lock(self, job, specs):
+        """Toma sin bloquear todos los locks de specs; retorna los archivos abiertos o None"""
+        files = []
+        try:
+            for name, mode in specs:
+                lock_file = open(os.path.join(self.lock_dir, name), 'a+')
+                files.append((lock_file, mode))
+                fcntl.flock(lock_file, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            for lock_file, _ in files:
+                lock_file.close()
+            return None
+        holder = {'pid': os.getpid(), 'job_id': job.id, 'model': job.model, 'acquired_at': time.time()}
+        for lock_file, mode in files:
+            if mode == fcntl.LOCK_EX:
+                lock_file.truncate(0)
+                lock_file.write(json.dumps(holder))
+                lock_file.flush()
+        return files
+
+    def _acquire(self, job):
+        """Espera los locks entre procesos de job; lanza JobCancelled si se cancela mientras espera"""
+        if self.lock_dir is None:
+            return []
+        os.makedirs(self.lock_dir, exist_ok=True)
+        waiting = False
+        while True:
+            for specs in self._lock_specs(job):
+                files = self._try_lock(job, specs)
+                if files is not None:
+                    return files
+            if not waiting:
+                waiting = True
+                job.set_phase('waiting_lock')
+            job.check_cancelled()
+            time.sleep(self.lock_poll)
+
+    @staticmethod
+    def _release(files):
+        for lock_file, mode in files:
+            if mode == fcntl.LOCK_EX:
+                lock_file.truncate(0)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def lock_status(self):
+        """Locks entre procesos ocupados, con el trabajo que los tiene (si es exclusivo)"""
+        if self.lock_dir is None:
+            return []
+        held = []
+        for path in sorted(glob.glob(os.path.join(self.lock_dir, '*.lock'))):
+            with open(path, 'a+') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    continue
+                except BlockingIOError:
+                    pass
+                lock_file.seek(0)
+                content = lock_file.read()
+            try:
+                holder = json.loads(content) if content else None
+            except ValueError:
+                holder = None
+            held.append({'lock': os.path.basename(path), 'holder': holder})
+        return held
+
+    def _run(self, job):
+        locks = []
+        try:
+            job.check_cancelled(poll=True)
+            locks = self._acquire(job)
+            job.check_cancelled(poll=True)
+            result = self.run_job(job)
+            status, error = 'succeeded', None
+        except JobCancelled:
+            result, status, error = None, 'cancelled', None
+        except Exception as e:
+            print(f"❌ Trabajo {job.id} ({job.model}) falló: {e}")
+            result, status, error = None, 'failed', str(e)
+        finally:
+            self._release(locks)
+        with self._lock:
+            job.status = status
+            job.error = error
+            job.result = result
+            job.finished_at = time.time()
+            job.phase = 'done' if status == 'succeeded' else status
+        job.save()
+        self._dispatch()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
@@ -1,8 +1,7 @@
 import os
-import json
-import importlib
-import sys
-from ..config import DATA_DIR, MODEL_DIR
+from ..config import DATA_DIR
+from .dataset_catalog import dataset_catalog
+from .label_registry import label_registry
 
 
 def detect_classes_in_data(data_path):
@@ -19,19 +18,14 @@ def detect_classes_in_data(data_path):
     if not os.path.exists(train_path):
         return []
     
-    # Obtener todas las carpetas (clases) en el directorio de entrenamiento
-    classes = []
-    for item in os.listdir(train_path):
-        item_path = os.path.join(train_path, item)
-        if os.path.isdir(item_path):
-            classes.append(item)
-    
-    return sorted(classes)
+    # Las clases (carpetas) salen del catálogo, que solo revisa las carpetas que cambiaron
+    return dataset_catalog.class_names(os.path.basename(os.path.normpath(data_path)), train_path)
 
 
 def get_current_classes(model_type):
     """
-    Obtiene las clases actuales según el tipo de modelo.
+    Obtiene las clases actuales según el tipo de modelo: las etiquetas registradas
+    para la versión del modelo guardado en disco.
     
     Args:
         model_type (str): Tipo de modelo ('especies', 'hojas', 'plantas')
@@ -39,16 +33,9 @@ def get_current_classes(model_type):
     Returns:
         list: Lista de clases actuales
     """
-    from ..config import SPECIES, SHAPES, PLANTS
-    
-    if model_type == 'especies':
-        return SPECIES
-    elif model_type == 'hojas':
-        return SHAPES
-    elif model_type == 'plantas':
-        return [str(x) for x in PLANTS]  # Convertir booleanos a strings
-    else:
+    if model_type not in ('especies', 'hojas', 'plantas'):
         return []
+    return list(label_registry.current(model_type).names)
 
 
 def detect_new_classes(model_type):
@@ -77,203 +64,6 @@ def detect_new_classes(model_type):
     }
 
 
-def update_config_with_detected_classes(model_type, detected_classes):
-    """
-    Actualiza la configuración con todas las clases detectadas en orden alfabético.
-    Esto asegura que el orden en config.py coincida con el orden que usa ImageDataGenerator.
-    
-    Args:
-        model_type (str): Tipo de modelo ('especies', 'hojas', 'plantas')
-        detected_classes (list): Lista de todas las clases detectadas (ya ordenadas alfabéticamente)
-    
-    Returns:
-        bool: True si la actualización fue exitosa, False en caso contrario
-    """
-    if not detected_classes:
-        return False
-    
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config.py')
-    
-    # Leer el archivo de configuración actual
-    with open(config_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Usar las clases detectadas directamente (ya están en orden alfabético)
-    updated_classes = sorted(detected_classes)  # Asegurar orden alfabético
-    
-    # Determinar el nombre de la variable según el tipo de modelo
-    if model_type == 'especies':
-        var_name = 'SPECIES'
-        # Formatear como lista de strings con saltos de línea para legibilidad
-        formatted_classes = []
-        for cls in updated_classes:
-            formatted_classes.append(f"    '{cls}'")
-        new_content = "[\n" + ",\n".join(formatted_classes) + "\n]"
-        
-    elif model_type == 'hojas':
-        var_name = 'SHAPES'
-        # Formatear como lista de strings con saltos de línea para legibilidad
-        formatted_classes = []
-        for cls in updated_classes:
-            formatted_classes.append(f"    '{cls}'")
-        new_content = "[\n" + ",\n".join(formatted_classes) + "\n]"
-        
-    elif model_type == 'plantas':
-        var_name = 'PLANTS'
-        # Convertir strings de vuelta a booleanos
-        bool_classes = []
-        for cls in updated_classes:
-            if isinstance(cls, bool):
-                bool_classes.append(cls)
-            elif cls.lower() in ['true', '1', 'yes']:
-                bool_classes.append(True)
-            elif cls.lower() in ['false', '0', 'no']:
-                bool_classes.append(False)
-            else:
-                # Si no es un booleano, mantener como string
-                bool_classes.append(cls)
-        new_content = str(bool_classes)
-    else:
-        return False
-    
-    # Reemplazar la línea correspondiente en el archivo de configuración
-    import re
-    
-    # Patrón más específico para capturar la variable completa
-    if model_type in ['especies', 'hojas']:
-        pattern = rf"^{var_name}\s*=\s*\[.*?\]"
-        replacement = f"{var_name} = {new_content}"
-    else:  # plantas
-        pattern = rf"^{var_name}\s*=\s*\[.*?\]"
-        replacement = f"{var_name} = {new_content}"
-    
-    new_file_content = re.sub(pattern, replacement, content, flags=re.MULTILINE | re.DOTALL)
-    
-    # Verificar que el reemplazo fue exitoso
-    if new_file_content == content:
-        print(f"Advertencia: No se pudo actualizar {var_name} en config.py")
-        return False
-    
-    # Escribir el archivo actualizado
-    with open(config_path, 'w', encoding='utf-8') as f:
-        f.write(new_file_content)
-    
-    print(f"Configuración actualizada: {var_name} ahora tiene {len(updated_classes)} clases en orden alfabético")
-    return True
-
-
-def update_config_with_new_classes(model_type, new_classes):
-    """
-    Actualiza la configuración con las nuevas clases detectadas.
-    DEPRECATED: Usar update_config_with_detected_classes en su lugar.
-    
-    Args:
-        model_type (str): Tipo de modelo ('especies', 'hojas', 'plantas')
-        new_classes (list): Lista de nuevas clases a agregar
-    """
-    if not new_classes:
-        return True
-    
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config.py')
-    
-    # Leer el archivo de configuración actual
-    with open(config_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Obtener las clases actuales
-    current_classes = get_current_classes(model_type)
-    
-    # Crear la nueva lista de clases (evitar duplicados)
-    updated_classes = list(current_classes)
-    for new_class in new_classes:
-        if new_class not in updated_classes:
-            updated_classes.append(new_class)
-    
-    # Ordenar alfabéticamente para mantener consistencia
-    updated_classes = sorted(updated_classes)
-    
-    # Determinar el nombre de la variable según el tipo de modelo
-    if model_type == 'especies':
-        var_name = 'SPECIES'
-        # Formatear como lista de strings con saltos de línea para legibilidad
-        formatted_classes = []
-        for i, cls in enumerate(updated_classes):
-            if i == 0:
-                formatted_classes.append(f"    '{cls}'")
-            else:
-                formatted_classes.append(f"    '{cls}'")
-        new_content = "[\n" + ",\n".join(formatted_classes) + "\n]"
-        
-    elif model_type == 'hojas':
-        var_name = 'SHAPES'
-        # Formatear como lista de strings con saltos de línea para legibilidad
-        formatted_classes = []
-        for i, cls in enumerate(updated_classes):
-            if i == 0:
-                formatted_classes.append(f"    '{cls}'")
-            else:
-                formatted_classes.append(f"    '{cls}'")
-        new_content = "[\n" + ",\n".join(formatted_classes) + "\n]"
-        
-    elif model_type == 'plantas':
-        var_name = 'PLANTS'
-        # Convertir strings de vuelta a booleanos
-        bool_classes = []
-        for cls in updated_classes:
-            if isinstance(cls, bool):
-                bool_classes.append(cls)
-            elif cls.lower() in ['true', '1', 'yes']:
-                bool_classes.append(True)
-            elif cls.lower() in ['false', '0', 'no']:
-                bool_classes.append(False)
-            else:
-                # Si no es un booleano, mantener como string
-                bool_classes.append(cls)
-        new_content = str(bool_classes)
-    else:
-        return False
-    
-    # Reemplazar la línea correspondiente en el archivo de configuración
-    import re
-    
-    # Patrón más específico para capturar la variable completa
-    if model_type in ['especies', 'hojas']:
-        pattern = rf"^{var_name}\s*=\s*\[.*?\]"
-        replacement = f"{var_name} = {new_content}"
-    else:  # plantas
-        pattern = rf"^{var_name}\s*=\s*\[.*?\]"
-        replacement = f"{var_name} = {new_content}"
-    
-    new_file_content = re.sub(pattern, replacement, content, flags=re.MULTILINE | re.DOTALL)
-    
-    # Verificar que el reemplazo fue exitoso
-    if new_file_content == content:
-        print(f"Advertencia: No se pudo actualizar {var_name} en config.py")
-        return False
-    
-    # Escribir el archivo actualizado
-    with open(config_path, 'w', encoding='utf-8') as f:
-        f.write(new_file_content)
-    
-    print(f"Configuración actualizada: {var_name} ahora incluye {len(updated_classes)} clases")
-    return True
-
-
-def reload_config():
-    """
-    Recarga el módulo de configuración para aplicar los cambios sin reiniciar la aplicación.
-    """
-    try:
-        # Recargar el módulo de configuración
-        if 'app.config' in sys.modules:
-            importlib.reload(sys.modules['app.config'])
-            print("Configuración recargada exitosamente")
-            return True
-    except Exception as e:
-        print(f"Error al recargar configuración: {e}")
-        return False
-
-
 def adjust_model_for_new_classes(model, model_type, new_classes):
     """
     Ajusta la última capa del modelo para incluir las nuevas clases.
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from ..config import LABELS_DIR, MODEL_DIR, SPECIES, SHAPES, PLANTS
+from .artifact_store import artifact_store, file_sha256
+
+# Etiquetas iniciales, para versiones de modelo que aún no tienen archivo en LABELS_DIR
+SEED_LABELS = {
+    'especies': SPECIES,
+    'hojas': SHAPES,
+    'plantas': PLANTS,
+}
+
+
+class LabelSet:
+    """
+    Etiquetas de una versión de modelo, en el orden de índices de su capa de salida.
+    Los nombres se guardan como tupla de strings para que la búsqueda por índice en
+    /predict sea O(1) y sin conversiones.
+    """
+
+    __slots__ = ('model', 'version', 'names', 'source')
+
+    def __init__(self, model, version, names, source='training'):
+        self.model = model
+        self.version = version
+        self.names = tuple(str(name) for name in names)
+        self.source = source
+
+    def __len__(self):
+        return len(self.names)
+
+    def probabilities(self, pred):
+        """{etiqueta: probabilidad} de un vector de predicción, o {} si no coincide el número de clases"""
+        if len(pred) != len(self.names):
+            return {}
+        return dict(zip(self.names, pred.tolist()))
+
+    def describe(self):
+        return {'version': self.version, 'classes': list(self.names), 'source': self.source}
+
+
+class LabelRegistry:
+    """
+    Registro versionado de etiquetas: <modelo>/<versión>.json en root, donde versión es la
+    del .h5 en el ArtifactStore. Cada archivo se escribe una vez al guardar el modelo y se
+    lee una sola vez por proceso; como ModelEntry guarda su LabelSet, las etiquetas cambian
+    junto con los pesos al activar o revertir un modelo.
+
+    Si una versión no tiene archivo se usan las clases guardadas con ella en el
+    ArtifactStore o, en su defecto, las etiquetas iniciales de config.py, y se persisten.
+    """
+
+    def __init__(self, root=LABELS_DIR, model_dir=MODEL_DIR, store=artifact_store):
+        self.root = root
+        self.model_dir = model_dir
+        self.store = store
+        self._cache = {}
+        self._file_versions = {}
+        self._lock = threading.Lock()
+
+    def path(self, model_name, version):
+        return os.path.join(self.root, model_name, f"{version}.json")
+
+    def save(self, model_name, version, names, source='training', **metadata):
+        """Escribe las etiquetas de version de forma atómica y retorna su LabelSet"""
+        labels = LabelSet(model_name, version, names, source)
+        path = self.path(model_name, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'classes': list(labels.names), 'source': source, 'created_at': time.time(), **metadata}, f, indent=2)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._cache[(model_name, version)] = labels
+        return labels
+
+    def load(self, model_name, version):
+        """LabelSet de version (los 12 primeros caracteres del hash del .h5); None usa las iniciales"""
+        with self._lock:
+            labels = self._cache.get((model_name, version))
+        if labels is not None:
+            return labels
+
+        if version is None:
+            labels = LabelSet(model_name, None, SEED_LABELS.get(model_name, []), source='config')
+        else:
+            labels = self._read(model_name, version)
+            if labels is None:
+                labels = self._fallback(model_name, version)
+        with self._lock:
+            return self._cache.setdefault((model_name, version), labels)
+
+    def _read(self, model_name, version):
+        path = self.path(model_name, version)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return LabelSet(model_name, version, data['classes'], data.get('source', 'training'))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Etiquetas ilegibles en {path}: {e}")
+            return None
+
+    def _fallback(self, model_name, version):
+        stored = self.store.get(model_name, version)
+        if stored and stored.get('classes'):
+            names, source = stored['classes'], 'artifact_store'
+        else:
+            names, source = SEED_LABELS.get(model_name, []), 'config'
+        try:
+            return self.save(model_name, version, names, source)
+        except OSError as e:
+            print(f"⚠️  No se pudieron guardar las etiquetas de {model_name} {version}: {e}")
+            return LabelSet(model_name, version, names, source)
+
+    def current(self, model_name):
+        """LabelSet del .h5 que hay en disco para model_name (el que se sirve tras un reinicio)"""
+        path = os.path.join(self.model_dir, f"modelo_{model_name}.h5")
+        if not os.path.exists(path):
+            return self.load(model_name, None)
+        # El hash solo se recalcula si el archivo cambió
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._file_versions.get(path)
+        if cached is None or cached[0] != key:
+            cached = (key, file_sha256(path)[:12])
+            with self._lock:
+                self._file_versions[path] = cached
+        return self.load(model_name, cached[1])
+
+
+label_registry = LabelRegistry()
@@ -1,17 +1,51 @@
+import asyncio
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import tensorflow as tf
 import os
+from ..config import INFERENCE_WORKERS, MODEL_CONCURRENCY
 
-predict_lock = threading.Lock()
+# Pool dedicado para el trabajo bloqueante de inferencia (decodificación, preprocesamiento
+# y forward passes), para no bloquear el event loop de asyncio
+inference_executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS,
+    thread_name_prefix='inference'
+)
+
+# Control de concurrencia por modelo: como máximo MODEL_CONCURRENCY ejecuciones
+# simultáneas de cada modelo (una por réplica)
+model_locks = {
+    name: threading.BoundedSemaphore(MODEL_CONCURRENCY)
+    for name in ('especies', 'hojas', 'plantas')
+}
 
 # Configurar TensorFlow para predicciones en CPU
 # Asegurar que las predicciones no interfieran con entrenamiento en GPU
 os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
 
-@tf.function
+
+async def run_in_inference_executor(func, *args):
+    """
+    Ejecuta una función bloqueante en el pool de inferencia y espera su resultado
+    sin bloquear el event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, func, *args)
+
+
+@contextmanager
+def model_lock(name):
+    """Adquiere el control de concurrencia del modelo indicado"""
+    with model_locks[name]:
+        yield
+
+
+@tf.function(reduce_retracing=True)
 def safe_predict(model, input_data):
     """
     Realiza una predicción segura del modelo.
     Usa @tf.function para optimización y asegura que no interfiera con otros procesos.
+    reduce_retracing evita un nuevo trazado por cada tamaño de lote distinto.
     """
     return model(input_data, training=False)
@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets en segundos: cubren desde decodificaciones de ~1 ms hasta lotes de varios segundos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(label_names, label_values):
+    if not label_names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(label_names, label_values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Contador monotónico con etiquetas opcionales"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.label_names, labels), value) for labels, value in items]
+
+
+class Histogram:
+    """
+    Histograma con buckets fijos y etiquetas opcionales.
+    observe() es una búsqueda binaria más tres sumas bajo un lock, así que su costo
+    es despreciable frente a cualquier etapa de la predicción.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """Mide la duración del bloque y la registra en segundos"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        result = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket_labels = _format_labels(self.label_names + ('le',), labels + (le,))
+                result.append((f'{self.name}_bucket', bucket_labels, cumulative))
+            label_text = _format_labels(self.label_names, labels)
+            result.append((f'{self.name}_sum', label_text, total))
+            result.append((f'{self.name}_count', label_text, count))
+        return result
+
+
+class MetricsRegistry:
+    """Registro de métricas con exportación en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, label_names=()):
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        Registra una función que retorna métricas calculadas al momento de exportar,
+        como lista de (nombre, tipo, ayuda, [(dict_etiquetas, valor)]).
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                print(f"⚠️  Error en colector de métricas: {e}")
+                continue
+            for name, type_name, documentation, samples in collected:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {type_name}')
+                for labels, value in samples:
+                    label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                    lines.append(f'{name}{label_text} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+predict_requests = metrics_registry.counter(
+    'classifier_predict_requests_total', 'Solicitudes de predicción recibidas', ('endpoint',)
+)
+predict_errors = metrics_registry.counter(
+    'classifier_predict_errors_total', 'Solicitudes de predicción con error', ('endpoint', 'status')
+)
+class_index_out_of_range = metrics_registry.counter(
+    'classifier_class_index_out_of_range_total',
+    'Predicciones cuyo índice de clase no existe en la lista de etiquetas', ('model',)
+)
+predict_stage_seconds = metrics_registry.histogram(
+    'classifier_predict_stage_seconds',
+    'Duración de cada etapa de /predict (upload, decode, queue_wait, lock_wait, forward, serialize)',
+    ('stage', 'model')
+)
+predict_batch_size = metrics_registry.histogram(
+    'classifier_predict_batch_size', 'Solicitudes agrupadas por lote de inferencia',
+    buckets=BATCH_SIZE_BUCKETS
+)
@@ -0,0 +1,109 @@
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def _dct_matrix(n):
+    """Matriz de la DCT-II ortonormal de tamaño n"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT_MATRIX = _dct_matrix(DCT_SIZE)
+
+
+def load_gray(path, size=DCT_SIZE):
+    """Carga la imagen en escala de grises a size x size para calcular su pHash"""
+    with Image.open(path) as image:
+        # En JPEG, draft decodifica directamente a una escala reducida (mucho más rápido)
+        image.draft('L', (size * 2, size * 2))
+        return np.asarray(image.convert('L').resize((size, size), Image.BILINEAR), dtype=np.float32)
+
+
+def phash_batch(gray):
+    """
+    pHash de 64 bits de un lote de imágenes en gris (N, 32, 32): DCT 2D del lote completo
+    con dos productos de matrices y, por imagen, un bit por coeficiente de baja frecuencia
+    (8x8) según si supera la mediana.
+
+    Returns:
+        np.ndarray: (N,) uint64
+    """
+    coefficients = DCT_MATRIX @ np.asarray(gray, dtype=np.float32) @ DCT_MATRIX.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(coefficients), -1)
+    # La componente continua (brillo medio) no entra en la mediana
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(low > median, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Árbol BK sobre la distancia de Hamming: encuentra los hashes a distancia <= d de uno
+    dado visitando solo las ramas que la desigualdad triangular permite, en lugar de
+    comparar contra todos.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def query(self, value, max_distance):
+        """Retorna [(distancia, item)] de los valores a distancia <= max_distance"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+
+def find_near_duplicates(items, max_distance):
+    """
+    Agrupa casi duplicados. Se recorren los items en orden y cada uno se compara solo con
+    los ya conservados: si alguno está a distancia <= max_distance, el item es un duplicado
+    del más cercano; si no, se conserva.
+
+    Args:
+        items: Lista ordenada de (clave, pHash como int)
+
+    Returns:
+        dict: {clave duplicada: (clave conservada, distancia)}
+    """
+    tree = BKTree()
+    duplicates = {}
+    for key, value in items:
+        matches = tree.query(value, max_distance)
+        if matches:
+            distance, keeper = min(matches)
+            duplicates[key] = (keeper, distance)
+        else:
+            tree.add(value, key)
+    return duplicates
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from ..config import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DIR
+from .metrics import metrics_registry
+
+
+class PredictionCache:
+    """
+    Cache de predicciones direccionado por contenido.
+
+    La clave combina el hash SHA-256 de los bytes de la imagen con las versiones de los
+    modelos cargados, por lo que una imagen repetida no vuelve a pasar por los tres modelos
+    mientras los pesos no cambien. Nivel en memoria LRU con límite de tamaño y TTL, y un
+    nivel opcional en disco compartible entre workers.
+
+    Args:
+        max_entries: Máximo de entradas en memoria (0 deshabilita el cache)
+        ttl_seconds: Tiempo de vida de cada entrada en segundos
+        disk_dir: Directorio del nivel en disco (None lo deshabilita)
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=3600.0, disk_dir=None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(image_bytes, model_versions):
+        """
+        Genera la clave de cache para una imagen y un conjunto de versiones de modelo.
+
+        Args:
+            image_bytes: Bytes originales de la imagen
+            model_versions: Dict {nombre_modelo: versión}
+        """
+        versions = ','.join(f"{name}={model_versions[name]}" for name in sorted(model_versions))
+        versions_hash = hashlib.sha256(versions.encode('utf-8')).hexdigest()[:16]
+        return f"{hashlib.sha256(image_bytes).hexdigest()}-{versions_hash}"
+
+    def get(self, key):
+        """Retorna la predicción cacheada o None si no existe o expiró"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._memory_put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Guarda una predicción en memoria y, si está habilitado, en disco"""
+        if not self.enabled:
+            return
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def invalidate(self):
+        """Vacía el cache (por ejemplo, cuando un reentrenamiento reemplaza un modelo)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk_enabled': bool(self.disk_dir),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _memory_put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escribir en un archivo temporal y renombrar para que otros workers
+            # nunca lean una entrada a medio escribir
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  No se pudo escribir en el cache de predicciones en disco: {e}")
+
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=PREDICTION_CACHE_TTL,
+    disk_dir=PREDICTION_CACHE_DIR
+)
+
+
+def _collect_cache_metrics():
+    stats = prediction_cache.stats()
+    return [
+        ('classifier_prediction_cache_events_total', 'counter', 'Eventos del cache de predicciones', [
+            ({'event': event}, stats[event])
+            for event in ('hits', 'disk_hits', 'misses', 'evictions', 'expirations', 'invalidations')
+        ]),
+        ('classifier_prediction_cache_entries', 'gauge', 'Entradas en memoria del cache de predicciones', [
+            ({}, stats['entries'])
+        ]),
+    ]
+
+
+metrics_registry.register_collector(_collect_cache_metrics)
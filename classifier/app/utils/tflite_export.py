@@ -0,0 +1,184 @@
+"""
+Exportación de los modelos Keras a TFLite con cuantización post-entrenamiento.
+
+Uso (desde classifier/):
+    python -m app.utils.tflite_export                       # los tres modelos, float16 e int8
+    python -m app.utils.tflite_export --model hojas --quantization int8
+
+Genera modelo_<nombre>.<cuantización>.tflite junto a los .h5 y un reporte
+tflite_report.json con latencia, tamaño y concordancia top-1 frente a Keras.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from ..config import DATA_DIR, MODEL_DIR, TFLITE_CALIBRATION_SAMPLES
+from ..models_loader import MODEL_FILES, TFLiteModel, run_inference, tflite_path
+from ..preprocess import preprocess_image
+
+QUANTIZATIONS = ('float16', 'int8')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_calibration_samples(model_name, max_samples=TFLITE_CALIBRATION_SAMPLES):
+    """
+    Toma una muestra determinista de imágenes de DATA_DIR/<modelo>/train, repartida
+    entre todas las clases, preprocesada igual que en /predict.
+
+    Returns:
+        np.ndarray: Array (N, 128, 128, 3) float32
+    """
+    train_path = os.path.join(DATA_DIR, model_name, 'train')
+    files = []
+    if os.path.isdir(train_path):
+        for class_name in sorted(os.listdir(train_path)):
+            class_dir = os.path.join(train_path, class_name)
+            if os.path.isdir(class_dir):
+                files.extend(
+                    os.path.join(class_dir, f) for f in sorted(os.listdir(class_dir))
+                    if f.lower().endswith(IMAGE_EXTENSIONS)
+                )
+    if not files:
+        raise ValueError(f"No hay imágenes de calibración en {train_path}")
+
+    # Paso fijo sobre la lista ordenada para cubrir todas las clases de forma reproducible
+    step = max(1, len(files) // max_samples)
+    samples = []
+    for path in files[::step][:max_samples]:
+        with open(path, 'rb') as f:
+            try:
+                samples.append(preprocess_image(f.read()))
+            except Exception as e:
+                print(f"⚠️  Imagen de calibración omitida {path}: {e}")
+    return np.concatenate(samples, axis=0)
+
+
+def convert_model(model, quantization, samples=None):
+    """
+    Convierte un modelo Keras a TFLite.
+
+    Args:
+        model: Modelo Keras
+        quantization: 'float16' (pesos en float16) o 'int8' (pesos y activaciones int8,
+            calibradas con samples; entrada y salida se mantienen en float32)
+        samples: Array de calibración, requerido para 'int8'
+
+    Returns:
+        bytes: Modelo TFLite serializado
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if samples is None or len(samples) == 0:
+            raise ValueError("La cuantización int8 requiere muestras de calibración")
+
+        def representative_dataset():
+            for i in range(len(samples)):
+                yield [samples[i:i + 1]]
+
+        converter.representative_dataset = representative_dataset
+    else:
+        raise ValueError(f"Cuantización no soportada: {quantization}")
+    return converter.convert()
+
+
+def _median_latency_ms(model, samples):
+    timings = []
+    for i in range(len(samples)):
+        start = time.perf_counter()
+        run_inference(model, samples[i:i + 1])
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000.0)
+
+
+def evaluate(keras_model, keras_path, tflite_model_path, samples):
+    """Compara latencia (batch 1), tamaño y concordancia top-1 contra el modelo Keras"""
+    tflite_model = TFLiteModel(tflite_model_path, replicas=1)
+    keras_top1 = np.argmax(run_inference(keras_model, samples), axis=1)
+    tflite_top1 = np.argmax(tflite_model.predict(samples), axis=1)
+    return {
+        'samples': int(len(samples)),
+        'keras_size_mb': os.path.getsize(keras_path) / (1024 ** 2),
+        'tflite_size_mb': os.path.getsize(tflite_model_path) / (1024 ** 2),
+        'keras_latency_ms': _median_latency_ms(keras_model, samples),
+        'tflite_latency_ms': _median_latency_ms(tflite_model, samples),
+        'top1_agreement': float(np.mean(keras_top1 == tflite_top1)),
+    }
+
+
+def export_model(model_name, quantizations=QUANTIZATIONS, evaluate_accuracy=True):
+    """
+    Exporta un modelo a cada cuantización indicada y retorna el reporte por cuantización.
+
+    Las imágenes de DATA_DIR solo se cargan si hacen falta: para calibrar int8 (requeridas)
+    o para el reporte de latencia y concordancia (evaluate_accuracy; si no hay imágenes se
+    omite con un aviso). Un rollback en un host sin datos exporta float16 sin evaluar.
+    """
+    keras_path = os.path.join(MODEL_DIR, MODEL_FILES[model_name])
+    with tf.device('/CPU:0'):
+        model = tf.keras.models.load_model(keras_path)
+    samples = None
+    if 'int8' in quantizations or evaluate_accuracy:
+        try:
+            samples = load_calibration_samples(model_name)
+        except ValueError as e:
+            if 'int8' in quantizations:
+                raise
+            print(f"⚠️  {e}; se omite el reporte de latencia y concordancia")
+
+    report = {}
+    for quantization in quantizations:
+        print(f"📦 Exportando {model_name} ({quantization})...")
+        output_path = tflite_path(model_name, quantization)
+        tflite_bytes = convert_model(model, quantization, samples)
+        # Escribir a un temporal y renombrar para no dejar un modelo a medio escribir
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(tflite_bytes)
+        os.replace(tmp_path, output_path)
+
+        if not evaluate_accuracy or samples is None:
+            report[quantization] = {
+                'path': output_path,
+                'keras_size_mb': os.path.getsize(keras_path) / (1024 ** 2),
+                'tflite_size_mb': os.path.getsize(output_path) / (1024 ** 2),
+            }
+            print(f"   ✅ {report[quantization]['tflite_size_mb']:.1f} MB (sin evaluar)")
+            continue
+
+        report[quantization] = {'path': output_path, **evaluate(model, keras_path, output_path, samples)}
+        r = report[quantization]
+        print(f"   ✅ {r['tflite_size_mb']:.1f} MB (Keras {r['keras_size_mb']:.1f} MB), "
+              f"{r['tflite_latency_ms']:.1f} ms (Keras {r['keras_latency_ms']:.1f} ms), "
+              f"top-1 {r['top1_agreement'] * 100:.1f}%")
+    return report
+
+
+def export_all(model_names=None, quantizations=QUANTIZATIONS, report_path=None):
+    """Exporta los modelos indicados (todos por defecto) y escribe el reporte JSON"""
+    model_names = model_names or list(MODEL_FILES)
+    report = {name: export_model(name, quantizations) for name in model_names}
+    report_path = report_path or os.path.join(MODEL_DIR, 'tflite_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Reporte escrito en {report_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', choices=list(MODEL_FILES), action='append',
+                        help='Modelo a exportar (se puede repetir; por defecto todos)')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, action='append',
+                        help='Cuantización (se puede repetir; por defecto float16 e int8)')
+    parser.add_argument('--report', help='Ruta del reporte JSON')
+    args = parser.parse_args()
+    export_all(args.model, tuple(args.quantization or QUANTIZATIONS), args.report)
+
+
+if __name__ == '__main__':
+    main()
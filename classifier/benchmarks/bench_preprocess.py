@@ -0,0 +1,68 @@
+"""
+Micro-benchmark de preprocess_image: compara la ruta rápida (draft JPEG + uint8 + una
+sola normalización float32) contra la implementación anterior (decodificación completa
+con PIL y división en float64).
+
+Uso (desde classifier/):
+    python -m benchmarks.bench_preprocess --images 20 --repeat 5
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.preprocess import preprocess_image
+from benchmarks.synthetic import leaf_jpeg
+
+
+def legacy_preprocess_image(image_bytes, target_size=(128, 128)):
+    """Implementación original, conservada como referencia de paridad"""
+    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    image = image.resize(target_size)
+    image_array = np.array(image) / 255.0
+    image_array = np.expand_dims(image_array, axis=0)
+    return image_array
+
+
+def time_function(func, images, repeat):
+    timings = []
+    for _ in range(repeat):
+        for image_bytes in images:
+            start = time.perf_counter()
+            func(image_bytes)
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=10, help='Número de imágenes sintéticas')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por imagen')
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    args = parser.parse_args()
+
+    print(f"Generando {args.images} JPEG sintéticos de {args.width}x{args.height}...")
+    images = [leaf_jpeg(seed, (args.width, args.height)) for seed in range(args.images)]
+
+    legacy_ms = time_function(legacy_preprocess_image, images, args.repeat)
+    fast_ms = time_function(preprocess_image, images, args.repeat)
+
+    # Paridad: diferencia por píxel entre ambas rutas (valores normalizados 0-1)
+    diffs = [
+        np.abs(legacy_preprocess_image(image_bytes).astype(np.float32) - preprocess_image(image_bytes))
+        for image_bytes in images
+    ]
+    max_diff = max(float(d.max()) for d in diffs)
+    mean_diff = float(np.mean([d.mean() for d in diffs]))
+
+    print(f"Anterior: {np.median(legacy_ms):8.2f} ms/img (p95 {np.percentile(legacy_ms, 95):.2f})")
+    print(f"Rápida:   {np.median(fast_ms):8.2f} ms/img (p95 {np.percentile(fast_ms, 95):.2f})")
+    print(f"Speedup:  {np.median(legacy_ms) / np.median(fast_ms):8.2f}x")
+    print(f"Paridad:  diferencia media {mean_diff:.4f}, máxima {max_diff:.4f} (escala 0-1)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Suite de benchmarks reproducible del servicio clasificador.
+
+Mide, sobre imágenes sintéticas deterministas (benchmarks/synthetic.py):
+  - preprocess_image por resolución
+  - el forward pass de cada modelo (batch 1)
+  - /predict de punta a punta con un cliente ASGI en proceso a concurrencia 1, 8 y 64
+
+Escribe un JSON con p50/p95/p99 (ms) e imágenes/s por etapa y, si se indica una línea
+base, marca las regresiones mayores a la tolerancia (código de salida 1).
+
+Uso (desde classifier/, requiere los modelos en models/ y httpx):
+    python -m benchmarks.run --output benchmarks/results.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --output benchmarks/baseline.json   # actualizar la línea base
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# El cache de predicciones haría que las imágenes repetidas no midan inferencia
+os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+
+from benchmarks.synthetic import RESOLUTIONS, leaf_jpeg  # noqa: E402
+
+CONCURRENCY_LEVELS = (1, 8, 64)
+
+
+def summarize(latencies_s, wall_s=None, images=None):
+    """Resume latencias (segundos) en percentiles (ms) e imágenes por segundo"""
+    ms = np.asarray(latencies_s) * 1000.0
+    images = images if images is not None else len(ms)
+    wall_s = wall_s if wall_s is not None else float(np.sum(latencies_s))
+    return {
+        'n': int(len(ms)),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(np.mean(ms)),
+        'images_per_s': images / wall_s if wall_s > 0 else 0.0,
+    }
+
+
+def time_calls(func, args_list, warmup=2):
+    for args in args_list[:warmup]:
+        func(*args)
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_preprocess(samples):
+    from app.preprocess import preprocess_image
+
+    results = {}
+    for name, size in RESOLUTIONS.items():
+        images = [leaf_jpeg(seed, size) for seed in range(samples)]
+        results[f'preprocess/{name}'] = summarize(time_calls(preprocess_image, [(b,) for b in images]))
+        print(f"   preprocess/{name}: p50 {results[f'preprocess/{name}']['p50_ms']:.2f} ms")
+    return results
+
+
+def bench_models(registry, samples):
+    from app.models_loader import run_inference
+    from app.preprocess import preprocess_image
+
+    inputs = [preprocess_image(leaf_jpeg(seed, RESOLUTIONS['small'])) for seed in range(samples)]
+    results = {}
+    for name, entry in registry.snapshot().items():
+        key = f'forward/{name}'
+        results[key] = summarize(time_calls(run_inference, [(entry.model, x) for x in inputs]))
+        print(f"   {key}: p50 {results[key]['p50_ms']:.2f} ms")
+    return results
+
+
+async def _bench_endpoint(app, images, concurrency, requests):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench', timeout=300) as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    '/predict', files={'image': (f'leaf_{i}.jpg', images[i % len(images)], 'image/jpeg')}
+                )
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        # Calentamiento fuera de la medición
+        await one(0)
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(requests)])
+        wall = time.perf_counter() - started
+    return summarize(latencies, wall_s=wall, images=requests)
+
+
+async def _bench_endpoint_levels(app, images, requests):
+    results = {}
+    for concurrency in CONCURRENCY_LEVELS:
+        key = f'predict/c{concurrency}'
+        results[key] = await _bench_endpoint(app, images, concurrency, max(requests, concurrency * 2))
+        print(f"   {key}: p50 {results[key]['p50_ms']:.1f} ms, {results[key]['images_per_s']:.1f} img/s")
+    return results
+
+
+def bench_endpoint(app, samples, requests):
+    images = [leaf_jpeg(seed, RESOLUTIONS['web_1080p']) for seed in range(samples)]
+    # Un único event loop para todos los niveles: el MicroBatcher de la app vive en él
+    return asyncio.run(_bench_endpoint_levels(app, images, requests))
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import tensorflow as tf
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'tensorflow': tf.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compara contra la línea base. Es regresión si p50 sube o images/s baja más que la tolerancia.
+
+    Returns:
+        list: Descripción de cada regresión encontrada
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get('results', {}).get(key)
+        if not previous:
+            continue
+        if current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{key}: p50 {previous['p50_ms']:.2f} -> {current['p50_ms']:.2f} ms")
+        if current['images_per_s'] < previous['images_per_s'] * (1 - tolerance):
+            regressions.append(f"{key}: {previous['images_per_s']:.1f} -> {current['images_per_s']:.1f} img/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results.json'), help='Ruta del JSON de resultados')
+    parser.add_argument('--baseline', help='JSON de línea base contra el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Regresión tolerada (fracción, por defecto 0.15)')
+    parser.add_argument('--samples', type=int, default=20, help='Imágenes sintéticas por etapa')
+    parser.add_argument('--requests', type=int, default=128, help='Solicitudes por nivel de concurrencia')
+    parser.add_argument('--skip', action='append', choices=['preprocess', 'models', 'endpoint'], default=[],
+                        help='Etapas a omitir')
+    args = parser.parse_args()
+
+    results = {}
+    if 'preprocess' not in args.skip:
+        print("📏 preprocess_image")
+        results.update(bench_preprocess(args.samples))
+
+    if 'models' not in args.skip or 'endpoint' not in args.skip:
+        from app import create_app
+        from app.models_loader import model_registry
+
+        app = create_app()
+        while not model_registry.is_ready():
+            if 'error' in model_registry.startup:
+                sys.exit(f"❌ No se pudieron cargar los modelos: {model_registry.startup['error']}")
+            time.sleep(0.2)
+
+        if 'models' not in args.skip:
+            print("📏 Forward pass por modelo")
+            results.update(bench_models(model_registry, args.samples))
+        if 'endpoint' not in args.skip:
+            print("📏 /predict de punta a punta")
+            results.update(bench_endpoint(app, args.samples, args.requests))
+
+    report = {'environment': environment_info(), 'results': results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Resultados escritos en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"✅ Sin regresiones frente a {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Imágenes sintéticas deterministas con forma de hoja para los benchmarks.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Resoluciones típicas de las fotos que llegan desde la web y los celulares
+RESOLUTIONS = {
+    'phone_12mp': (4032, 3024),
+    'phone_8mp': (3264, 2448),
+    'web_1080p': (1920, 1080),
+    'small': (640, 480),
+}
+
+
+def leaf_image(seed, size=(4032, 3024)):
+    """
+    Genera una imagen RGB determinista: fondo con ruido y gradiente, y una hoja
+    elíptica verde con nervaduras, rotada y desplazada según la semilla.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+
+    # Fondo: gradiente terroso + ruido gaussiano
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    background = np.stack([
+        90 + 60 * x / width,
+        70 + 40 * y / height,
+        50 + 30 * (x + y) / (width + height),
+    ], axis=-1)
+    background += rng.normal(0, 12, size=(height, width, 3))
+    image = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8))
+
+    # Hoja: elipse verde con nervadura central y laterales
+    leaf = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(leaf)
+    cx = width * rng.uniform(0.4, 0.6)
+    cy = height * rng.uniform(0.4, 0.6)
+    rx = width * rng.uniform(0.25, 0.35)
+    ry = height * rng.uniform(0.15, 0.3)
+    green = tuple(int(v) for v in rng.integers([30, 100, 20], [80, 180, 70])) + (255,)
+    draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=green)
+    vein = (200, 220, 150, 255)
+    line_width = max(2, width // 400)
+    draw.line([cx - rx, cy, cx + rx, cy], fill=vein, width=line_width)
+    for t in np.linspace(-0.8, 0.6, 8):
+        # Nervaduras laterales contenidas dentro del contorno de la elipse
+        vx = cx + t * rx
+        reach = 0.75 * np.sqrt(max(0.0, 1 - (t + 0.15) ** 2))
+        draw.line([vx, cy, vx + rx * 0.15, cy - ry * reach], fill=vein, width=line_width // 2 + 1)
+        draw.line([vx, cy, vx + rx * 0.15, cy + ry * reach], fill=vein, width=line_width // 2 + 1)
+    # Manchas de enfermedad en la mitad de las semillas
+    if seed % 2:
+        for _ in range(int(rng.integers(5, 20))):
+            sx = cx + rng.uniform(-0.7, 0.7) * rx
+            sy = cy + rng.uniform(-0.6, 0.6) * ry
+            sr = width * rng.uniform(0.005, 0.02)
+            draw.ellipse([sx - sr, sy - sr, sx + sr, sy + sr], fill=(120, 90, 30, 255))
+
+    leaf = leaf.rotate(float(rng.uniform(-40, 40)), resample=Image.BILINEAR, center=(cx, cy))
+    leaf = leaf.filter(ImageFilter.GaussianBlur(radius=1))
+    image.paste(leaf, (0, 0), leaf)
+    return image
+
+
+def leaf_jpeg(seed, size=(4032, 3024), quality=90):
+    """Retorna los bytes JPEG de leaf_image(seed, size)"""
+    buffer = io.BytesIO()
+    leaf_image(seed, size).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()